@@ -1,15 +1,49 @@
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl, field_validator
-from typing import List, Optional, Any
+from typing import List, Literal, Optional, Any
 import os, json
 
 class Settings(BaseSettings):
     mongodb_uri: str = "mongodb://localhost:27017"
     mongo_db: str = "florisys"
     files_dir: str = "./data/plots"
+    cache_dir: str = "./data/cache"       # derived artifacts (tiles, thumbnails, ...)
+    storage_backend: Literal["local", "s3"] = "local"  # where uploaded files live
+    s3_bucket: str = ""
+    s3_prefix: str = ""                   # key prefix inside the bucket
+    s3_endpoint_url: Optional[str] = None # MinIO, moto server, ...; None = AWS
+    s3_region: Optional[str] = None
+    s3_addressing_style: str = "auto"     # "path" for most local stand-ins
+    s3_url_ttl_s: int = 3600              # lifetime of presigned upload/download URLs
     cors_origins: List[AnyHttpUrl] = []
     max_upload_mb: int = 512
     backend_public_url: Optional[AnyHttpUrl] = None
+    tile_cache_entries: int = 1024        # in-process LRU of encoded tiles
+    plot_file_ttl_s: float = 30.0         # re-read a plot's file name after this long (other workers' deletes)
+    bed_index_ttl_s: float = 60.0         # reload a plot's point-in-bed index after this long
+    scan_diff_cache_entries: int = 64     # in-process LRU of spatial-map diffs (stored file pairs)
+    ply_normalize: bool = True            # write compact binary .min.ply (+ .gz/.br) copies of spatial maps
+    ply_quant_bits: int = 18              # position grid = cloud extent / 2**bits
+    upload_chunk_mb: int = 8              # default chunk size of resumable uploads
+    upload_session_ttl_s: float = 86400.0 # idle resumable uploads are deleted after this long
+    gc_grace_s: float = 60.0              # released files are deleted this long after their last reference goes
+    gc_batch: int = 200                   # files deleted per collector pass
+    gc_interval_s: float = 5.0            # collector poll period when idle
+    gc_sweep_interval_s: float = 86400.0  # orphan sweep period; 0 = off (app.scripts.sweep_files runs it by hand)
+    gc_orphan_age_s: float = 3600.0       # unreferenced files younger than this are left alone by the sweep
+    events_source: Literal["service", "change_stream"] = "service"  # what feeds /events; change_stream needs a replica set
+    events_queue: int = 256               # undelivered events per /events client before it is dropped
+    events_buffer: int = 1024             # recent events kept for Last-Event-ID resumes
+    profile_slow_ms: float = 0.0          # dump a sampled flame graph of requests slower than this; 0 = off
+    profile_interval_ms: float = 10.0     # sampling period while profiling
+    processing_workers: int = 0           # post-upload process pool size; 0 = one per CPU
+    rover_workers: int = 2                # concurrent rover collection jobs per process
+    rover_queue_size: int = 16            # queued jobs beyond this get a 429
+    rover_job_stale_s: float = 600.0      # running jobs without progress this long are failed
+    rover_owner_beat_s: float = 10.0      # processes vouch for their jobs this often; 3 missed beats = abandoned
+    rover_job_retention_days: int = 30
+    rover_fake_points: int = 200_000      # FakeRoverProducer scan size
+    rover_fake_scan_s: float = 2.0        # FakeRoverProducer simulated drive time
 
     @field_validator("cors_origins", mode="before")
     @classmethod
@@ -44,3 +78,4 @@ class Settings(BaseSettings):
 
 settings = Settings()
 os.makedirs(settings.files_dir, exist_ok=True)
+os.makedirs(settings.cache_dir, exist_ok=True)
@@ -1,12 +1,13 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+from app.utils.metrics import MongoCommandMetrics
 
 _client: AsyncIOMotorClient | None = None
 
 def get_client() -> AsyncIOMotorClient:
     global _client
     if _client is None:
-        _client = AsyncIOMotorClient(settings.mongodb_uri)
+        _client = AsyncIOMotorClient(settings.mongodb_uri, event_listeners=[MongoCommandMetrics()])
     return _client
 
 def get_db():
@@ -1,7 +1,9 @@
 # app/main.py
-from fastapi import FastAPI, Request
+import asyncio
+import time
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from starlette.responses import Response
 
 from app.core.config import settings
@@ -9,7 +11,13 @@ from app.routers.plots import router as plots_router
 from app.routers.beds import router as beds_router
 from app.routers.spatial_maps import router as spatial_maps_router  # ✅ add
 from app.routers.rover import router as rover_router                # ✅ add
+from app.routers.files import router as files_router
+from app.routers.uploads import router as uploads_router
+from app.routers.events import router as events_router
 from app.services.plots import init_indexes
+from app.services import events, file_gc, processing, rover, uploads
+from app.db.mongo import get_db
+from app.utils import metrics, profiler
 
 app = FastAPI(title="Florisys Backend")
 
@@ -27,32 +35,49 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
-
-# Add explicit headers for static file responses (WebGL-friendly)
-@app.middleware("http")
-async def add_file_headers(request: Request, call_next):
-    response: Response = await call_next(request)
-    if request.url.path.startswith("/files/"):
-        origin = request.headers.get("Origin")
-        response.headers.setdefault("Access-Control-Allow-Origin", origin or origins[0])
-        response.headers.setdefault("Cross-Origin-Resource-Policy", "cross-origin")
-        response.headers.setdefault("Accept-Ranges", "bytes")
-        response.headers.setdefault("Cache-Control", "no-store")
-    return response
-
-# Serve GeoTIFFs and PLYs from the same folder
-app.mount("/files", StaticFiles(directory=settings.files_dir), name="files")
+# added last, so outermost: latency includes CORS. Keep every middleware pure
+# ASGI (no @app.middleware / BaseHTTPMiddleware): those only pass
+# http.response.body through, which breaks FileRegionResponse's zero-copy sends.
+app.add_middleware(metrics.MetricsMiddleware, router=app.router)
 
 @app.on_event("startup")
 async def on_startup():
     await init_indexes()
+    await rover.start_workers()
+    uploads.start_gc()
+    file_gc.start()
+    events.start()
+    profiler.start()
+    await processing.resume_pending()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await rover.stop_workers()
+    await uploads.stop_gc()
+    await file_gc.stop()
+    await events.stop()
+    processing.shutdown()
+    profiler.stop()
 
 @app.get("/health")
 async def health():
-    return {"ok": True}
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_db().command("ping"), timeout=2.0)
+    except Exception as e:
+        return JSONResponse({"ok": False, "mongo": {"ok": False, "error": str(e) or type(e).__name__}}, status_code=503)
+    return {"ok": True, "mongo": {"ok": True, "latencyMs": round((time.perf_counter() - start) * 1000, 2)}}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 # API routers
 app.include_router(plots_router)
 app.include_router(beds_router)
 app.include_router(spatial_maps_router)  # ✅ add
 app.include_router(rover_router)         # ✅ add
+app.include_router(uploads_router)       # resumable chunked uploads
+app.include_router(events_router)        # SSE change feed
+app.include_router(files_router)         # GeoTIFFs and PLYs from settings.files_dir
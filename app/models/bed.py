@@ -1,6 +1,6 @@
 # app/models/bed.py
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from app.models.spatial_map import SpatialMapInDB  # ✅ add
 
@@ -13,7 +13,17 @@ class BedInDB(BedBase):
     id: str
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    bbox: Optional[List[float]] = None  # [minLon, minLat, maxLon, maxLat] of the outer ring
+    # plant stats of the newest analysed spatial map (see services/plant_stats.py)
+    count: Optional[int] = None
+    averageVolume: Optional[float] = None  # m³ per plant
+    statsMapId: Optional[str] = None
     spatialMaps: List[SpatialMapInDB] = Field(default_factory=list)  # ✅ add
 
 class BedOut(BedInDB):
     pass
+
+class BedImagesResult(BaseModel):
+    rendered: int                # crops now cached
+    empty: int                   # beds off the plot raster
+    failed: Dict[str, str] = Field(default_factory=dict)  # bed id -> error
@@ -0,0 +1,37 @@
+# app/models/plant_stats.py
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+class Histogram(BaseModel):
+    edges: List[float]
+    counts: List[int]
+
+class Distribution(BaseModel):
+    min: float
+    p10: float
+    median: float
+    mean: float
+    p90: float
+    max: float
+    histogram: Histogram
+
+class Plant(BaseModel):
+    x: float        # centroid, metres east of the bed's SW corner
+    y: float        # centroid, metres north of the bed's SW corner
+    height: float   # m above ground
+    area: float     # m², canopy footprint
+    volume: float   # m³, canopy height integrated over the footprint
+
+class PlantStatsSummary(BaseModel):
+    count: int
+    totalVolume: float
+    averageVolume: Optional[float] = None
+    height: Optional[Distribution] = None
+    volume: Optional[Distribution] = None
+
+class PlantStats(PlantStatsSummary):
+    frame: Literal["lonlat", "local"]   # how the PLY coordinates were interpreted
+    cellSize: float
+    totalPoints: int
+    bedPoints: int                      # points inside the bed polygon
+    plants: List[Plant]
@@ -1,15 +1,33 @@
 from pydantic import BaseModel, Field, HttpUrl
 from datetime import datetime
 from typing import Optional
+from app.models.processing import ProcessingStatus, RasterMetadata
 
 class PlotInDB(BaseModel):
     id: str = Field(..., description="Public ID")
     name: str
     filename: str
+    bytes: Optional[int] = None
+    sha256: Optional[str] = None
     createdAt: datetime
+    status: Optional[ProcessingStatus] = "pending"
+    metadata: Optional[RasterMetadata] = None
+    error: Optional[str] = None
 
 class PlotOut(BaseModel):
     id: str
     name: str
     url: HttpUrl
+    thumbnailUrl: Optional[HttpUrl] = None
     createdAt: Optional[datetime] = None
+    status: Optional[ProcessingStatus] = None
+    metadata: Optional[RasterMetadata] = None
+
+class PlotSummary(BaseModel):
+    id: str                                  # plot id
+    name: str
+    createdAt: datetime
+    beds: int = 0
+    spatialMaps: int = 0
+    bytes: int = 0                           # plot raster + spatial maps, as uploaded
+    latestScan: Optional[datetime] = None    # newest spatial-map date
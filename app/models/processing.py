@@ -0,0 +1,25 @@
+# app/models/processing.py
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+# Set on upload, resolved by the post-upload processing stage; older
+# documents have no status at all.
+ProcessingStatus = Literal["pending", "ready", "failed"]
+
+class RasterMetadata(BaseModel):
+    crs: Optional[str] = None
+    width: int
+    height: int
+    bands: int
+    dtype: str
+    resolution: List[float]                    # pixel size in CRS units (x, y)
+    bounds: List[float]                        # [left, bottom, right, top] in `crs`
+    boundsWgs84: Optional[List[float]] = None  # [minLon, minLat, maxLon, maxLat]
+
+class PointCloudMetadata(BaseModel):
+    format: str                 # ascii / binary_little_endian / binary_big_endian
+    vertexCount: int
+    bboxMin: Optional[List[float]] = None
+    bboxMax: Optional[List[float]] = None
+    density: Optional[float] = None   # points per square unit of the XY bbox
+    hasColor: bool = False
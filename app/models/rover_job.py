@@ -0,0 +1,33 @@
+# app/models/rover_job.py
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Literal, Optional
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+class RoverJobInDB(BaseModel):
+    id: str
+    plot_id: str
+    bed_id: str
+    status: JobStatus = "queued"
+    progress: float = 0.0                  # 0..1
+    message: Optional[str] = None
+    spatialMapId: Optional[str] = None     # set once the scan is attached to the bed
+    error: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    heartbeatAt: datetime = Field(default_factory=datetime.utcnow)
+
+class RoverJobOut(BaseModel):
+    id: str
+    plot_id: str
+    bed_id: str
+    status: JobStatus
+    progress: float
+    message: Optional[str] = None
+    spatialMapId: Optional[str] = None
+    error: Optional[str] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
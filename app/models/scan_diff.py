@@ -0,0 +1,37 @@
+# app/models/scan_diff.py
+from pydantic import BaseModel
+from typing import List
+
+class ChangedVoxels(BaseModel):
+    added: List[List[float]]      # voxel centres (PLY units) occupied only in the other scan
+    removed: List[List[float]]    # voxel centres occupied only in the base scan
+    truncated: bool               # lists were evenly subsampled to MAX_CHANGED_VOXELS
+
+class Heatmap(BaseModel):
+    """Top-of-canopy height change per XY column, row-major from the origin corner.
+
+    `data` is base64 of width*height int8 values; multiply by `scale` for metres.
+    """
+    width: int
+    height: int
+    cellSize: float
+    origin: List[float]           # [x, y] of the first column's corner
+    scale: float
+    data: str
+
+class ScanDiff(BaseModel):
+    baseId: str
+    otherId: str
+    voxelSize: float
+    origin: List[float]           # [x, y, z] corner of voxel (0, 0, 0)
+    shape: List[int]              # [nx, ny, nz]
+    baseVoxels: int
+    otherVoxels: int
+    added: int
+    removed: int
+    unchanged: int
+    growthVolume: float           # added voxels * voxelSize³
+    lossVolume: float
+    netVolume: float
+    changed: ChangedVoxels
+    heatmap: Heatmap
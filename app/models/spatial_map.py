@@ -1,21 +1,38 @@
 # app/models/spatial_map.py
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Dict, Optional
+from app.models.plant_stats import PlantStatsSummary
+from app.models.processing import PointCloudMetadata, ProcessingStatus
 
 class SpatialMapInDB(BaseModel):
     id: str
     filename: str            # stored in settings.files_dir (e.g. "<uuid>.ply")
     fileName: str            # original file name for display
-    bytes: int
+    bytes: int               # as uploaded
+    sha256: Optional[str] = None
+    optimizedFilename: Optional[str] = None   # compact binary copy next to `filename`
+    optimizedBytes: Optional[int] = None
+    compressedBytes: Optional[Dict[str, int]] = None  # Content-Encoding -> size of the served file's sibling
     contentType: str
     date: datetime           # measurement/upload date (ISO)
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    status: Optional[ProcessingStatus] = "pending"
+    metadata: Optional[PointCloudMetadata] = None
+    error: Optional[str] = None
+    stats: Optional[PlantStatsSummary] = None
 
 class SpatialMapOut(BaseModel):
     id: str
     fileName: str
-    url: str
+    url: str                 # smallest representation: the compact copy when there is one
+    originalUrl: str
     bytes: int
+    optimizedBytes: Optional[int] = None
+    compressedBytes: Optional[Dict[str, int]] = None
     contentType: str
     date: datetime
     createdAt: datetime
+    status: Optional[ProcessingStatus] = None
+    metadata: Optional[PointCloudMetadata] = None
+    stats: Optional[PlantStatsSummary] = None
@@ -0,0 +1,62 @@
+# app/models/upload.py
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
+from app.models.plot import PlotOut
+from app.models.spatial_map import SpatialMapOut
+
+UploadKind = Literal["plot", "spatial_map"]
+UploadStatus = Literal["open", "finalizing", "completed"]
+
+class UploadCreate(BaseModel):
+    kind: UploadKind
+    fileName: str
+    size: int = Field(..., gt=0)                 # total bytes
+    chunkSize: Optional[int] = None              # defaults to settings.upload_chunk_mb
+    plotId: Optional[str] = None                 # required for spatial maps
+    bedId: Optional[str] = None
+    date: Optional[str] = None                   # spatial-map measurement date (ISO)
+    contentType: Optional[str] = None
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-f]{64}$")  # hex; with S3 storage, upload straight to the bucket
+
+class UploadSessionInDB(BaseModel):
+    id: str
+    kind: UploadKind
+    fileName: str
+    size: int
+    chunkSize: int
+    chunks: int
+    received: List[int] = Field(default_factory=list)  # chunk indexes written so far
+    plotId: Optional[str] = None
+    bedId: Optional[str] = None
+    date: Optional[str] = None
+    contentType: Optional[str] = None
+    direct: bool = False                         # client PUTs to storage; no chunks through the API
+    sha256: Optional[str] = None
+    objectName: Optional[str] = None             # direct: stored name the client uploads to
+    stored: bool = False                         # direct: identical bytes were already stored
+    status: UploadStatus = "open"
+    resultId: Optional[str] = None               # the plot / spatial map created on finalize
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    expiresAt: datetime
+
+class UploadSessionOut(BaseModel):
+    id: str
+    kind: UploadKind
+    fileName: str
+    size: int
+    chunkSize: int
+    chunks: int
+    received: List[int]
+    offset: int                                  # bytes received contiguously from the start
+    direct: bool = False
+    uploadUrl: Optional[str] = None              # direct: PUT the whole file here, then finalize
+    uploadHeaders: Optional[Dict[str, str]] = None  # ...sending these headers
+    status: UploadStatus
+    resultId: Optional[str] = None
+    expiresAt: datetime
+
+class UploadResult(BaseModel):
+    kind: UploadKind
+    plot: Optional[PlotOut] = None
+    spatialMap: Optional[SpatialMapOut] = None
@@ -1,10 +1,15 @@
 # app/routers/beds.py
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from app.models.bed import BedOut
-from app.services.beds import list_beds, create_bed, update_bed, delete_bed
+from app.models.bed import BedImagesResult, BedOut
+from app.services.beds import BED_FIELDS, list_beds, create_bed, update_bed, delete_bed
+from app.services.beds import beds_at, beds_within, locate_points
+from app.utils.pagination import MAX_LIMIT, Order, page_headers, parse_fields
 from app.services.beds import get_bed_by_id  # ✅ add
+from app.services.bed_images import DEFAULT_SIDE, MAX_SIDE, bed_image, prerender
+from app.services.tiles import MEDIA_TYPES, TileFormat
+from app.utils.responses import JSONArrayResponse, shaper
 
 router = APIRouter(prefix="/plots/{plot_id}/beds", tags=["beds"])
 
@@ -16,15 +21,84 @@ class BedUpdate(BaseModel):
   name: Optional[str] = None
   coordinates: Optional[list[list[list[float]]]] = None
 
+MAX_LOCATE_POINTS = 100_000
+
+class LocateRequest(BaseModel):
+  points: list[list[float]] = Field(..., max_length=MAX_LOCATE_POINTS, description="[[lon, lat], ...]")
+
+class LocateResponse(BaseModel):
+  beds: List[Optional[str]]  # containing bed id per point, null if none
+
 @router.get("", response_model=List[BedOut])
-async def get_beds(plot_id: str):
-  return await list_beds(plot_id)
+async def get_beds(
+  plot_id: str,
+  request: Request,
+  limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+  cursor: Optional[str] = None,
+  fields: Optional[str] = Query(None, description="Comma-separated subset of BedOut fields, e.g. id,name,coordinates"),
+  order: Order = "asc",
+):
+  wanted = parse_fields(fields, BED_FIELDS)
+  page = await list_beds(plot_id, limit, cursor, wanted, order)
+  # partial objects are already trimmed to the requested fields
+  return JSONArrayResponse(page.items, shaper(BedOut) if wanted is None else None, headers=page_headers(request, page))
+
+# spatial lookups; declared before /{bed_id} so "at"/"within" are not taken as ids
+@router.get("/at", response_model=List[BedOut])
+async def get_beds_at(plot_id: str, lon: float = Query(..., ge=-180, le=180), lat: float = Query(..., ge=-90, le=90)):
+  return JSONArrayResponse(await beds_at(plot_id, lon, lat), shaper(BedOut))
+
+@router.get("/within", response_model=List[BedOut])
+async def get_beds_within(
+  plot_id: str,
+  bbox: str = Query(..., description="minLon,minLat,maxLon,maxLat"),
+  limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+):
+  try:
+    box = [float(v) for v in bbox.split(",")]
+  except ValueError:
+    box = []
+  if len(box) != 4:
+    raise HTTPException(status_code=422, detail="bbox must be minLon,minLat,maxLon,maxLat")
+  return JSONArrayResponse(await beds_within(plot_id, box, limit), shaper(BedOut))
+
+@router.post("/locate", response_model=LocateResponse)
+async def post_locate(plot_id: str, body: LocateRequest):
+  if any(len(p) != 2 for p in body.points):
+    raise HTTPException(status_code=422, detail="points must be [lon, lat] pairs")
+  return {"beds": await locate_points(plot_id, body.points)}
+
+@router.post("/images", response_model=BedImagesResult)
+async def post_bed_images(
+  plot_id: str,
+  fmt: TileFormat = Query("png", alias="format"),
+  max_size: int = Query(DEFAULT_SIDE, alias="maxSize", ge=16, le=MAX_SIDE),
+):
+  """Pre-render the image crop of every bed of the plot."""
+  return await prerender(plot_id, fmt, max_size)
 
 # ✅ NEW: get a single bed
 @router.get("/{bed_id}", response_model=BedOut)
 async def get_bed(plot_id: str, bed_id: str):
   return await get_bed_by_id(plot_id, bed_id)
 
+@router.get("/{bed_id}/image", response_class=Response)
+async def get_bed_image(
+  plot_id: str,
+  bed_id: str,
+  request: Request,
+  fmt: TileFormat = Query("png", alias="format"),
+  max_size: int = Query(DEFAULT_SIDE, alias="maxSize", ge=16, le=MAX_SIDE),
+):
+  data, etag = await bed_image(plot_id, bed_id, fmt, max_size)
+  # revalidate: the crop changes whenever the bed does
+  headers = {"ETag": etag, "Cache-Control": "no-cache"}
+  if request.headers.get("if-none-match") == etag:
+    return Response(status_code=304, headers=headers)
+  if data is None:
+    return Response(status_code=204, headers=headers)
+  return Response(data, media_type=MEDIA_TYPES[fmt], headers=headers)
+
 @router.post("", response_model=BedOut, status_code=201)
 async def post_bed(plot_id: str, body: BedCreate):
   return await create_bed(plot_id, body.name, body.coordinates)
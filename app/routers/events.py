@@ -0,0 +1,26 @@
+# app/routers/events.py
+# Server-Sent Events change feed (see services/events.py).
+#
+#   GET /events                     every plot
+#   GET /events?plot=a&plot=b       only these plots
+#
+# EventSource reconnects on its own and sends Last-Event-ID, so missed
+# events are replayed; on `reset` the client should refetch what it shows.
+from typing import List, Optional
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from app.services import events
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+@router.get("", response_class=StreamingResponse)
+async def get_events(
+    plot: List[str] = Query([], description="Plot ids to follow; all plots if omitted"),
+    last_event_id: Optional[str] = Header(None),
+):
+    return StreamingResponse(
+        events.stream(plot, last_event_id),
+        media_type="text/event-stream",
+        # no proxy buffering, or events arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,168 @@
+# app/routers/files.py
+# Serves stored GeoTIFFs and PLYs. Stored names never change content (they
+# are content hashes, or UUIDs for older uploads), so responses carry strong
+# ETags and are cacheable forever; viewers get 304s and byte ranges instead of
+# re-downloading whole files. With S3 storage these URLs redirect to a
+# presigned bucket URL instead.
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+from uuid import uuid4
+from fastapi import APIRouter, HTTPException, Request
+from starlette.responses import RedirectResponse, Response
+from app.core.config import settings
+from app.services.storage import get_storage
+from app.utils.files import stored_path
+from app.utils.responses import FileRegionResponse
+
+router = APIRouter(prefix="/files", tags=["files"])
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MAX_RANGES = 16
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+_HASH_STEM = re.compile(r"^[0-9a-f]{64}(\.min)?$")  # upload, or its compact copy
+_DEFAULT_ORIGIN = str(settings.cors_origins[0]) if settings.cors_origins else "http://localhost:3000"
+
+def _check_name(filename: str) -> None:
+    if not filename or "/" in filename or "\\" in filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Not found")
+
+def _resolve(filename: str) -> Path:
+    _check_name(filename)
+    path = stored_path(filename)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    return path
+
+def _etag(filename: str, st: os.stat_result, encoding: Optional[str]) -> str:
+    stem = filename.rsplit(".", 1)[0]
+    tag = stem if _HASH_STEM.match(stem) else f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+def _matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+def _accepted_encodings(request: Request) -> List[str]:
+    accepted = []
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.append(name.strip().lower())
+    return accepted
+
+def _parse_ranges(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """(start, end-inclusive) pairs; None to ignore the header, [] if unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_s, sep, end_s = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                suffix = int(end_s)
+                start, end = max(0, size - suffix), size - 1
+            else:
+                start = int(start_s)
+                end = int(end_s) if end_s else size - 1
+                if end_s and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start <= end and start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _serve(request: Request, filename: str, send_body: bool) -> Response:
+    if get_storage().direct:
+        _check_name(filename)
+        # the presigned URL expires, so the redirect itself must not be cached
+        return RedirectResponse(get_storage().download_url(filename), status_code=307, headers={"Cache-Control": "no-store"})
+    path = _resolve(filename)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    has_range = "range" in request.headers
+
+    encoding = None
+    if not has_range:
+        accepted = _accepted_encodings(request)
+        for name, suffix in _ENCODINGS:
+            sibling = stored_path(filename + suffix)
+            if name in accepted and sibling.is_file():
+                path, encoding = sibling, name
+                break
+
+    st = path.stat()
+    etag = _etag(filename, st, encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    inm = request.headers.get("if-none-match")
+    if inm is not None and _matches(inm, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = st.st_size
+    ranges = None
+    if has_range:
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            ranges = _parse_ranges(request.headers["range"], size)
+    if ranges is None:
+        return FileRegionResponse(str(path), [(0, size)], headers=headers, media_type=media_type, send_body=send_body)
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileRegionResponse(str(path), [(start, end - start + 1)], status_code=206, headers=headers,
+                                  media_type=media_type, send_body=send_body)
+
+    boundary = uuid4().hex
+    parts = [
+        (f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    # every part after the first starts on a fresh line
+    parts = [parts[0]] + [b"\r\n" + p for p in parts[1:]]
+    return FileRegionResponse(
+        str(path), [(start, end - start + 1) for start, end in ranges], status_code=206, headers=headers,
+        media_type=f"multipart/byteranges; boundary={boundary}", part_headers=parts,
+        closing=f"\r\n--{boundary}--\r\n".encode(), send_body=send_body,
+    )
+
+def _with_file_headers(request: Request, response: Response) -> Response:
+    # explicit headers for WebGL viewers loading textures and clouds cross-origin
+    response.headers.setdefault("Access-Control-Allow-Origin", request.headers.get("origin") or _DEFAULT_ORIGIN)
+    response.headers.setdefault("Cross-Origin-Resource-Policy", "cross-origin")
+    return response
+
+@router.get("/{filename}", response_class=Response)
+async def get_file(request: Request, filename: str):
+    return _with_file_headers(request, _serve(request, filename, send_body=True))
+
+@router.head("/{filename}", response_class=Response)
+async def head_file(request: Request, filename: str):
+    return _with_file_headers(request, _serve(request, filename, send_body=False))
@@ -1,20 +1,59 @@
 # app/routers/plots.py
-from fastapi import APIRouter, File, UploadFile, Request, Response, status
-from typing import List
-from app.models.plot import PlotOut
-from app.services.plots import list_plots, create_plot, delete_plot
+from fastapi import APIRouter, BackgroundTasks, File, Query, UploadFile, Request, Response, status
+from typing import List, Optional
+from app.models.plot import PlotOut, PlotSummary
+from app.services.plots import PLOT_FIELDS, list_plots, create_plot, delete_plot
+from app.utils.pagination import MAX_LIMIT, Order, page_headers, parse_fields
+from app.services.tiles import MEDIA_TYPES, TileFormat, get_tile, get_thumbnail
+from app.services.plot_summaries import list_summaries
+from app.utils.responses import JSONArrayResponse, shaper
 
 router = APIRouter(prefix="/plots", tags=["plots"])
 
+# Tiles of a plot never change (a plot's raster is immutable); let browsers keep them.
+_TILE_HEADERS = {"Cache-Control": "public, max-age=86400"}
+
 @router.get("", response_model=List[PlotOut])
-async def get_plots(request: Request):
-    return await list_plots(request)
+async def get_plots(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of PlotOut fields"),
+    order: Order = "desc",
+):
+    wanted = parse_fields(fields, PLOT_FIELDS)
+    page = await list_plots(request, limit, cursor, wanted, order)
+    # partial objects are already trimmed to the requested fields
+    return JSONArrayResponse(page.items, shaper(PlotOut) if wanted is None else None, headers=page_headers(request, page))
+
+@router.get("/summary", response_model=List[PlotSummary])
+async def get_plot_summaries(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    order: Order = "desc",
+):
+    """Bed/spatial-map counts, stored bytes and latest scan per plot."""
+    page = await list_summaries(limit, cursor, order)
+    return JSONArrayResponse(page.items, shaper(PlotSummary), headers=page_headers(request, page))
 
 @router.post("", response_model=PlotOut, status_code=status.HTTP_201_CREATED)
-async def post_plot(request: Request, file: UploadFile = File(...)):
-    return await create_plot(file, request)
+async def post_plot(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    return await create_plot(file, request, background_tasks)
 
 @router.delete("/{plot_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def del_plot(plot_id: str):
     await delete_plot(plot_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/{plot_id}/tiles/{z}/{x}/{y}.{fmt}", response_class=Response)
+async def get_plot_tile(plot_id: str, z: int, x: int, y: int, fmt: TileFormat):
+    data = await get_tile(plot_id, z, x, y, fmt)
+    if data is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_TILE_HEADERS)
+    return Response(data, media_type=MEDIA_TYPES[fmt], headers=_TILE_HEADERS)
+
+@router.get("/{plot_id}/thumbnail.{fmt}", response_class=Response)
+async def get_plot_thumbnail(plot_id: str, fmt: TileFormat):
+    data = await get_thumbnail(plot_id, fmt)
+    return Response(data, media_type=MEDIA_TYPES[fmt], headers=_TILE_HEADERS)
@@ -1,9 +1,20 @@
 # app/routers/rover.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from app.models.rover_job import RoverJobOut
+from app.services.rover import get_job, submit_job
 
 router = APIRouter(prefix="/plots/{plot_id}/beds/{bed_id}", tags=["rover"])
 
-@router.post("/collect-rover-data")
-async def collect_rover_data(plot_id: str, bed_id: str):
-    # TODO: integrate with your rover pipeline/controller
-    return {"ok": True, "message": f"Rover data collection queued for plot={plot_id}, bed={bed_id}"}
+@router.post("/collect-rover-data", response_model=RoverJobOut, status_code=202,
+             responses={200: {"model": RoverJobOut, "description": "A job for this bed is already active"},
+                        429: {"description": "Job queue is full"}})
+async def collect_rover_data(plot_id: str, bed_id: str, response: Response):
+    job, created = await submit_job(plot_id, bed_id)
+    if not created:
+        response.status_code = 200
+    response.headers["Location"] = f"/plots/{plot_id}/beds/{bed_id}/rover-jobs/{job['id']}"
+    return job
+
+@router.get("/rover-jobs/{job_id}", response_model=RoverJobOut)
+async def get_rover_job(plot_id: str, bed_id: str, job_id: str):
+    return await get_job(plot_id, bed_id, job_id)
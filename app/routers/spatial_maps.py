@@ -1,42 +1,100 @@
 # app/routers/spatial_maps.py
-from fastapi import APIRouter, UploadFile, File, Form, Request
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, Request, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from typing import List, Optional
-from app.services.spatial_maps import add_spatial_map, list_spatial_maps, delete_spatial_map
+from app.services.spatial_maps import MAP_FIELDS, add_spatial_map, list_spatial_maps, delete_spatial_map, get_spatial_map
+from app.utils.pagination import MAX_LIMIT, Order, page_headers, parse_fields
 from app.services.plots import file_url  # reuse your URL builder
+from app.services import lod, plant_stats, processing, scan_diff
+from app.models.plant_stats import PlantStats
+from app.models.scan_diff import ScanDiff
 from app.models.spatial_map import SpatialMapOut
+from app.utils.responses import JSONArrayResponse, shaper
 
 router = APIRouter(prefix="/plots/{plot_id}/beds/{bed_id}/spatial-maps", tags=["spatial-maps"])
 
+def map_out(request: Request, m: dict) -> dict:
+    """SpatialMapOut fields of a stored spatial map; validated by the route's
+    response_model, or shaped by a JSONArrayResponse for lists."""
+    return {
+        **m,
+        "url": file_url(request, m.get("optimizedFilename") or m["filename"]),
+        "originalUrl": file_url(request, m["filename"]),
+    }
+
 @router.post("", response_model=SpatialMapOut)
-async def post_spatial_map(plot_id: str, bed_id: str, request: Request, file: UploadFile = File(...), date: Optional[str] = Form(None)):
+async def post_spatial_map(plot_id: str, bed_id: str, request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...), date: Optional[str] = Form(None)):
     item = await add_spatial_map(plot_id, bed_id, file, date)
-    return SpatialMapOut(
-        id=item["id"],
-        fileName=item["fileName"],
-        url=file_url(request, item["filename"]),
-        bytes=item["bytes"],
-        contentType=item["contentType"],
-        date=item["date"],
-        createdAt=item["createdAt"],
-    )
+    # vertex count/bbox/density + LOD layout, off the event loop
+    background_tasks.add_task(processing.process_map, item["id"], item["filename"])
+    return map_out(request, item)
 
 @router.get("", response_model=List[SpatialMapOut])
-async def get_spatial_maps(plot_id: str, bed_id: str, request: Request):
-    maps = await list_spatial_maps(plot_id, bed_id)
-    return [
-        SpatialMapOut(
-            id=m["id"],
-            fileName=m["fileName"],
-            url=file_url(request, m["filename"]),
-            bytes=m["bytes"],
-            contentType=m["contentType"],
-            date=m["date"],
-            createdAt=m["createdAt"],
-        )
-        for m in maps
-    ]
+async def get_spatial_maps(
+    plot_id: str,
+    bed_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of SpatialMapOut fields"),
+    order: Order = "desc",
+):
+    wanted = parse_fields(fields, MAP_FIELDS)
+    page = await list_spatial_maps(plot_id, bed_id, limit, cursor, wanted, order)
+    if wanted is not None:
+        items = []
+        for m in page.items:
+            filename, optimized = m.pop("filename", None), m.pop("optimizedFilename", None)
+            if "url" in wanted:
+                m["url"] = file_url(request, optimized or filename)
+            if "originalUrl" in wanted:
+                m["originalUrl"] = file_url(request, filename)
+            items.append({k: v for k, v in m.items() if k in wanted})
+        return JSONArrayResponse(items, headers=page_headers(request, page))
+    return JSONArrayResponse([map_out(request, m) for m in page.items], shaper(SpatialMapOut), headers=page_headers(request, page))
 
 @router.delete("/{map_id}", status_code=204)
 async def del_spatial_map(plot_id: str, bed_id: str, map_id: str):
     await delete_spatial_map(plot_id, bed_id, map_id)
     return {}
+
+# Level-of-detail point streaming: fetch /lod once, render the /lod/stream
+# frames as they arrive (coarse first), then refine with /lod/nodes/{id}.
+@router.get("/{map_id}/lod")
+async def get_spatial_map_lod(plot_id: str, bed_id: str, map_id: str):
+    item = await get_spatial_map(plot_id, bed_id, map_id)
+    # the processing pool builds it; don't start a second build meanwhile
+    meta = None if item.get("status") == "pending" else await lod.get_meta(item["filename"])
+    if meta is None:
+        return JSONResponse({"status": "building"}, status_code=202)
+    return meta
+
+@router.get("/{map_id}/lod/stream", response_class=StreamingResponse)
+async def stream_spatial_map_lod(plot_id: str, bed_id: str, map_id: str, max_level: Optional[int] = Query(None, ge=0)):
+    item = await get_spatial_map(plot_id, bed_id, map_id)
+    # the processing pool builds it; don't start a second build meanwhile
+    meta = None if item.get("status") == "pending" else await lod.get_meta(item["filename"])
+    if meta is None:
+        return JSONResponse({"status": "building"}, status_code=202)
+    frames = lod.iter_frames(item["filename"], meta, max_level)
+    return StreamingResponse(iterate_in_threadpool(frames), media_type="application/octet-stream")
+
+@router.get("/{map_id}/lod/nodes/{node_id}", response_class=Response)
+async def get_spatial_map_lod_node(plot_id: str, bed_id: str, map_id: str, node_id: str):
+    item = await get_spatial_map(plot_id, bed_id, map_id)
+    data = await lod.get_node(item["filename"], node_id)
+    # nodes are derived from an immutable blob
+    return Response(data, media_type="application/octet-stream", headers={"Cache-Control": "public, max-age=86400"})
+
+# Plant count, per-plant height/volume distributions and the plant list for
+# this scan clipped to the bed; computed once per (file, bed polygon).
+@router.get("/{map_id}/stats", response_model=PlantStats)
+async def get_spatial_map_stats(plot_id: str, bed_id: str, map_id: str):
+    return await plant_stats.map_stats(plot_id, bed_id, map_id)
+
+# Voxel change detection from map_id (base) to other_id, e.g. last week's scan
+# to today's: added/removed voxels, growth/loss volumes and a height heatmap.
+@router.get("/{map_id}/diff/{other_id}", response_model=ScanDiff)
+async def get_spatial_map_diff(plot_id: str, bed_id: str, map_id: str, other_id: str):
+    return await scan_diff.diff_maps(plot_id, bed_id, map_id, other_id)
@@ -0,0 +1,57 @@
+# app/routers/uploads.py
+# Resumable uploads, for files too large to send in one multipart request:
+#
+#   POST   /uploads                        {kind, fileName, size, ...} -> session
+#   PATCH  /uploads/{id}/chunks/{index}    raw chunk bytes, Upload-Checksum: sha256 <base64>
+#   HEAD   /uploads/{id}                   Upload-Offset / Upload-Length headers
+#   GET    /uploads/{id}                   session with the received chunk list
+#   POST   /uploads/{id}/finalize          -> the created plot or spatial map
+#   DELETE /uploads/{id}                   abort
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Header, Request, Response, status
+from app.models.upload import UploadCreate, UploadResult, UploadSessionOut
+from app.routers.spatial_maps import map_out
+from app.services import processing, uploads
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+def _offset_headers(session: dict) -> dict:
+    return {"Upload-Offset": str(session["offset"]), "Upload-Length": str(session["size"]), "Cache-Control": "no-store"}
+
+@router.post("", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED)
+async def create_upload(body: UploadCreate, response: Response):
+    session = await uploads.create_session(body)
+    response.headers["Location"] = f"/uploads/{session['id']}"
+    return session
+
+@router.get("/{upload_id}", response_model=UploadSessionOut)
+async def get_upload(upload_id: str, response: Response):
+    session = await uploads.get_session(upload_id)
+    response.headers.update(_offset_headers(session))
+    return session
+
+@router.head("/{upload_id}", response_class=Response)
+async def head_upload(upload_id: str):
+    session = await uploads.get_session(upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_offset_headers(session))
+
+@router.patch("/{upload_id}/chunks/{index}", response_model=UploadSessionOut)
+async def patch_upload_chunk(upload_id: str, index: int, request: Request, response: Response,
+                           upload_checksum: Optional[str] = Header(None)):
+    session = await uploads.write_chunk(upload_id, index, request.stream(), upload_checksum)
+    response.headers.update(_offset_headers(session))
+    return session
+
+@router.post("/{upload_id}/finalize", response_model=UploadResult, status_code=status.HTTP_201_CREATED)
+async def finalize_upload(upload_id: str, request: Request, background_tasks: BackgroundTasks):
+    kind, created = await uploads.finalize(upload_id, request, background_tasks)
+    if kind == "plot":
+        return {"kind": kind, "plot": created}
+    # same post-upload processing as POST .../spatial-maps
+    background_tasks.add_task(processing.process_map, created["id"], created["filename"])
+    return {"kind": kind, "spatialMap": map_out(request, created)}
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(upload_id: str):
+    await uploads.abort(upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,88 @@
+# app/scripts/migrate_beds.py
+"""Move beds and spatial maps embedded in `plots` documents into the `beds`
+and `spatial_maps` collections.
+
+    python -m app.scripts.migrate_beds [--dry-run]
+
+Safe to run while the API is serving and safe to re-run: rows are upserted
+with $setOnInsert, so anything already copied (or created through the new
+code path) is left alone. A plot's embedded `beds` array is only removed if
+it still holds exactly what was copied; if a writer still on the old code
+added a bed in the meantime, the plot is copied again.
+
+Afterwards every bed still missing the derived `geometry`/`bbox` fields used
+by the spatial queries gets them filled in.
+"""
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from app.db.mongo import get_db
+from app.services.beds import geo_fields
+from app.services.plots import init_indexes
+
+async def _copy_plot(db, plot: dict) -> tuple[int, int]:
+    bed_ops, map_ops = [], []
+    for bed in plot["beds"]:
+        bed = dict(bed)
+        maps = bed.pop("spatialMaps", []) or []
+        bed_ops.append(UpdateOne(
+            {"plot_id": plot["id"], "id": bed["id"]},
+            {"$setOnInsert": {**bed, "plot_id": plot["id"]}},
+            upsert=True,
+        ))
+        for m in maps:
+            map_ops.append(UpdateOne(
+                {"plot_id": plot["id"], "id": m["id"]},
+                {"$setOnInsert": {**m, "plot_id": plot["id"], "bed_id": bed["id"]}},
+                upsert=True,
+            ))
+    if bed_ops:
+        await db.beds.bulk_write(bed_ops, ordered=False)
+    if map_ops:
+        await db.spatial_maps.bulk_write(map_ops, ordered=False)
+    return len(bed_ops), len(map_ops)
+
+async def _backfill_geometry(db, dry_run: bool) -> tuple[int, int]:
+    done = failed = 0
+    async for bed in db.beds.find({"geometry": {"$exists": False}}, {"_id": 1, "id": 1, "coordinates": 1}):
+        if dry_run:
+            done += 1
+            continue
+        try:
+            await db.beds.update_one({"_id": bed["_id"]}, {"$set": geo_fields(bed["coordinates"])})
+            done += 1
+        except Exception as e:  # invalid rings are reported, not fatal
+            print(f"bed {bed.get('id')}: cannot index geometry: {e}")
+            failed += 1
+    return done, failed
+
+async def migrate(dry_run: bool = False) -> None:
+    db = get_db()
+    await init_indexes()
+    plots = beds = maps = 0
+    async for plot in db.plots.find({"beds": {"$exists": True}}, {"_id": 0, "id": 1, "beds": 1}):
+        while True:
+            if dry_run:
+                b, m = len(plot["beds"]), sum(len(x.get("spatialMaps") or []) for x in plot["beds"])
+                break
+            b, m = await _copy_plot(db, plot)
+            res = await db.plots.update_one(
+                {"id": plot["id"], "beds": plot["beds"]}, {"$unset": {"beds": ""}}
+            )
+            if res.modified_count:
+                break
+            plot = await db.plots.find_one({"id": plot["id"]}, {"_id": 0, "id": 1, "beds": 1})
+            if not plot or "beds" not in plot:
+                break
+        plots += 1
+        beds += b
+        maps += m
+    verb = "would migrate" if dry_run else "migrated"
+    print(f"{verb} {beds} beds and {maps} spatial maps from {plots} plots")
+    done, failed = await _backfill_geometry(db, dry_run)
+    print(f"{'would backfill' if dry_run else 'backfilled'} geometry on {done} beds" + (f", {failed} invalid" if failed else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split embedded beds/spatial maps into their own collections")
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(migrate(parser.parse_args().dry_run))
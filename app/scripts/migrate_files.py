@@ -0,0 +1,92 @@
+# app/scripts/migrate_files.py
+"""Move stored files from the top of files_dir into the sharded layout
+(files_dir/ab/cd/<name>).
+
+    python -m app.scripts.migrate_files [--batch 500] [--grace 5] [--dry-run]
+
+Safe to run while the API is serving and safe to interrupt and re-run: the
+server resolves every name in both layouts, new uploads already go to their
+shard, and each batch is moved in two steps. Files are first hard-linked into
+their shard, so both paths stay valid; only after --grace seconds, long
+enough for any request that resolved the old path to have opened it, are the
+old names unlinked. A run stopped in between leaves files present twice,
+which the next run cleans up.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import List
+from app.core.config import settings
+from app.utils.files import shard_dir
+
+def _flat_batch(root: Path, limit: int) -> List[str]:
+    names = []
+    with os.scandir(root) as it:
+        for entry in it:
+            # dot-names are temp files and the resumable-upload area
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            names.append(entry.name)
+            if len(names) >= limit:
+                break
+    return names
+
+def _link(root: Path, name: str) -> bool:
+    """Make the file reachable at its shard path; False if it cannot be moved."""
+    src, dst = root / name, shard_dir(name) / name
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # an earlier interrupted run, or a re-upload of the same content
+        if not os.path.samefile(src, dst) and src.stat().st_size != dst.stat().st_size:
+            print(f"{name}: differs from {dst.relative_to(root)}, left in place")
+            return False
+    except FileNotFoundError:  # deleted meanwhile
+        return False
+    except OSError:  # no hard links on this filesystem: plain rename
+        os.replace(src, dst)
+    return True
+
+def migrate(batch: int = 500, grace: float = 5.0, dry_run: bool = False) -> None:
+    root = Path(settings.files_dir)
+    if settings.storage_backend != "local":
+        print("STORAGE_BACKEND is not local; files_dir only holds upload staging")
+        return
+    if not root.is_dir():
+        print("nothing to migrate")
+        return
+    moved = skipped = 0
+    stuck: set = set()
+    started = time.monotonic()
+    while True:
+        names = [n for n in _flat_batch(root, batch + len(stuck)) if n not in stuck][:batch]
+        if not names:
+            break
+        if dry_run:
+            moved += len(names)
+            stuck.update(names)
+            continue
+        linked = []
+        for name in names:
+            if _link(root, name):
+                linked.append(name)
+            else:
+                stuck.add(name)
+        time.sleep(grace)
+        for name in linked:
+            (root / name).unlink(missing_ok=True)
+        moved += len(linked)
+        skipped += len(names) - len(linked)
+        print(f"moved {moved} files ({moved / (time.monotonic() - started):.0f}/s)" + (f", {skipped} left in place" if skipped else ""))
+    verb = "would move" if dry_run else "moved"
+    print(f"{verb} {moved} files into the sharded layout" + (f", {skipped} left in place" if skipped else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move stored files into the sharded files_dir layout")
+    parser.add_argument("--batch", type=int, default=500, help="files per step")
+    parser.add_argument("--grace", type=float, default=5.0, help="seconds between linking and removing the old names")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    migrate(args.batch, args.grace, args.dry_run)
@@ -0,0 +1,25 @@
+# app/scripts/rebuild_summaries.py
+"""Recompute `plot_summaries` (GET /plots/summary) from plots, beds and
+spatial maps.
+
+    python -m app.scripts.rebuild_summaries [--plot PLOT_ID]
+
+Summaries are kept up to date by the API itself; run this once after
+upgrading (plots created before summaries existed have none) and whenever
+the figures look off. Summaries of plots that no longer exist are removed.
+A write to a plot while it is being rebuilt may be overwritten; re-run for
+that plot if the API was busy.
+"""
+import argparse
+import asyncio
+from app.services.plot_summaries import init_summary_indexes, rebuild
+
+async def main(plot_id=None) -> None:
+    await init_summary_indexes()
+    written, removed = await rebuild(plot_id)
+    print(f"rebuilt {written} plot summaries" + (f", removed {removed} stale" if removed else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute per-plot summaries")
+    parser.add_argument("--plot", help="only this plot id")
+    asyncio.run(main(parser.parse_args().plot))
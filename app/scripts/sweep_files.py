@@ -0,0 +1,41 @@
+# app/scripts/sweep_files.py
+"""Delete stored files and derived artifacts that nothing refers to.
+
+    python -m app.scripts.sweep_files [--dry-run] [--min-age SECONDS] [--collect]
+
+The server runs the same sweep every GC_SWEEP_INTERVAL_S. Files and cache
+directories younger than --min-age (default GC_ORPHAN_AGE_S) are skipped, so
+uploads in flight are safe. --collect first deletes every file whose last
+reference was released more than GC_GRACE_S ago, instead of waiting for the
+server's collector.
+"""
+import argparse
+import asyncio
+from app.services.file_gc import collect, init_gc_indexes, sweep
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB"
+
+async def main(args) -> None:
+    await init_gc_indexes()
+    if args.collect and not args.dry_run:
+        files = freed = 0
+        while True:
+            taken, n, b = await collect()
+            files, freed = files + n, freed + b
+            if not taken:
+                break
+        print(f"collected {files} released files, {_mb(freed)}")
+    report = await sweep(dry_run=args.dry_run, min_age_s=args.min_age)
+    verb = "would delete" if args.dry_run else "deleted"
+    print(f"{verb} {report['files']} orphaned files ({_mb(report['bytes'])}) "
+          f"and {report['derivedDirs']} derived dirs ({_mb(report['derivedBytes'])})")
+    if report["requeued"]:
+        print(f"re-queued {report['requeued']} unreferenced blobs for collection")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete unreferenced stored files")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would go")
+    parser.add_argument("--min-age", type=float, help="seconds; defaults to GC_ORPHAN_AGE_S")
+    parser.add_argument("--collect", action="store_true", help="delete due released files first")
+    asyncio.run(main(parser.parse_args()))
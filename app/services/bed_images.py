@@ -0,0 +1,134 @@
+# app/services/bed_images.py
+# Orthomosaic crops under one bed, for the bed detail view.
+#
+# The bed polygon is projected into the raster's CRS and only the window
+# covering its bounding box is read; GDAL decodes just the tiles/strips that
+# window touches. Large beds are decimated on read to at most max_side
+# pixels, from the plot's pyramid (see tiles.py) when the crop is coarse
+# enough. Pixels outside the polygon are transparent.
+#
+# Crops are cached under cache_dir/beds/<hash>/<bed id>/, keyed by the bed's
+# geometry and updatedAt, so any edit of the bed makes a new key; update and
+# delete also drop the bed's directory right away.
+import asyncio
+import hashlib
+import json
+import math
+import shutil
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import rasterio
+from fastapi import HTTPException
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.transform import Affine
+from rasterio.warp import transform as warp_points
+from rasterio.windows import Window, from_bounds
+from starlette.concurrency import run_in_threadpool
+from app.db.mongo import get_db
+from app.services import processing, tiles
+from app.services.storage import local_path
+from app.services.tiles import TileFormat, band_indexes, cached_file, encode_rgba
+from app.utils.files import derived_dir
+
+VERSION = 1        # bump when rendering changes; old cache entries are ignored
+DEFAULT_SIDE = 1024
+MAX_SIDE = 4096
+
+def _key(coordinates: list, updated_at) -> str:
+    raw = json.dumps([coordinates, updated_at.isoformat() if updated_at else None], separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def _bed_dir(filename: str, bed_id: str) -> Path:
+    return derived_dir("beds", filename) / bed_id
+
+def _cache_path(filename: str, bed: dict, fmt: TileFormat, max_side: int) -> Path:
+    return _bed_dir(filename, bed["id"]) / f"v{VERSION}-{_key(bed['coordinates'], bed.get('updatedAt'))}-{max_side}.{fmt}"
+
+def _pixel_window(bounds: tuple, ds) -> Optional[Window]:
+    """Whole-pixel window of ds covering bounds, clipped to the raster; None if outside."""
+    w = from_bounds(*bounds, transform=ds.transform)
+    col0, row0 = max(0, math.floor(w.col_off)), max(0, math.floor(w.row_off))
+    col1, row1 = min(ds.width, math.ceil(w.col_off + w.width)), min(ds.height, math.ceil(w.row_off + w.height))
+    if col1 <= col0 or row1 <= row0:
+        return None
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+def _crop(filename: str, coordinates: list, fmt: TileFormat, max_side: int) -> bytes:
+    with rasterio.open(local_path(filename)) as src:
+        if src.crs is None:
+            raise ValueError("Plot raster is not georeferenced")
+        rings = [list(zip(*warp_points("EPSG:4326", src.crs, [p[0] for p in r], [p[1] for p in r]))) for r in coordinates]
+        xs, ys = [x for x, _ in rings[0]], [y for _, y in rings[0]]
+        bounds = (min(xs), min(ys), max(xs), max(ys))
+        window = _pixel_window(bounds, src)
+        if window is None:
+            return b""
+        scale = min(1.0, max_side / max(window.width, window.height))
+    # coarse crops come from the pyramid, like coarse tiles
+    pyramid = tiles.build_pyramid(filename) if scale <= 1 / tiles.PYRAMID_FACTOR else None
+
+    with rasterio.open(pyramid or local_path(filename)) as ds:
+        window = _pixel_window(bounds, ds) if pyramid else window
+        if window is None:
+            return b""
+        scale = min(1.0, max_side / max(window.width, window.height))
+        shape = (max(1, round(window.height * scale)), max(1, round(window.width * scale)))
+        indexes = band_indexes(ds)
+        data = ds.read(indexes, window=window, out_shape=(len(indexes), *shape), resampling=Resampling.average)
+        mask = ds.dataset_mask(window=window, out_shape=shape)
+        transform = ds.window_transform(window) * Affine.scale(window.width / shape[1], window.height / shape[0])
+    inside = geometry_mask([{"type": "Polygon", "coordinates": rings}], out_shape=shape, transform=transform, invert=True)
+    mask = np.where(inside, mask, 0)
+    if not mask.any():
+        return b""
+    return encode_rgba(data, mask, fmt)
+
+def render_crop(filename: str, coordinates: list, fmt: TileFormat, max_side: int, path: Path) -> bytes:
+    """Cached crop bytes (b"" where the bed misses the raster). Blocking."""
+    return cached_file(path, lambda: _crop(filename, coordinates, fmt, max_side))
+
+def prerender_crop(filename: str, coordinates: list, fmt: TileFormat, max_side: int, path: Path) -> int:
+    """render_crop for the pool: returns the size instead of shipping the bytes back."""
+    return len(render_crop(filename, coordinates, fmt, max_side, path))
+
+async def _plot_filename(plot_id: str) -> str:
+    doc = await get_db().plots.find_one({"id": plot_id}, {"_id": 0, "filename": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Plot not found")
+    return doc["filename"]
+
+async def bed_image(plot_id: str, bed_id: str, fmt: TileFormat, max_side: int) -> tuple[Optional[bytes], str]:
+    """(encoded crop or None if the bed is off the raster, ETag)."""
+    filename = await _plot_filename(plot_id)
+    bed = await get_db().beds.find_one({"plot_id": plot_id, "id": bed_id}, {"_id": 0, "id": 1, "coordinates": 1, "updatedAt": 1})
+    if not bed:
+        raise HTTPException(status_code=404, detail="Bed not found")
+    path = _cache_path(filename, bed, fmt, max_side)
+    try:
+        data = await run_in_threadpool(render_crop, filename, bed["coordinates"], fmt, max_side, path)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return data or None, f'"{path.stem}-{fmt}"'
+
+async def prerender(plot_id: str, fmt: TileFormat, max_side: int) -> dict:
+    """Render every bed's crop of a plot on the processing pool."""
+    filename = await _plot_filename(plot_id)
+    beds = await get_db().beds.find({"plot_id": plot_id}, {"_id": 0, "id": 1, "coordinates": 1, "updatedAt": 1}).to_list(None)
+    jobs = [
+        processing.run_in_pool(prerender_crop, filename, b["coordinates"], fmt, max_side, _cache_path(filename, b, fmt, max_side))
+        for b in beds
+    ]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    sizes = [r for r in results if not isinstance(r, BaseException)]
+    return {
+        "rendered": sum(1 for n in sizes if n),
+        "empty": sum(1 for n in sizes if not n),
+        "failed": {b["id"]: str(r) or type(r).__name__ for b, r in zip(beds, results) if isinstance(r, BaseException)},
+    }
+
+async def forget_bed(plot_id: str, bed_id: str) -> None:
+    doc = await get_db().plots.find_one({"id": plot_id}, {"_id": 0, "filename": 1})
+    if doc:
+        await run_in_threadpool(shutil.rmtree, _bed_dir(doc["filename"], bed_id), True)
@@ -0,0 +1,114 @@
+# app/services/bed_index.py
+# In-process point-in-bed lookup, one index per plot.
+#
+# Each plot's bed bounding boxes are packed into a NumPy array. A single point
+# is tested against every bbox in one vectorised pass; a batch of points is
+# sorted by x so each bed only looks at the slice of points inside its x-range.
+# Bbox hits are then confirmed with an even-odd ray cast against the rings.
+# create/update/delete_bed patch the index in place (the packed arrays are
+# rebuilt lazily on the next lookup), and entries expire after
+# bed_index_ttl_s so other workers' writes are picked up.
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.utils.geo import points_in_polygon
+from app.utils.lru import LRUCache
+
+SMALL_BATCH = 32
+
+def ring_bbox(coordinates: list) -> list[float]:
+    outer = np.asarray(coordinates[0], dtype=np.float64)
+    return [float(outer[:, 0].min()), float(outer[:, 1].min()), float(outer[:, 0].max()), float(outer[:, 1].max())]
+
+class PlotBedIndex:
+    def __init__(self):
+        self.beds: Dict[str, List[np.ndarray]] = {}
+        self.loaded_at = time.monotonic()
+        self._packed: Optional[Tuple[list, np.ndarray, list]] = None
+
+    def upsert(self, bed_id: str, coordinates: list) -> None:
+        self.beds[bed_id] = [np.asarray(r, dtype=np.float64) for r in coordinates if len(r) >= 4]
+        self._packed = None
+
+    def remove(self, bed_id: str) -> None:
+        if self.beds.pop(bed_id, None) is not None:
+            self._packed = None
+
+    def _pack(self) -> Tuple[list, np.ndarray, list]:
+        # a snapshot, so lookups running in a worker thread never see a half-applied write
+        ids = list(self.beds)
+        rings = [self.beds[i] for i in ids]
+        boxes = np.array([ring_bbox(r) for r in rings], dtype=np.float64).reshape(-1, 4)
+        self._packed = (ids, boxes, rings)
+        return self._packed
+
+    def locate(self, points: np.ndarray) -> List[List[str]]:
+        """Ids of the beds containing each (lon, lat) point."""
+        ids, boxes, rings = self._packed or self._pack()
+        hits: List[List[str]] = [[] for _ in range(len(points))]
+        if not ids or not len(points):
+            return hits
+        xs, ys = points[:, 0], points[:, 1]
+
+        def test(b: int, sel: np.ndarray) -> None:
+            for i in sel[points_in_polygon(xs[sel], ys[sel], rings[b])]:
+                hits[i].append(ids[b])
+
+        if len(points) <= SMALL_BATCH:
+            # a few points: one vectorised bbox pass over all beds per point
+            for i in range(len(points)):
+                cand = np.flatnonzero((boxes[:, 0] <= xs[i]) & (xs[i] <= boxes[:, 2])
+                                      & (boxes[:, 1] <= ys[i]) & (ys[i] <= boxes[:, 3]))
+                for b in cand:
+                    test(int(b), np.array([i]))
+            return hits
+        # many points: sort them by x so each bed's x-range is a contiguous slice
+        order = np.argsort(xs, kind="stable")
+        sorted_x = xs[order]
+        starts = np.searchsorted(sorted_x, boxes[:, 0], side="left")
+        ends = np.searchsorted(sorted_x, boxes[:, 2], side="right")
+        for b in np.flatnonzero(ends > starts):
+            sel = order[starts[b]:ends[b]]
+            sel = sel[(ys[sel] >= boxes[b, 1]) & (ys[sel] <= boxes[b, 3])]
+            if sel.size:
+                test(int(b), np.sort(sel))
+        return hits
+
+_indexes = LRUCache(256)
+
+async def _index_for(plot_id: str) -> PlotBedIndex:
+    index = _indexes.get(plot_id)
+    if index is not None and time.monotonic() - index.loaded_at < settings.bed_index_ttl_s:
+        return index
+    db = get_db()
+    index = PlotBedIndex()
+    async for bed in db.beds.find({"plot_id": plot_id}, {"_id": 0, "id": 1, "coordinates": 1}):
+        index.upsert(bed["id"], bed["coordinates"])
+    if not index.beds and not await db.plots.count_documents({"id": plot_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Plot not found")
+    _indexes.put(plot_id, index)
+    return index
+
+async def locate(plot_id: str, points: list[list[float]]) -> List[List[str]]:
+    index = await _index_for(plot_id)
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) <= SMALL_BATCH:
+        return index.locate(pts)
+    return await run_in_threadpool(index.locate, pts)
+
+def on_bed_saved(plot_id: str, bed_id: str, coordinates: list) -> None:
+    index = _indexes.get(plot_id)
+    if index is not None:
+        index.upsert(bed_id, coordinates)
+
+def on_bed_deleted(plot_id: str, bed_id: str) -> None:
+    index = _indexes.get(plot_id)
+    if index is not None:
+        index.remove(bed_id)
+
+def on_plot_deleted(plot_id: str) -> None:
+    _indexes.discard(plot_id)
@@ -2,10 +2,25 @@
 from uuid import uuid4
 from datetime import datetime
 from typing import List, Optional
-from fastapi import HTTPException, status
+from fastapi import HTTPException
+from pymongo.errors import WriteError
 from app.db.mongo import get_db
-from app.core.config import settings
 from app.models.bed import BedInDB
+from app.services import bed_images, bed_index, events, plant_stats, plot_summaries
+from app.services.blobs import release
+from app.utils.pagination import Keyset, Order, Page, keyset, page_of
+
+# Beds live in their own collection keyed by (plot_id, id); their spatial maps
+# are joined in from `spatial_maps` (indexed on (bed_id, date, id)), newest first.
+_MAPS_LOOKUP = {
+    "$lookup": {
+        "from": "spatial_maps",
+        "localField": "id",
+        "foreignField": "bed_id",
+        "pipeline": [{"$sort": {"date": -1}}, {"$project": {"_id": 0, "plot_id": 0, "bed_id": 0}}],
+        "as": "spatialMaps",
+    }
+}
 
 def _close_ring(coords: list[list[float]]) -> list[list[float]]:
     if not coords: return coords
@@ -16,68 +31,145 @@ def _close_ring(coords: list[list[float]]) -> list[list[float]]:
 def _validate_polygon(poly: list[list[list[float]]]) -> list[list[list[float]]]:
     if not poly or not poly[0] or len(poly[0]) < 4:
         raise HTTPException(status_code=422, detail="Polygon requires at least 4 points")
-    poly[0] = _close_ring(poly[0])
+    poly = [_close_ring(ring) for ring in poly]
+    for ring in poly:
+        if len(ring) < 4 or any(len(p) < 2 or not (-180 <= p[0] <= 180 and -90 <= p[1] <= 90) for p in ring):
+            raise HTTPException(status_code=422, detail="Polygon rings need 4+ [lon, lat] points within WGS84 bounds")
     return poly
 
-async def list_beds(plot_id: str) -> List[dict]:
+def geo_fields(poly: list[list[list[float]]]) -> dict:
+    """Derived fields stored next to `coordinates` for the spatial queries."""
+    return {"geometry": {"type": "Polygon", "coordinates": poly}, "bbox": bed_index.ring_bbox(poly)}
+
+async def _write(op):
+    # the 2dsphere index rejects self-intersecting or otherwise invalid rings
+    try:
+        return await op
+    except WriteError as e:
+        if e.code == 16755:
+            raise HTTPException(status_code=422, detail="Invalid bed polygon (self-intersecting or degenerate ring)")
+        raise
+
+BED_FIELDS = ("id", "name", "coordinates", "bbox", "count", "averageVolume", "statsMapId", "createdAt", "updatedAt", "spatialMaps")
+
+def _with_maps(match: dict, ks: Optional[Keyset] = None, limit: Optional[int] = None, fields: Optional[set] = None) -> list:
+    stages = [{"$match": match}, {"$sort": dict(ks.sort()) if ks else {"createdAt": 1}}]
+    if limit is not None:
+        stages.append({"$limit": limit + 1})
+    if fields is None or "spatialMaps" in fields:
+        stages.append(_MAPS_LOOKUP)
+    if fields is None:
+        stages.append({"$project": {"_id": 0, "plot_id": 0, "geometry": 0}})
+    else:
+        # id/createdAt are the keyset; they are dropped after paging if unrequested
+        stages.append({"$project": {"_id": 0, **{f: 1 for f in fields | {"id", "createdAt"}}}})
+    return stages
+
+async def list_beds(plot_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                    fields: Optional[set] = None, order: Order = "asc") -> Page:
     db = get_db()
-    p = await db.plots.find_one({"id": plot_id}, {"_id": 0, "beds": 1})
-    return p.get("beds", []) if p else []
+    ks = keyset(("createdAt", "id"), order, cursor)
+    docs = await db.beds.aggregate(_with_maps({"plot_id": plot_id, **ks.filter()}, ks, limit, fields)).to_list(None)
+    page = page_of(docs, ks, limit)
+    if fields is not None:
+        for doc in page.items:
+            for key in {"id", "createdAt"} - fields:
+                doc.pop(key, None)
+    return page
 
 async def create_bed(plot_id: str, name: str, coordinates: list[list[list[float]]]) -> dict:
     db = get_db()
     poly = _validate_polygon(coordinates)
-    bed = BedInDB(id=uuid4().hex, name=name, coordinates=poly).model_dump()
-    res = await db.plots.update_one({"id": plot_id}, {"$push": {"beds": bed}})
-    if res.matched_count == 0:
+    if not await db.plots.count_documents({"id": plot_id}, limit=1):
         raise HTTPException(status_code=404, detail="Plot not found")
+    geo = geo_fields(poly)
+    bed = BedInDB(id=uuid4().hex, name=name, coordinates=poly, bbox=geo["bbox"]).model_dump()
+    doc = {k: v for k, v in bed.items() if k != "spatialMaps"}
+    await _write(db.beds.insert_one({**doc, **geo, "plot_id": plot_id}))
+    await plot_summaries.on_bed_created(plot_id)
+    events.publish("bed.created", plot_id, bed["id"], bed)
+    bed_index.on_bed_saved(plot_id, bed["id"], poly)
     return bed
 
 async def update_bed(plot_id: str, bed_id: str, name: Optional[str], coordinates: Optional[list[list[list[float]]]]) -> dict:
     db = get_db()
     if coordinates is not None:
         coordinates = _validate_polygon(coordinates)
-    update = {"beds.$.updatedAt": datetime.utcnow()}
-    if name is not None: update["beds.$.name"] = name
-    if coordinates is not None: update["beds.$.coordinates"] = coordinates
+    update = {"updatedAt": datetime.utcnow()}
+    if name is not None: update["name"] = name
+    if coordinates is not None:
+        update["coordinates"] = coordinates
+        update.update(geo_fields(coordinates))
 
-    res = await db.plots.update_one({"id": plot_id, "beds.id": bed_id}, {"$set": update})
+    res = await _write(db.beds.update_one({"plot_id": plot_id, "id": bed_id}, {"$set": update}))
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Bed not found")
-    p = await db.plots.find_one({"id": plot_id}, {"_id": 0, "beds": 1})
-    bed = next((b for b in p.get("beds", []) if b["id"] == bed_id), None)
-    return bed
+    events.publish("bed.updated", plot_id, bed_id, update)
+    # crops are keyed by updatedAt too; this only frees the disk space early
+    await bed_images.forget_bed(plot_id, bed_id)
+    if coordinates is not None:
+        bed_index.on_bed_saved(plot_id, bed_id, coordinates)
+        # counts were clipped to the old polygon
+        await plant_stats.forget_bed_stats(plot_id, bed_id)
+    return await get_bed_by_id(plot_id, bed_id)
 
 async def delete_bed(plot_id: str, bed_id: str) -> None:
-    # best-effort: delete any PLY files attached to this bed
-    from pathlib import Path
     db = get_db()
-    p = await db.plots.find_one({"id": plot_id}, {"_id": 0, "beds": 1})
-    if not p:
-        raise HTTPException(status_code=404, detail="Plot not found")
-    bed = next((b for b in p.get("beds", []) if b["id"] == bed_id), None)
+    bed = await db.beds.find_one_and_delete({"plot_id": plot_id, "id": bed_id}, {"_id": 1})
     if not bed:
-        # Align with old behavior:
-        # update_one below will give matched_count==0 → Plot not found,
-        # but we know the plot exists; let's surface 404 Bed for clarity.
+        if not await db.plots.count_documents({"id": plot_id}, limit=1):
+            raise HTTPException(status_code=404, detail="Plot not found")
         raise HTTPException(status_code=404, detail="Bed not found")
+    bed_index.on_bed_deleted(plot_id, bed_id)
+    events.publish("bed.deleted", plot_id, bed_id)  # its spatial maps go with it
+    await bed_images.forget_bed(plot_id, bed_id)
 
-    for m in bed.get("spatialMaps", []):
-        try:
-            Path(settings.files_dir, m["filename"]).unlink(missing_ok=True)
-        except Exception:
-            pass
-
-    res = await db.plots.update_one({"id": plot_id}, {"$pull": {"beds": {"id": bed_id}}})
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Plot not found")
+    # release the PLY files attached to this bed
+    maps = await db.spatial_maps.find({"bed_id": bed_id}, {"_id": 0, "filename": 1, "bytes": 1, "date": 1}).to_list(None)
+    await db.spatial_maps.delete_many({"bed_id": bed_id})
+    await plot_summaries.on_maps_removed(plot_id, maps, beds=1)
+    for m in maps:
+        await release(m["filename"])
 
 async def get_bed_by_id(plot_id: str, bed_id: str) -> dict:
     db = get_db()
-    p = await db.plots.find_one({"id": plot_id}, {"_id": 0, "beds": 1})
-    if not p:
-        raise HTTPException(status_code=404, detail="Plot not found")
-    bed = next((b for b in p.get("beds", []) if b["id"] == bed_id), None)
-    if not bed:
+    found = await db.beds.aggregate(_with_maps({"plot_id": plot_id, "id": bed_id})).to_list(1)
+    if not found:
+        if not await db.plots.count_documents({"id": plot_id}, limit=1):
+            raise HTTPException(status_code=404, detail="Plot not found")
         raise HTTPException(status_code=404, detail="Bed not found")
-    return bed
+    return found[0]
+
+async def init_bed_indexes() -> None:
+    db = get_db()
+    await db.beds.create_index([("plot_id", 1), ("id", 1)], unique=True)
+    await db.beds.create_index([("plot_id", 1), ("createdAt", 1), ("id", 1)])
+    # 2dsphere indexes are sparse: beds without geometry (not yet backfilled) are skipped
+    await db.beds.create_index([("plot_id", 1), ("geometry", "2dsphere")])
+    await db.spatial_maps.create_index([("plot_id", 1), ("id", 1)], unique=True)
+    await db.spatial_maps.create_index([("bed_id", 1), ("date", -1), ("id", -1)])
+
+async def beds_at(plot_id: str, lon: float, lat: float) -> List[dict]:
+    hits = (await bed_index.locate(plot_id, [[lon, lat]]))[0]
+    if not hits:
+        return []
+    return await get_db().beds.aggregate(_with_maps({"plot_id": plot_id, "id": {"$in": hits}})).to_list(None)
+
+async def beds_within(plot_id: str, bbox: list[float], limit: Optional[int] = None) -> List[dict]:
+    """Beds whose polygon intersects the [minLon, minLat, maxLon, maxLat] box."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not (min_lon < max_lon and min_lat < max_lat):
+        raise HTTPException(status_code=422, detail="bbox must be minLon,minLat,maxLon,maxLat")
+    box = {"type": "Polygon", "coordinates": [[
+        [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat],
+    ]]}
+    db = get_db()
+    match = {"plot_id": plot_id, "geometry": {"$geoIntersects": {"$geometry": box}}}
+    docs = await db.beds.aggregate(_with_maps(match, limit=limit)).to_list(None)
+    if not docs and not await db.plots.count_documents({"id": plot_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Plot not found")
+    return docs[:limit] if limit is not None else docs
+
+async def locate_points(plot_id: str, points: list[list[float]]) -> List[Optional[str]]:
+    """First containing bed id per point, None where a point is in no bed."""
+    return [h[0] if h else None for h in await bed_index.locate(plot_id, points)]
@@ -0,0 +1,140 @@
+# app/services/blobs.py
+# Content-addressed file store: every stored file is named after the SHA-256
+# of its bytes and tracked in the `blobs` collection with a reference count.
+# Documents that point at a file (plots, spatial maps) acquire a reference on
+# upload and release it on delete. Releasing the last reference tombstones the
+# file; app.services.file_gc deletes it in the background after a grace
+# period, during which an identical upload revives the record (refs 0 -> 1).
+# Once the collector has claimed the record, an identical upload waits until
+# the old copy and its record are gone and then stores the bytes afresh.
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from app.db.mongo import get_db
+from app.services import file_gc
+from app.services.storage import get_storage
+from app.utils.files import StoredFile, hash_stream
+
+_COLLECT_POLL_S = 0.05
+
+async def _take_ref(sha256: str) -> Optional[dict]:
+    """+1 on the blob record, waiting out a collector deleting it; None if there is no record."""
+    db = get_db()
+    while True:
+        doc = await db.blobs.find_one_and_update(
+            {"_id": sha256, "collecting": {"$exists": False}}, {"$inc": {"refs": 1}}, return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            return doc
+        claimed = await db.blobs.find_one({"_id": sha256}, {"collecting": 1})
+        if claimed is None:
+            return None
+        stale = datetime.utcnow() - timedelta(seconds=file_gc.CLAIM_STALE_S)
+        # the collector died mid-delete: take the record over, the file is rewritten below if it went
+        doc = await db.blobs.find_one_and_update(
+            {"_id": sha256, "collecting": {"$lt": stale}},
+            {"$inc": {"refs": 1}, "$unset": {"collecting": ""}}, return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return doc
+        await asyncio.sleep(_COLLECT_POLL_S)
+
+async def _acquire(sha256: str, ext: str, size: int, materialize: Callable[[str], None]) -> StoredFile:
+    db = get_db()
+    while True:
+        doc = await _take_ref(sha256)
+        if doc and await run_in_threadpool(get_storage().exists, doc["filename"]):
+            return StoredFile(filename=doc["filename"], bytes=doc["bytes"], sha256=sha256)
+
+        # New content (or a record whose file went missing): write the bytes once.
+        filename = doc["filename"] if doc else f"{sha256}{ext}"
+        try:
+            await run_in_threadpool(materialize, filename)
+        except BaseException:
+            if doc:
+                # give back the reference taken above, or the record never reaches refs 0
+                await release(filename)
+            raise
+        if doc:
+            return StoredFile(filename=filename, bytes=size, sha256=sha256)
+        try:
+            await db.blobs.insert_one({
+                "_id": sha256,
+                "filename": filename,
+                "bytes": size,
+                "refs": 1,
+                "createdAt": datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            # A concurrent identical upload registered first; same bytes, same name.
+            doc = await _take_ref(sha256)
+            if doc is None:
+                # ...and was released and collected since, maybe with the file
+                # written above: start over
+                continue
+            filename = doc["filename"]
+        return StoredFile(filename=filename, bytes=size, sha256=sha256)
+
+async def store_upload(upload_file, ext: str, max_bytes: int) -> StoredFile:
+    """Hash an upload and store it unless identical bytes are already stored.
+
+    A duplicate costs one read of the spooled upload and no writes. Raises
+    UploadTooLarge past max_bytes before anything touches storage.
+    """
+    src = upload_file.file
+    try:
+        size, sha256 = await run_in_threadpool(hash_stream, src, max_bytes)
+        return await _acquire(sha256, ext, size, lambda name: get_storage().put_stream(src, name))
+    finally:
+        await upload_file.close()
+
+async def adopt_file(path: Path, ext: str, max_bytes: int) -> StoredFile:
+    """Store a fully written file; with local storage it is renamed into
+    files_dir, with no copy.
+
+    path must be on the same filesystem as files_dir. It is consumed either
+    way: moved into place, or deleted when identical bytes are already stored.
+    """
+    def digest() -> tuple[int, str]:
+        with open(path, "rb") as f:
+            return hash_stream(f, max_bytes)
+    try:
+        size, sha256 = await run_in_threadpool(digest)
+        return await _acquire(sha256, ext, size, lambda name: get_storage().put_file(path, name))
+    finally:
+        Path(path).unlink(missing_ok=True)
+
+async def adopt_object(name: str, sha256: str, ext: str, size: int) -> StoredFile:
+    """Register bytes a client uploaded straight to storage as `name`.
+
+    The caller has checked the object's size and checksum. Raises
+    FileNotFoundError if the object is not there.
+    """
+    def materialize(filename: str) -> None:
+        if filename != name or not get_storage().exists(name):
+            raise FileNotFoundError(name)
+    return await _acquire(sha256, ext, size, materialize)
+
+async def find_blob(sha256: str) -> Optional[dict]:
+    # a record the collector claimed is as good as gone
+    return await get_db().blobs.find_one({"_id": sha256, "collecting": {"$exists": False}}, {"_id": 0, "filename": 1, "refs": 1})
+
+async def release(filename: str) -> None:
+    """Drop one reference to a stored file; the last one schedules its deletion."""
+    db = get_db()
+    doc = await db.blobs.find_one_and_update(
+        {"filename": filename}, {"$inc": {"refs": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        # Stored before deduplication: the file belongs to a single document.
+        await file_gc.tombstone(filename)
+    elif doc["refs"] <= 0:
+        await file_gc.tombstone(filename, doc["_id"], doc["bytes"])
+
+async def init_blob_indexes() -> None:
+    db = get_db()
+    await db.blobs.create_index("filename", unique=True)
@@ -0,0 +1,203 @@
+# app/services/events.py
+# Change feed for the frontend, served as Server-Sent Events on /events.
+#
+# Messages are small deltas, e.g.
+#   event: bed.updated
+#   data: {"plotId": "...", "id": "...", "data": {"name": "North", "updatedAt": "..."}}
+# with types <plot|bed|spatial_map>.<created|updated|deleted>. `data` holds
+# the public fields that were set (only ids on deletes), never whole
+# documents; clients refetch an item if they need more of it.
+#
+# Each event is serialized once into its SSE frame and the same bytes object
+# is queued for every subscriber of its plot (and every all-plots
+# subscriber). Queues are bounded: a subscriber that falls behind is sent a
+# `reset` event and dropped, so a slow client never slows publishing; it
+# reconnects and refetches. The last EVENTS_BUFFER frames are kept so a
+# client reconnecting with Last-Event-ID gets what it missed (or `reset` if
+# that is too far back).
+#
+# Sources (EVENTS_SOURCE):
+#   service       the service-layer write paths call publish(); only writes
+#                 made by this process are seen, so use one worker
+#   change_stream a Mongo change stream on plots/beds/spatial_maps (replica
+#                 set or sharded cluster required); sees every writer.
+#                 Deletes need pre-images (MongoDB 6+), enabled at startup
+import asyncio
+import itertools
+import json
+import logging
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+from fastapi.encoders import jsonable_encoder
+from app.core.config import settings
+from app.db.mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_S = 15.0
+ALL = "*"
+
+# public, small fields a delta may carry, per kind
+_FIELDS = {
+    "plot": {"id", "name", "createdAt", "status", "error", "metadata"},
+    "bed": {"id", "name", "coordinates", "bbox", "count", "averageVolume", "statsMapId", "createdAt", "updatedAt"},
+    "spatial_map": {"id", "fileName", "bytes", "optimizedBytes", "compressedBytes", "contentType", "date",
+                    "createdAt", "status", "error", "metadata", "stats"},
+}
+_COLLECTIONS = {"plots": "plot", "beds": "bed", "spatial_maps": "spatial_map"}
+
+class Subscriber:
+    def __init__(self, plots: Set[str]):
+        self.plots = plots
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.events_queue)
+        self.dropped = False
+
+_subscribers: Dict[str, Set[Subscriber]] = {}
+_recent: deque = deque(maxlen=settings.events_buffer)  # (seq, plot_id, frame)
+_seq = itertools.count(1)
+_RESET = b"event: reset\ndata: {}\n\n"
+_watch_task: Optional[asyncio.Task] = None
+
+def _frame(seq: int, kind: str, payload: dict) -> bytes:
+    data = json.dumps(jsonable_encoder(payload), separators=(",", ":"))
+    return f"id: {seq}\nevent: {kind}\ndata: {data}\n\n".encode()
+
+def _deliver(sub: Subscriber, frame: bytes) -> None:
+    if sub.dropped:
+        return
+    try:
+        sub.queue.put_nowait(frame)
+    except asyncio.QueueFull:
+        # behind by a whole queue: cut it loose rather than buffer without bound
+        sub.dropped = True
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(_RESET)
+
+def _broadcast(kind: str, plot_id: str, doc_id: str, data: Optional[dict] = None, **ids) -> None:
+    entity, _, action = kind.partition(".")
+    allowed = _FIELDS[entity]
+    payload = {"plotId": plot_id, "id": doc_id, **ids}
+    if data and action != "deleted":
+        payload["data"] = {k: v for k, v in data.items() if k in allowed}
+    seq = next(_seq)
+    frame = _frame(seq, kind, payload)  # once, whatever the number of subscribers
+    _recent.append((seq, plot_id, frame))
+    for sub in _subscribers.get(plot_id, ()):
+        _deliver(sub, frame)
+    for sub in _subscribers.get(ALL, ()):
+        _deliver(sub, frame)
+
+def publish(kind: str, plot_id: str, doc_id: str, data: Optional[dict] = None, **ids) -> None:
+    """Service-layer hook; a no-op when the change stream is the source."""
+    if settings.events_source == "service":
+        _broadcast(kind, plot_id, doc_id, data, **ids)
+
+def subscriber_count() -> int:
+    return len({s for subs in _subscribers.values() for s in subs})
+
+def _subscribe(plots: Iterable[str]) -> Subscriber:
+    sub = Subscriber(set(plots) or {ALL})
+    for p in sub.plots:
+        _subscribers.setdefault(p, set()).add(sub)
+    return sub
+
+def _unsubscribe(sub: Subscriber) -> None:
+    for p in sub.plots:
+        subs = _subscribers.get(p)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[p]
+
+def _replay(sub: Subscriber, last_id: Optional[str]) -> None:
+    try:
+        last = int(last_id) if last_id else None
+    except ValueError:
+        last = None
+    if last is None:
+        return
+    if not _recent or last < _recent[0][0] - 1:
+        _deliver(sub, _RESET)
+        return
+    for seq, plot_id, frame in _recent:
+        if seq > last and (ALL in sub.plots or plot_id in sub.plots):
+            _deliver(sub, frame)
+
+async def stream(plots: Iterable[str], last_event_id: Optional[str]) -> AsyncIterator[bytes]:
+    """SSE body for one client; ends when the client goes away or falls behind."""
+    sub = _subscribe(plots)
+    try:
+        yield b"retry: 3000\n\n"
+        _replay(sub, last_event_id)
+        while True:
+            try:
+                frame = await asyncio.wait_for(sub.queue.get(), KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"  # keeps proxies from timing the stream out
+                continue
+            yield frame
+            if sub.dropped and frame is _RESET:
+                return
+    finally:
+        _unsubscribe(sub)
+
+def _from_change(change: dict) -> None:
+    entity = _COLLECTIONS.get(change.get("ns", {}).get("coll"))
+    op = change.get("operationType")
+    if entity is None or op not in ("insert", "update", "replace", "delete"):
+        return
+    if op == "delete":
+        doc = change.get("fullDocumentBeforeChange")
+        if not doc:
+            return  # no pre-image: nothing to address the event to
+        data, action = None, "deleted"
+    elif op == "update":
+        doc = change.get("fullDocument") or {}
+        data, action = (change.get("updateDescription") or {}).get("updatedFields") or {}, "updated"
+    else:
+        doc = change.get("fullDocument") or {}
+        data, action = doc, "created" if op == "insert" else "updated"
+    if not doc.get("id"):
+        return
+    plot_id = doc["id"] if entity == "plot" else doc.get("plot_id")
+    ids = {"bedId": doc.get("bed_id")} if entity == "spatial_map" else {}
+    if plot_id:
+        _broadcast(f"{entity}.{action}", plot_id, doc["id"], data, **ids)
+
+async def _enable_pre_images(db) -> None:
+    for name in _COLLECTIONS:
+        try:
+            await db.command("collMod", name, changeStreamPreAndPostImages={"enabled": True})
+        except Exception as e:
+            logger.warning("No pre-images on %s (delete events will be skipped): %s", name, e)
+
+async def _watch() -> None:
+    db = get_db()
+    await _enable_pre_images(db)
+    pipeline = [{"$match": {"ns.coll": {"$in": list(_COLLECTIONS)}}}]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", full_document_before_change="whenAvailable",
+                                resume_after=resume_token) as changes:
+                async for change in changes:
+                    resume_token = changes.resume_token
+                    _from_change(change)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Change stream failed; retrying")
+            await asyncio.sleep(5)
+
+def start() -> None:
+    global _watch_task
+    if settings.events_source == "change_stream" and _watch_task is None:
+        _watch_task = asyncio.create_task(_watch())
+
+async def stop() -> None:
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        await asyncio.gather(_watch_task, return_exceptions=True)
+        _watch_task = None
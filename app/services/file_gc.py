@@ -0,0 +1,203 @@
+# app/services/file_gc.py
+# Deferred deletion of stored files, and a sweep for files nothing refers to.
+#
+# Deletes never wait on storage: releasing the last reference to a file
+# (blobs.release) only upserts a tombstone into `file_tombstones`
+# ({_id: stored name, sha256, bytes, dueAt}). The collector task takes due
+# tombstones gc_batch at a time and deletes their files, siblings and derived
+# artifacts in one worker thread per batch.
+#
+# A tombstone is due gc_grace_s after the release. Until then the blob record
+# stays at refs 0, so an identical upload revives it without a write. The
+# collector claims a record still at refs 0 by stamping it `collecting`,
+# deletes the file, then removes the record. blobs._acquire neither revives
+# a claimed record nor writes a new copy while it exists, so an identical
+# upload racing the collector waits for it instead of having its fresh file
+# deleted underneath it. A claim older than CLAIM_STALE_S (the collector
+# died) is taken over by the upload. A delete that fails is logged and left
+# to the sweep.
+#
+# The sweep reconciles storage against Mongo every gc_sweep_interval_s:
+# stored files and cache_dir artifacts older than gc_orphan_age_s whose stem
+# no blob, plot, spatial map, pending direct upload or tombstone names are
+# deleted. That covers crashes between a write and its document, deletes made
+# before tombstones existed, and interrupted temp files. Blob records at
+# refs 0 that lost their tombstone get a new one.
+#
+# Reclaimed files and bytes are logged and counted in
+# gc_reclaimed_{files,bytes}_total{source="tombstone"|"sweep"}.
+import asyncio
+import logging
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+from pymongo import DeleteOne
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.services.storage import get_storage
+from app.utils.files import delete_derived
+from app.utils.metrics import GC_BYTES, GC_FILES
+
+logger = logging.getLogger(__name__)
+
+DERIVED_KINDS = ("tiles", "lod", "stats", "beds")  # cache_dir/<kind>/<stem>/
+CLAIM_STALE_S = 300.0  # a blob claimed this long ago belongs to a collector that died
+
+_collector_task: Optional[asyncio.Task] = None
+_sweeper_task: Optional[asyncio.Task] = None
+
+def _stem(name: str) -> str:
+    return name.rsplit("/", 1)[-1].split(".", 1)[0]
+
+async def tombstone(filename: str, sha256: Optional[str] = None, size: int = 0) -> None:
+    """Schedule a stored file for deletion once the grace period is over."""
+    due = datetime.utcnow() + timedelta(seconds=settings.gc_grace_s)
+    await get_db().file_tombstones.update_one(
+        {"_id": filename}, {"$set": {"sha256": sha256, "bytes": size, "dueAt": due}}, upsert=True
+    )
+
+def _delete_files(names: List[str]) -> Tuple[int, int]:
+    """Delete stored files with their siblings and derived artifacts; returns
+    (files deleted, bytes freed). Blocking."""
+    storage = get_storage()
+    files = freed = 0
+    for name in names:
+        try:
+            freed += storage.delete(name)
+            delete_derived(name)
+            files += 1
+        except Exception:
+            logger.exception("Could not delete %s; the orphan sweep will retry", name)
+    return files, freed
+
+async def collect(limit: Optional[int] = None) -> Tuple[int, int, int]:
+    """Process one batch of due tombstones; returns (tombstones, files deleted, bytes freed)."""
+    db = get_db()
+    due = await db.file_tombstones.find({"dueAt": {"$lte": datetime.utcnow()}}).sort("dueAt", 1).limit(
+        limit or settings.gc_batch
+    ).to_list(None)
+    names, claimed = [], []
+    claim = datetime.utcnow()
+    for t in due:
+        if t.get("sha256"):
+            res = await db.blobs.update_one({"_id": t["sha256"], "refs": {"$lte": 0}}, {"$set": {"collecting": claim}})
+            if not res.modified_count:
+                continue  # revived by an identical upload
+            claimed.append(t["sha256"])
+        names.append(t["_id"])
+    files, freed = await run_in_threadpool(_delete_files, names) if names else (0, 0)
+    if claimed:
+        # only now may an identical upload write the bytes again
+        await db.blobs.delete_many({"_id": {"$in": claimed}, "collecting": claim})
+    if due:
+        # a tombstone refreshed by a release meanwhile has a new dueAt and stays
+        await db.file_tombstones.bulk_write([DeleteOne({"_id": t["_id"], "dueAt": t["dueAt"]}) for t in due], ordered=False)
+    GC_FILES.labels("tombstone").inc(files)
+    GC_BYTES.labels("tombstone").inc(freed)
+    return len(due), files, freed
+
+async def _live_stems() -> Set[str]:
+    db = get_db()
+    stems = set()
+    for name in ("blobs", "plots", "spatial_maps"):
+        async for doc in db[name].find({"filename": {"$exists": True}}, {"_id": 0, "filename": 1}):
+            stems.add(_stem(doc["filename"]))
+    async for doc in db.upload_sessions.find({"objectName": {"$exists": True}}, {"_id": 0, "objectName": 1}):
+        stems.add(_stem(doc["objectName"]))
+    async for doc in db.file_tombstones.find({}, {"_id": 1}):
+        stems.add(_stem(doc["_id"]))  # the collector's
+    return stems
+
+def _derived_dirs() -> List[Tuple[Path, float]]:
+    root = Path(settings.cache_dir)
+    found = []
+    for kind in DERIVED_KINDS:
+        if (root / kind).is_dir():
+            found += [(p, p.stat().st_mtime) for p in (root / kind).iterdir() if p.is_dir()]
+    return found
+
+def _tree_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def _remove_dirs(dirs: List[Path]) -> None:
+    for d in dirs:
+        shutil.rmtree(d, ignore_errors=True)
+
+def _scan() -> tuple[list, list]:
+    return list(get_storage().listing()), _derived_dirs()
+
+async def sweep(dry_run: bool = False, min_age_s: Optional[float] = None) -> dict:
+    """Delete stored files and derived artifacts nothing refers to; returns what went (or would go)."""
+    cutoff = time.time() - (settings.gc_orphan_age_s if min_age_s is None else min_age_s)
+    # list before reading Mongo: a file written after the listing is not a candidate,
+    # and one listed earlier whose document was inserted since is live
+    stored, derived = await run_in_threadpool(_scan)
+    live = await _live_stems()
+    orphans = [(key, size) for key, size, mtime in stored if mtime < cutoff and _stem(key) not in live]
+    stale = [path for path, mtime in derived if mtime < cutoff and path.name not in live]
+    report = {
+        "files": len(orphans),
+        "bytes": sum(size for _, size in orphans),
+        "derivedDirs": len(stale),
+        "derivedBytes": await run_in_threadpool(lambda: sum(_tree_bytes(p) for p in stale)),
+        "requeued": 0,
+    }
+    if dry_run:
+        return report
+    await run_in_threadpool(get_storage().remove, [key for key, _ in orphans])
+    await run_in_threadpool(_remove_dirs, stale)
+    GC_FILES.labels("sweep").inc(len(orphans))
+    GC_BYTES.labels("sweep").inc(report["bytes"])
+
+    db = get_db()
+    async for blob in db.blobs.find({"refs": {"$lte": 0}}, {"filename": 1, "bytes": 1}):
+        if not await db.file_tombstones.count_documents({"_id": blob["filename"]}, limit=1):
+            await tombstone(blob["filename"], blob["_id"], blob["bytes"])
+            report["requeued"] += 1
+    return report
+
+async def _collector_loop() -> None:
+    while True:
+        try:
+            taken, files, freed = await collect()
+            if files:
+                logger.info("Deleted %d released files, %d bytes reclaimed", files, freed)
+        except Exception:
+            logger.exception("File collection failed")
+            taken = 0
+        if taken < settings.gc_batch:  # a full batch means more may be due right away
+            await asyncio.sleep(settings.gc_interval_s)
+
+async def _sweeper_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.gc_sweep_interval_s)
+        try:
+            report = await sweep()
+            if report["files"] or report["derivedDirs"]:
+                logger.info(
+                    "Swept %d orphaned files (%d bytes) and %d derived dirs (%d bytes)",
+                    report["files"], report["bytes"], report["derivedDirs"], report["derivedBytes"],
+                )
+        except Exception:
+            logger.exception("Orphan sweep failed")
+
+def start() -> None:
+    global _collector_task, _sweeper_task
+    if _collector_task is None:
+        _collector_task = asyncio.create_task(_collector_loop())
+    if _sweeper_task is None and settings.gc_sweep_interval_s > 0:
+        _sweeper_task = asyncio.create_task(_sweeper_loop())
+
+async def stop() -> None:
+    global _collector_task, _sweeper_task
+    tasks = [t for t in (_collector_task, _sweeper_task) if t is not None]
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _collector_task = _sweeper_task = None
+
+async def init_gc_indexes() -> None:
+    await get_db().file_tombstones.create_index("dueAt")
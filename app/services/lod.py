@@ -0,0 +1,309 @@
+# app/services/lod.py
+# Multi-resolution point cloud layout for spatial-map PLY files.
+#
+# Points are sorted into an octree over the cloud's bounding cube. Level L
+# keeps at most one point per cell of a (base * 2**L)^3 grid, drawn at random
+# from the points not claimed by a coarser level; each level-L point belongs
+# to the octree node (cell // base) at depth L. `base` is the finest power of
+# two that keeps the root under ROOT_POINTS, so long thin beds still get a
+# dense first frame. Rendering the root alone gives a uniform preview, and
+# every deeper node only adds detail inside its own cube.
+#
+# The build is out of core, so memory stays bounded whatever the scan size:
+# the vertices (memory-mapped) are streamed CHUNK_POINTS at a time to find the
+# bounds and `base` and to bucket the points into spatial partitions on disk,
+# split further until each holds at most PARTITION_POINTS. Partition
+# boundaries line up with every level's grid, so each partition is levelled
+# on its own and its runs are written at their final offsets. Only a
+# partition that is a single base cell can exceed the bound (a cloud packing
+# millions of points into one root cell). ASCII PLYs are still parsed whole.
+#
+# Output lives in cache_dir/lod/<hash>/: meta.json (bounds + node table) and
+# points.bin, where each node is one contiguous run of fixed-size records:
+# float32 x, y, z relative to meta["offset"] followed by uint8 r, g, b, a.
+import asyncio
+import json
+import os
+import shutil
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.services.storage import local_path
+from app.utils.files import derived_dir
+from app.utils.locks import KeyedLocks
+from app.utils.lru import LRUCache
+from app.utils.ply import colors, positions, read_vertices
+
+MIN_BASE_CELLS = 64
+MAX_BASE_CELLS = 4096
+ROOT_POINTS = 100_000
+MAX_LEVEL = 8
+RECORD = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("r", "u1"), ("g", "u1"), ("b", "u1"), ("a", "u1")])
+FRAME_HEADER = struct.Struct("<II")  # node index, point count
+CHUNK_POINTS = 1_000_000       # vertices converted per step of the streaming passes
+PARTITION_POINTS = 2_000_000   # largest spatial partition levelled in memory
+SPLIT_DEPTH = 2                # the first pass writes (2**SPLIT_DEPTH)^3 partitions
+
+_build_locks = KeyedLocks()
+_metas = LRUCache(64)
+_failures = LRUCache(256)
+_pending: dict[str, asyncio.Task] = {}
+
+def _lod_dir(filename: str) -> Path:
+    return derived_dir("lod", filename)
+
+def load_meta(filename: str) -> Optional[dict]:
+    path = _lod_dir(filename) / "meta.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+def _quantize(rel: np.ndarray, size: float, cells: int) -> np.ndarray:
+    # the same arithmetic for every grid, so cells of power-of-two grids nest exactly
+    return np.minimum((rel.astype(np.float64) / size * cells).astype(np.int64), cells - 1)
+
+def _cell_keys(q: np.ndarray, cells: int) -> np.ndarray:
+    return (q[:, 0] * cells + q[:, 1]) * cells + q[:, 2]
+
+def _node_codes(level: int, k: np.ndarray) -> np.ndarray:
+    # sorting codes sorts nodes by (level, kx, ky, kz); k < 2**MAX_LEVEL
+    return (level << 24) | (k[:, 0] << 16) | (k[:, 1] << 8) | k[:, 2]
+
+def _rel(records: np.ndarray) -> np.ndarray:
+    return np.column_stack([records["x"], records["y"], records["z"]])
+
+def _records(chunk: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    records = np.empty(len(chunk), RECORD)
+    rel = (positions(chunk) - lo).astype(np.float32)
+    records["x"], records["y"], records["z"] = rel[:, 0], rel[:, 1], rel[:, 2]
+    rgb = colors(chunk)
+    if rgb is None:
+        records["r"] = records["g"] = records["b"] = 255
+    else:
+        records["r"], records["g"], records["b"] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    records["a"] = 255
+    return records
+
+def _partition_path(tmp: Path, part: tuple[int, int]) -> Path:
+    return tmp / f"{part[0]}-{part[1]}.bin"
+
+def _scatter(records: np.ndarray, size: float, depth: int, tmp: Path, counts: dict) -> None:
+    """Append records to the partition files of the (2**depth)^3 grid they fall in."""
+    cells = 1 << depth
+    keys = _cell_keys(_quantize(_rel(records), size, cells), cells)
+    order = np.argsort(keys, kind="stable")
+    keys, records = keys[order], records[order]
+    uniq, starts = np.unique(keys, return_index=True)
+    for key, s, e in zip(uniq.tolist(), starts, np.append(starts[1:], len(keys))):
+        with open(_partition_path(tmp, (depth, key)), "ab") as f:
+            records[s:e].tofile(f)
+        counts[(depth, key)] = counts.get((depth, key), 0) + int(e - s)
+
+def _level(records: np.ndarray, size: float, base: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Assign one partition's points to levels and nodes; returns (records, node codes) sorted by code."""
+    n = len(records)
+    records = records[np.random.default_rng(seed).permutation(n)]
+    rel = _rel(records)
+    codes = np.zeros(n, np.int64)
+    remaining = np.arange(n)
+    for level in range(MAX_LEVEL + 1):
+        if remaining.size == 0:
+            break
+        cells = base << level
+        q = _quantize(rel[remaining], size, cells)
+        if level == MAX_LEVEL:
+            picked = np.arange(remaining.size)
+        else:
+            _, picked = np.unique(_cell_keys(q, cells), return_index=True)
+        codes[remaining[picked]] = _node_codes(level, q[picked] // base)
+        keep = np.ones(remaining.size, bool)
+        keep[picked] = False
+        remaining = remaining[keep]
+    order = np.argsort(codes, kind="stable")
+    return records[order], codes[order]
+
+def _build(vertices: np.ndarray, tmp: Path, points_path: Path) -> dict:
+    n = len(vertices)
+    chunks = [(s, min(n, s + CHUNK_POINTS)) for s in range(0, n, CHUNK_POINTS)]
+
+    # pass 1: bounding cube
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for s, e in chunks:
+        xyz = positions(vertices[s:e])
+        lo, hi = np.minimum(lo, xyz.min(axis=0)), np.maximum(hi, xyz.max(axis=0))
+    if not n:
+        lo, hi = np.zeros(3), np.zeros(3)
+    size = float((hi - lo).max()) or 1.0
+
+    # pass 2: occupied cells of each candidate base grid (dropped once past
+    # ROOT_POINTS, and so are the finer ones), while writing the partitions
+    candidates = []
+    cells = MIN_BASE_CELLS * 2
+    while cells <= MAX_BASE_CELLS:
+        candidates.append(cells)
+        cells *= 2
+    occupied = {c: np.zeros(0, np.int64) for c in candidates}
+    counts: dict = {}
+    for s, e in chunks:
+        records = _records(vertices[s:e], lo)
+        rel = _rel(records)
+        for c in list(occupied):
+            occupied[c] = np.union1d(occupied[c], _cell_keys(_quantize(rel, size, c), c))
+            if occupied[c].size > ROOT_POINTS:
+                for finer in [f for f in occupied if f >= c]:
+                    del occupied[finer]
+                break
+        _scatter(records, size, SPLIT_DEPTH, tmp, counts)
+    base = MIN_BASE_CELLS
+    for c in candidates if n else ():
+        if c not in occupied:
+            break
+        base = c
+
+    # split partitions until each fits PARTITION_POINTS; partitions stay
+    # aligned with every base grid cell down to depth log2(base)
+    max_depth = base.bit_length() - 1
+    parts, pending = [], list(counts)
+    while pending:
+        part = pending.pop()
+        if counts[part] <= PARTITION_POINTS or part[0] >= max_depth:
+            parts.append(part)
+            continue
+        path = _partition_path(tmp, part)
+        src = np.memmap(path, RECORD, mode="r")
+        children: dict = {}
+        for s in range(0, len(src), CHUNK_POINTS):
+            _scatter(np.array(src[s:s + CHUNK_POINTS]), size, part[0] + 1, tmp, children)
+        del src
+        path.unlink()
+        counts.update(children)
+        pending += children
+    parts.sort()
+
+    # every level's cells nest inside a partition, so partitions are levelled
+    # independently; runs of nodes spanning several (the coarse levels) are
+    # then concatenated in the output
+    tables = []
+    for part in parts:
+        path = _partition_path(tmp, part)
+        records, codes = _level(np.fromfile(path, RECORD), size, base, seed=[part[0], part[1]])
+        records.tofile(path)
+        tables.append(np.unique(codes, return_counts=True))
+    all_codes = np.concatenate([u for u, _ in tables]) if tables else np.zeros(0, np.int64)
+    all_counts = np.concatenate([c for _, c in tables]) if tables else np.zeros(0, np.int64)
+    node_codes, inverse = np.unique(all_codes, return_inverse=True)
+    node_counts = np.bincount(inverse, weights=all_counts, minlength=node_codes.size).astype(np.int64)
+    node_starts = np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.int64)
+
+    if n:
+        out = np.memmap(points_path, RECORD, mode="w+", shape=(n,))
+        fill = node_starts.copy()
+        for part, (uniq, cnt) in zip(parts, tables):
+            records = np.fromfile(_partition_path(tmp, part), RECORD)
+            idx = np.searchsorted(node_codes, uniq)
+            run_starts = fill[idx]
+            fill[idx] += cnt
+            first = np.concatenate([[0], np.cumsum(cnt)[:-1]])
+            out[np.repeat(run_starts - first, cnt) + np.arange(len(records))] = records
+        out.flush()
+        del out
+    else:
+        points_path.write_bytes(b"")
+
+    nodes = [
+        {
+            "id": f"{code >> 24}-{(code >> 16) & 0xFF}-{(code >> 8) & 0xFF}-{code & 0xFF}",
+            "level": code >> 24,
+            "start": start,
+            "count": count,
+        }
+        for code, start, count in zip(node_codes.tolist(), node_starts.tolist(), node_counts.tolist())
+    ]
+    return {
+        "version": 1,
+        "points": int(n),
+        "offset": lo.tolist(),
+        "size": size,
+        "baseCells": base,
+        "levels": nodes[-1]["level"] + 1 if nodes else 0,
+        "recordBytes": RECORD.itemsize,
+        "recordLayout": "float32 x,y,z (relative to offset) + uint8 r,g,b,a",
+        "nodes": nodes,
+    }
+
+def build_lod(filename: str) -> dict:
+    """Build (or return the existing) LOD layout for a stored PLY. Blocking."""
+    out = _lod_dir(filename)
+    with _build_locks(filename):
+        meta = load_meta(filename)
+        if meta is not None:
+            return meta
+        out.mkdir(parents=True, exist_ok=True)
+        # unique per process: a pool worker and a lazy request may build at once
+        suffix = f"{os.getpid()}.{threading.get_ident()}.part"
+        tmp = out / f".build.{suffix}"
+        tmp.mkdir()
+        try:
+            meta = _build(read_vertices(local_path(filename)), tmp, out / f".points.bin.{suffix}")
+            os.replace(out / f".points.bin.{suffix}", out / "points.bin")
+            (out / f".meta.json.{suffix}").write_text(json.dumps(meta))
+            os.replace(out / f".meta.json.{suffix}", out / "meta.json")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            (out / f".points.bin.{suffix}").unlink(missing_ok=True)
+        return meta
+
+def read_node(filename: str, node: dict) -> bytes:
+    with open(_lod_dir(filename) / "points.bin", "rb") as f:
+        return os.pread(f.fileno(), node["count"] * RECORD.itemsize, node["start"] * RECORD.itemsize)
+
+def iter_frames(filename: str, meta: dict, max_level: Optional[int] = None) -> Iterator[bytes]:
+    """Nodes coarse-to-fine as `FRAME_HEADER + records` frames. Blocking."""
+    with open(_lod_dir(filename) / "points.bin", "rb") as f:
+        for index, node in enumerate(meta["nodes"]):
+            if max_level is not None and node["level"] > max_level:
+                break
+            payload = os.pread(f.fileno(), node["count"] * RECORD.itemsize, node["start"] * RECORD.itemsize)
+            yield FRAME_HEADER.pack(index, node["count"]) + payload
+
+def _remember_failure(filename: str, task: asyncio.Task) -> None:
+    _pending.pop(filename, None)
+    if not task.cancelled() and task.exception() is not None:
+        _failures.put(filename, str(task.exception()))
+
+async def _load(filename: str) -> Optional[tuple[dict, dict]]:
+    cached = _metas.get(filename)
+    if cached is None:
+        meta = await run_in_threadpool(load_meta, filename)
+        if meta is None:
+            return None
+        cached = (meta, {n["id"]: i for i, n in enumerate(meta["nodes"])})
+        _metas.put(filename, cached)
+    return cached
+
+async def get_meta(filename: str) -> Optional[dict]:
+    """LOD metadata, or None while the layout is still being built."""
+    cached = await _load(filename)
+    if cached is not None:
+        return cached[0]
+    failure = _failures.get(filename)
+    if failure is not None:
+        raise HTTPException(status_code=422, detail=f"Cannot read point cloud: {failure}")
+    if filename not in _pending:
+        task = asyncio.create_task(run_in_threadpool(build_lod, filename))
+        task.add_done_callback(lambda t: _remember_failure(filename, t))
+        _pending[filename] = task
+    return None
+
+async def get_node(filename: str, node_id: str) -> bytes:
+    cached = await _load(filename)
+    if cached is None:
+        raise HTTPException(status_code=409, detail="Level-of-detail data is not built yet")
+    meta, index = cached
+    if node_id not in index:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return await run_in_threadpool(read_node, filename, meta["nodes"][index[node_id]])
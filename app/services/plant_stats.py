@@ -0,0 +1,244 @@
+# app/services/plant_stats.py
+# Per-bed plant statistics from a spatial-map point cloud.
+#
+# 1. clip: points outside the bed polygon are dropped (bbox test, then an
+#    even-odd point-in-polygon test, both vectorised over 2M-point chunks of
+#    the memory-mapped PLY)
+# 2. grid: the remaining points are binned into a 2D grid over the bed,
+#    keeping the highest and lowest z per cell
+# 3. ground: a plane fitted to the lowest per-cell z (bare soil between plants)
+# 4. segment: cells whose canopy height (max z - ground) clears MIN_HEIGHT
+#    form the canopy mask; its 8-connected components (scipy.ndimage.label)
+#    are the plants
+#
+# PLY coordinates are taken as lon/lat degrees if they fall on the bed,
+# otherwise as metres east/north of the bed's south-west corner (the rover's
+# frame). z is metres in both cases.
+#
+# Results are cached per (file hash, bed geometry) under cache_dir/stats, and
+# concurrent requests for the same pair share one computation.
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from fastapi import HTTPException
+from scipy import ndimage
+from app.db.mongo import get_db
+from app.models.plant_stats import PlantStats, PlantStatsSummary
+from app.services import events, processing
+from app.services.bed_index import ring_bbox
+from app.services.storage import local_path
+from app.utils.files import derived_dir
+from app.utils.geo import points_in_polygon, to_local
+from app.utils.ply import PlyError, read_vertices
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1            # bump when the algorithm changes; old cache entries are ignored
+CELL_SIZE = 0.05       # m, finest grid cell
+MIN_POINTS_PER_CELL = 4
+MAX_CELLS = 20_000_000
+GROUND_SAMPLE = 200_000  # cells used for the ground fit
+MIN_HEIGHT = 0.05      # m above ground to count as canopy
+MIN_PLANT_AREA = 0.01  # m²
+HIST_BINS = 10
+_CHUNK = 2_000_000
+_EIGHT = np.ones((3, 3), bool)
+
+_pending: dict = {}
+
+def _geometry_key(coordinates: list) -> str:
+    return hashlib.sha1(json.dumps(coordinates, separators=(",", ":")).encode()).hexdigest()[:16]
+
+def _cache_path(filename: str, coordinates: list) -> Path:
+    return derived_dir("stats", filename) / f"v{VERSION}-{_geometry_key(coordinates)}.json"
+
+def _frame(vertices: np.ndarray, bbox: list) -> str:
+    sample = vertices[:: max(1, len(vertices) // 100_000)]
+    xs, ys = np.asarray(sample["x"], np.float64), np.asarray(sample["y"], np.float64)
+    if not len(xs) or np.abs(xs).max() > 180 or np.abs(ys).max() > 90:
+        return "local"
+    pad_x, pad_y = (bbox[2] - bbox[0]) / 2, (bbox[3] - bbox[1]) / 2
+    on_bed = (xs.max() >= bbox[0] - pad_x) & (xs.min() <= bbox[2] + pad_x) & (ys.max() >= bbox[1] - pad_y) & (ys.min() <= bbox[3] + pad_y)
+    return "lonlat" if on_bed else "local"
+
+def _distribution(values: np.ndarray) -> Optional[dict]:
+    if not values.size:
+        return None
+    counts, edges = np.histogram(values, bins=HIST_BINS)
+    p10, median, p90 = np.percentile(values, [10, 50, 90])
+    return {
+        "min": float(values.min()), "p10": float(p10), "median": float(median), "mean": float(values.mean()),
+        "p90": float(p90), "max": float(values.max()),
+        "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+    }
+
+def _ground(zmin: np.ndarray) -> np.ndarray:
+    """Ground height per cell: a plane fitted to the lower envelope of per-cell minimum z."""
+    gy, gx = np.nonzero(np.isfinite(zmin))
+    if gy.size == 0:
+        return np.zeros_like(zmin)
+    if gy.size > GROUND_SAMPLE:
+        pick = np.random.default_rng(0).choice(gy.size, GROUND_SAMPLE, replace=False)
+        gy, gx = gy[pick], gx[pick]
+    z = zmin[gy, gx].astype(np.float64)
+    a = np.column_stack([gx, gy, np.ones(gy.size)])
+    coef = np.array([0.0, 0.0, float(np.percentile(z, 5))])
+    keep = np.ones(gy.size, bool)
+    for _ in range(4):
+        if keep.sum() < 3:
+            break
+        coef = np.linalg.lstsq(a[keep], z[keep], rcond=None)[0]
+        resid = z - a @ coef
+        # bare-ground cells sit in a tight band at the bottom; plant cells (no
+        # ground under the canopy) sit well above it
+        low = resid[resid <= np.percentile(resid, 25)]
+        spread = np.median(np.abs(low - np.median(low)))
+        keep = resid <= np.median(low) + 3 * spread + 1e-3
+    iy, ix = np.mgrid[0:zmin.shape[0], 0:zmin.shape[1]]
+    return (coef[0] * ix + coef[1] * iy + coef[2]).astype(zmin.dtype)
+
+def compute_stats(filename: str, coordinates: list) -> dict:
+    """PlantStats for one stored PLY clipped to a bed polygon, cached on disk. Blocking."""
+    cache = _cache_path(filename, coordinates)
+    if cache.exists():
+        return json.loads(cache.read_text())
+
+    vertices = read_vertices(local_path(filename))
+    n = len(vertices)
+    bbox = ring_bbox(coordinates)
+    origin = (bbox[0], bbox[1])
+    rings = [np.column_stack(to_local(np.asarray(r)[:, 0], np.asarray(r)[:, 1], origin)) for r in coordinates]
+    width, depth = (float(v) for v in to_local(bbox[2], bbox[3], origin))
+    frame = _frame(vertices, bbox) if n else "local"
+
+    # cells at least CELL_SIZE, coarse enough to hold a few points each
+    area = max(width * depth, 1e-6)
+    cell = max(CELL_SIZE, math.sqrt(MIN_POINTS_PER_CELL * area / max(n, 1)))
+    while (width / cell + 1) * (depth / cell + 1) > MAX_CELLS:
+        cell *= 2
+    nx, ny = int(width / cell) + 1, int(depth / cell) + 1
+    zmax = np.full(nx * ny, -np.inf, np.float32)
+    zmin = np.full(nx * ny, np.inf, np.float32)
+
+    inside = 0
+    for start in range(0, n, _CHUNK):
+        block = vertices[start:start + _CHUNK]
+        x, y = np.asarray(block["x"], np.float64), np.asarray(block["y"], np.float64)
+        z = np.asarray(block["z"], np.float32)
+        if frame == "lonlat":
+            x, y = to_local(x, y, origin)
+        keep = np.flatnonzero((x >= 0) & (x <= width) & (y >= 0) & (y <= depth))
+        keep = keep[points_in_polygon(x[keep], y[keep], rings, chunk=65_536)]
+        inside += keep.size
+        flat = (y[keep] / cell).astype(np.int64) * nx + (x[keep] / cell).astype(np.int64)
+        np.maximum.at(zmax, flat, z[keep])
+        np.minimum.at(zmin, flat, z[keep])
+
+    zmax, zmin = zmax.reshape(ny, nx), zmin.reshape(ny, nx)
+    occupied = np.isfinite(zmax)
+    chm = np.where(occupied, zmax - _ground(zmin), 0).clip(min=0)
+
+    # cells with no points at all inside a canopy are sampling gaps, not soil
+    mask = chm > MIN_HEIGHT
+    mask |= ~occupied & (ndimage.convolve(mask.view(np.uint8), _EIGHT.view(np.uint8), mode="constant") >= 5)
+    labels, found = ndimage.label(mask, structure=_EIGHT)
+    flat_labels = labels.ravel()
+    cells = np.bincount(flat_labels, minlength=found + 1)
+    plant_ids = np.flatnonzero(cells * cell * cell >= MIN_PLANT_AREA)
+    plant_ids = plant_ids[plant_ids > 0]
+
+    cell_area = cell * cell
+    volume = np.bincount(flat_labels, weights=chm.ravel(), minlength=found + 1)[plant_ids] * cell_area
+    height = np.asarray(ndimage.maximum(chm, labels, plant_ids), np.float64).reshape(-1) if plant_ids.size else np.zeros(0)
+    iy, ix = np.indices(labels.shape)
+    cx = np.bincount(flat_labels, weights=ix.ravel(), minlength=found + 1)[plant_ids] / cells[plant_ids]
+    cy = np.bincount(flat_labels, weights=iy.ravel(), minlength=found + 1)[plant_ids] / cells[plant_ids]
+
+    stats = PlantStats(
+        count=int(plant_ids.size),
+        totalVolume=float(volume.sum()),
+        averageVolume=float(volume.mean()) if volume.size else None,
+        height=_distribution(height),
+        volume=_distribution(volume),
+        frame=frame,
+        cellSize=cell,
+        totalPoints=n,
+        bedPoints=int(inside),
+        plants=[
+            {"x": float((px + 0.5) * cell), "y": float((py + 0.5) * cell), "height": float(h),
+             "area": float(cells[i] * cell_area), "volume": float(v)}
+            for i, px, py, h, v in zip(plant_ids, cx, cy, height, volume)
+        ],
+    ).model_dump()
+
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_name(f".{cache.name}.{os.getpid()}.part")
+    tmp.write_text(json.dumps(stats))
+    os.replace(tmp, cache)
+    return stats
+
+async def _compute(filename: str, coordinates: list) -> dict:
+    key = (filename, _geometry_key(coordinates))
+    future = _pending.get(key)
+    if future is None:
+        future = asyncio.ensure_future(processing.run_in_pool(compute_stats, filename, coordinates))
+        _pending[key] = future
+        future.add_done_callback(lambda _: _pending.pop(key, None))
+    try:
+        return await asyncio.shield(future)
+    except (PlyError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Cannot read point cloud: {e}")
+
+_BED_STATS = ("count", "averageVolume", "statsMapId", "statsDate")
+
+async def map_stats(plot_id: str, bed_id: str, map_id: str) -> dict:
+    """Compute (or fetch) a map's plant stats and store the summary on the map and bed."""
+    db = get_db()
+    item = await db.spatial_maps.find_one({"plot_id": plot_id, "bed_id": bed_id, "id": map_id}, {"_id": 0, "filename": 1, "date": 1})
+    bed = await db.beds.find_one({"plot_id": plot_id, "id": bed_id}, {"_id": 0, "coordinates": 1})
+    if not item or not bed:
+        raise HTTPException(status_code=404, detail="Spatial map not found")
+    stats = await _compute(item["filename"], bed["coordinates"])
+
+    summary = PlantStatsSummary(**stats).model_dump()
+    res = await db.spatial_maps.update_one({"plot_id": plot_id, "id": map_id}, {"$set": {"stats": summary}})
+    if res.modified_count:
+        events.publish("spatial_map.updated", plot_id, map_id, {"stats": summary}, bedId=bed_id)
+    # the bed reflects its newest analysed scan
+    bed_stats = {"count": summary["count"], "averageVolume": summary["averageVolume"], "statsMapId": map_id, "statsDate": item["date"]}
+    res = await db.beds.update_one(
+        {"plot_id": plot_id, "id": bed_id,
+         "$or": [{"statsDate": {"$exists": False}}, {"statsDate": {"$lte": item["date"]}}]},
+        {"$set": bed_stats},
+    )
+    if res.modified_count:
+        events.publish("bed.updated", plot_id, bed_id, bed_stats)
+    return stats
+
+async def refresh_map(map_id: str) -> None:
+    """Post-processing hook; failures are left for the stats endpoint to report."""
+    item = await get_db().spatial_maps.find_one({"id": map_id}, {"_id": 0, "plot_id": 1, "bed_id": 1})
+    if item:
+        try:
+            await map_stats(item["plot_id"], item["bed_id"], map_id)
+        except HTTPException:
+            pass
+        except Exception:
+            # runs detached: nobody else would see it, and the map keeps its old stats
+            logger.exception("Plant stats for spatial map %s failed", map_id)
+
+async def forget_bed_stats(plot_id: str, bed_id: str, map_id: Optional[str] = None) -> None:
+    """Drop stored stats after a bed's polygon changes (all maps) or its source map is deleted."""
+    db = get_db()
+    match = {"plot_id": plot_id, "id": bed_id}
+    if map_id is not None:
+        match["statsMapId"] = map_id
+    else:
+        await db.spatial_maps.update_many({"plot_id": plot_id, "bed_id": bed_id}, {"$unset": {"stats": ""}})
+    await db.beds.update_one(match, {"$unset": {f: "" for f in _BED_STATS}})
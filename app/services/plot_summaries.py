@@ -0,0 +1,118 @@
+# app/services/plot_summaries.py
+# Per-plot dashboard figures kept in `plot_summaries`, one document per plot
+# (`id` = plot id): bed and spatial-map counts, stored bytes (the plot raster
+# plus its maps, as uploaded; shared blobs count once per document) and the
+# newest scan date.
+#
+# Every write path adjusts its plot's summary with a single atomic
+# $inc/$max, so concurrent writers never lose an update. Only removing the
+# newest scan needs a read: latestScan is recomputed and set on the condition
+# that no newer scan was $max'ed in meanwhile. Anything that drifts anyway
+# (crashes between the write and the summary update, data from before
+# summaries existed) is repaired by rebuild(), see app.scripts.rebuild_summaries.
+from datetime import datetime
+from typing import Iterable, Optional
+from pymongo import ReplaceOne
+from app.db.mongo import get_db
+from app.utils.pagination import Order, Page, keyset, page_of
+
+async def on_plot_created(plot: dict) -> None:
+    await get_db().plot_summaries.update_one(
+        {"id": plot["id"]},
+        {"$setOnInsert": {"name": plot["name"], "createdAt": plot["createdAt"]},
+         "$inc": {"beds": 0, "spatialMaps": 0, "bytes": plot.get("bytes") or 0}},
+        upsert=True,
+    )
+
+async def on_plot_deleted(plot_id: str) -> None:
+    await get_db().plot_summaries.delete_one({"id": plot_id})
+
+async def on_bed_created(plot_id: str) -> None:
+    await get_db().plot_summaries.update_one({"id": plot_id}, {"$inc": {"beds": 1}})
+
+async def on_map_added(plot_id: str, item: dict) -> None:
+    await get_db().plot_summaries.update_one(
+        {"id": plot_id},
+        {"$inc": {"spatialMaps": 1, "bytes": item.get("bytes") or 0}, "$max": {"latestScan": item["date"]}},
+    )
+
+async def on_maps_removed(plot_id: str, maps: Iterable[dict], beds: int = 0) -> None:
+    """Account for deleted spatial maps (each with `bytes` and `date`) and beds."""
+    maps = list(maps)
+    if not maps and not beds:
+        return
+    db = get_db()
+    before = await db.plot_summaries.find_one_and_update(
+        {"id": plot_id},
+        {"$inc": {"beds": -beds, "spatialMaps": -len(maps), "bytes": -sum(m.get("bytes") or 0 for m in maps)}},
+        projection={"_id": 0, "latestScan": 1},
+    )
+    latest = before and before.get("latestScan")
+    if latest is None or not any(m.get("date") == latest for m in maps):
+        return
+    newest = await db.spatial_maps.find({"plot_id": plot_id}, {"_id": 0, "date": 1}).sort("date", -1).limit(1).to_list(1)
+    # a scan added meanwhile has already raised latestScan past `latest`;
+    # without scans the field is absent, so the next $max simply sets it
+    update = {"$set": {"latestScan": newest[0]["date"]}} if newest else {"$unset": {"latestScan": ""}}
+    await db.plot_summaries.update_one({"id": plot_id, "latestScan": latest}, update)
+
+async def list_summaries(limit: Optional[int] = None, cursor: Optional[str] = None, order: Order = "desc") -> Page:
+    ks = keyset(("createdAt", "id"), order, cursor)
+    query = get_db().plot_summaries.find(ks.filter(), {"_id": 0}).sort(ks.sort())
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return page_of(await query.to_list(None), ks, limit)
+
+def _first(path: str, default):
+    return {"$ifNull": [{"$arrayElemAt": [path, 0]}, default]}
+
+def _pipeline(match: dict) -> list:
+    return [
+        {"$match": match},
+        {"$lookup": {"from": "beds", "localField": "id", "foreignField": "plot_id",
+                     "pipeline": [{"$count": "n"}], "as": "bedCount"}},
+        {"$lookup": {"from": "spatial_maps", "localField": "id", "foreignField": "plot_id",
+                     "pipeline": [{"$group": {"_id": None, "n": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$bytes", 0]}},
+                                              "latest": {"$max": "$date"}}}],
+                     "as": "mapTotals"}},
+        {"$project": {
+            "_id": 0, "id": 1, "name": 1, "createdAt": 1,
+            "beds": _first("$bedCount.n", 0),
+            "spatialMaps": _first("$mapTotals.n", 0),
+            "bytes": {"$add": [{"$ifNull": ["$bytes", 0]}, _first("$mapTotals.bytes", 0)]},
+            "latestScan": {"$arrayElemAt": ["$mapTotals.latest", 0]},
+        }},
+    ]
+
+async def rebuild(plot_id: Optional[str] = None) -> tuple[int, int]:
+    """Recompute summaries from plots/beds/spatial_maps; returns (written, removed).
+
+    Writes racing a rebuild of the same plot can be overwritten; rebuild again
+    (or per plot) if the API was busy.
+    """
+    db = get_db()
+    match = {"id": plot_id} if plot_id else {}
+    written = 0
+    batch = []
+    async for doc in db.plots.aggregate(_pipeline(match)):
+        batch.append(ReplaceOne({"id": doc["id"]}, {**doc, "rebuiltAt": datetime.utcnow()}, upsert=True))
+        if len(batch) >= 500:
+            await db.plot_summaries.bulk_write(batch, ordered=False)
+            written, batch = written + len(batch), []
+    if batch:
+        await db.plot_summaries.bulk_write(batch, ordered=False)
+        written += len(batch)
+    removed = 0
+    if plot_id is None:
+        live = set(await db.plots.distinct("id"))
+        stale = [d["id"] async for d in db.plot_summaries.find({}, {"_id": 0, "id": 1}) if d["id"] not in live]
+        if stale:
+            removed = (await db.plot_summaries.delete_many({"id": {"$in": stale}})).deleted_count
+    elif not written:
+        removed = (await db.plot_summaries.delete_many({"id": plot_id})).deleted_count
+    return written, removed
+
+async def init_summary_indexes() -> None:
+    db = get_db()
+    await db.plot_summaries.create_index("id", unique=True)
+    await db.plot_summaries.create_index([("createdAt", -1), ("id", -1)])
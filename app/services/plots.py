@@ -1,65 +1,126 @@
 from datetime import datetime
-from fastapi import UploadFile
+from pathlib import Path
+from uuid import uuid4
+from fastapi import BackgroundTasks, UploadFile
 from fastapi import HTTPException, status
 from app.core.config import settings
 from app.db.mongo import get_db
-from app.utils.files import save_upload, delete_file
+from app.utils.files import StoredFile, ensure_ext, UploadTooLarge
+from app.services.blobs import store_upload, release, init_blob_indexes
 from app.models.plot import PlotInDB
-from typing import List, Optional
+from app.services import bed_index, events, file_gc, plot_summaries, processing, tiles, uploads
+from app.services.beds import init_bed_indexes
+from app.services.storage import get_storage
+from app.services.rover import init_rover_indexes
+from app.utils.metrics import UPLOAD_BYTES
+from app.utils.pagination import Order, Page, keyset, page_of
+from typing import Optional
 from starlette.requests import Request
 
-def file_url(request: Request, filename: str) -> str:
+def _public_base(request: Request) -> str:
     if settings.backend_public_url:
-        base = str(settings.backend_public_url).rstrip("/")
-        return f"{base}/files/{filename}"
-    base = str(request.base_url).rstrip("/")
-    return f"{base}/files/{filename}"
+        return str(settings.backend_public_url).rstrip("/")
+    return str(request.base_url).rstrip("/")
+
+def file_url(request: Request, filename: str) -> str:
+    # presigned straight to the bucket with S3 storage
+    return get_storage().download_url(filename) or f"{_public_base(request)}/files/{filename}"
+
+def thumbnail_url(request: Request, plot_id: str) -> str:
+    return f"{_public_base(request)}/plots/{plot_id}/thumbnail.png"
+
+PLOT_FIELDS = ("id", "name", "url", "thumbnailUrl", "createdAt", "status", "metadata")
 
-async def list_plots(request) -> List[dict]:
+def _plot_out(request: Request, doc: dict, fields: Optional[set] = None) -> dict:
+    out = {"id": doc["id"]}
+    if fields is None or "name" in fields:
+        out["name"] = doc["name"]
+    if fields is None or "url" in fields:
+        out["url"] = file_url(request, doc["filename"])
+    if fields is None or "thumbnailUrl" in fields:
+        out["thumbnailUrl"] = thumbnail_url(request, doc["id"])
+    if fields is None or "createdAt" in fields:
+        out["createdAt"] = doc.get("createdAt")
+    if fields is None or "status" in fields:
+        out["status"] = doc.get("status")
+    if fields is None or "metadata" in fields:
+        out["metadata"] = doc.get("metadata")
+    if fields is not None and "id" not in fields:
+        del out["id"]
+    return out
+
+async def list_plots(request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                     fields: Optional[set] = None, order: Order = "desc") -> Page:
     db = get_db()
-    items = []
-    cursor = db.plots.find({}, {"_id": 0})
-    async for doc in cursor:
-        items.append({
-            "id": doc["id"],
-            "name": doc["name"],
-            "url": file_url(request, doc["filename"]),
-            "createdAt": doc.get("createdAt")
-        })
-    return items
+    ks = keyset(("createdAt", "id"), order, cursor)
+    projection = {"_id": 0, "id": 1, "createdAt": 1}
+    if fields is None or "name" in fields:
+        projection["name"] = 1
+    if fields is None or "url" in fields:
+        projection["filename"] = 1
+    for name in ("status", "metadata"):
+        if fields is None or name in fields:
+            projection[name] = 1
+    query = db.plots.find(ks.filter(), projection).sort(ks.sort())
+    if limit is not None:
+        query = query.limit(limit + 1)
+    page = page_of(await query.to_list(None), ks, limit)
+    page.items = [_plot_out(request, doc, fields) for doc in page.items]
+    return page
 
-async def create_plot(file: UploadFile, request) -> dict:
+async def create_plot(file: UploadFile, request, background_tasks: Optional[BackgroundTasks] = None) -> dict:
     max_bytes = settings.max_upload_mb * 1024 * 1024
-    await _enforce_size(file, max_bytes)
     try:
-        plot_id, filename, name = save_upload(settings.files_dir, file)
+        ext = ensure_ext(file.filename or "")
     except ValueError:
         raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Only .tif/.tiff allowed")
+    try:
+        stored = await store_upload(file, ext, max_bytes)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    UPLOAD_BYTES.labels("plot").inc(stored.bytes)
+    return await register_plot(stored, file.filename, request, background_tasks)
+
+async def register_plot(stored: StoredFile, file_name: str, request, background_tasks: Optional[BackgroundTasks] = None) -> dict:
+    """Create the plot for an already stored raster (holding one blob reference)."""
     db = get_db()
-    doc = PlotInDB(id=plot_id, name=name, filename=filename, createdAt=datetime.utcnow()).model_dump()
-    await db.plots.insert_one(doc)
-    return {"id": doc["id"], "name": doc["name"], "url": file_url(request, doc["filename"]), "createdAt": doc["createdAt"]}
+    doc = PlotInDB(id=uuid4().hex, name=Path(file_name).stem, filename=stored.filename, bytes=stored.bytes, sha256=stored.sha256, createdAt=datetime.utcnow()).model_dump()
+    try:
+        await db.plots.insert_one(doc)
+    except Exception:
+        await release(stored.filename)
+        raise
+    await plot_summaries.on_plot_created(doc)
+    events.publish("plot.created", doc["id"], doc["id"], doc)
+    if background_tasks is not None:
+        # metadata, overview pyramid + thumbnail; tiles fall back to building lazily
+        background_tasks.add_task(processing.process_plot, doc["id"], doc["filename"])
+    return _plot_out(request, doc)
 
 async def delete_plot(plot_id: str) -> None:
     db = get_db()
-    found = await db.plots.find_one({"id": plot_id})
+    found = await db.plots.find_one({"id": plot_id}, {"_id": 0, "filename": 1})
     if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     await db.plots.delete_one({"id": plot_id})
-    delete_file(settings.files_dir, found["filename"])
+    await plot_summaries.on_plot_deleted(plot_id)
+    events.publish("plot.deleted", plot_id, plot_id)
+    tiles.forget_plot(plot_id)
+    bed_index.on_plot_deleted(plot_id)
+    maps = await db.spatial_maps.find({"plot_id": plot_id}, {"_id": 0, "filename": 1}).to_list(None)
+    await db.spatial_maps.delete_many({"plot_id": plot_id})
+    await db.beds.delete_many({"plot_id": plot_id})
+    await release(found["filename"])
+    for m in maps:
+        await release(m["filename"])
 
 async def init_indexes() -> None:
     db = get_db()
     await db.plots.create_index("id", unique=True)
-    await db.plots.create_index([("createdAt", -1)])
-
-async def _enforce_size(file: UploadFile, max_bytes: int) -> None:
-    pos = 0
-    chunk = await file.read(1024 * 1024)
-    while chunk:
-        pos += len(chunk)
-        if pos > max_bytes:
-            await file.close()
-            raise HTTPException(status_code=413, detail="File too large")
-        chunk = await file.read(1024 * 1024)
-    await file.seek(0)
+    await db.plots.create_index([("createdAt", -1), ("id", -1)])
+    await init_bed_indexes()
+    await init_blob_indexes()
+    await file_gc.init_gc_indexes()
+    await init_rover_indexes()
+    await uploads.init_upload_indexes()
+    await plot_summaries.init_summary_indexes()
@@ -0,0 +1,162 @@
+# app/services/ply_normalize.py
+# Compact transfer copies of uploaded point clouds.
+#
+# The stored upload stays byte-for-byte as received; next to it we write
+# <hash>.min.ply: binary little-endian, x/y/z plus 8-bit red/green/blue only,
+# every other property dropped. Positions are snapped to a power-of-two grid
+# (extent / 2**ply_quant_bits), so they are exact float32 values whenever the
+# magnitudes allow it (float64 otherwise, e.g. lon/lat degrees) and their low
+# mantissa bits are zero, which the compressors below exploit.
+#
+# Whichever file clients are sent (the .min.ply, or the original if that is
+# not larger) also gets .gz and .br siblings; /files picks one by
+# Accept-Encoding. Everything is named after the blob hash and removed with
+# it by file_gc.
+import math
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from app.core.config import settings
+from app.services.storage import get_storage, local_path
+from app.utils.ply import colors, read_header, read_vertices
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without it
+    brotli = None
+
+OPT_SUFFIX = ".min.ply"
+BROTLI_QUALITY = 5  # ~the speed of gzip -6 and noticeably smaller
+GZIP_LEVEL = 6
+_CHUNK = 1_000_000
+_IO_CHUNK = 4 * 1024 * 1024
+
+def optimized_name(filename: str) -> str:
+    return Path(filename).stem + OPT_SUFFIX
+
+def _tmp(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+
+def _grid(vertices: np.ndarray) -> tuple[Optional[float], str]:
+    """(quantization step, position dtype) for a cloud."""
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for start in range(0, len(vertices), _CHUNK):
+        block = vertices[start:start + _CHUNK]
+        xyz = np.column_stack([block["x"], block["y"], block["z"]])
+        lo, hi = np.minimum(lo, xyz.min(axis=0)), np.maximum(hi, xyz.max(axis=0))
+    extent = float((hi - lo).max()) if len(vertices) else 0.0
+    if not extent > 0 or not math.isfinite(extent):
+        return None, "<f4" if vertices.dtype["x"].itemsize <= 4 else "<f8"
+    step = 2.0 ** math.floor(math.log2(extent / 2 ** settings.ply_quant_bits))
+    magnitude = float(np.abs(np.concatenate([lo, hi])).max())
+    return step, "<f4" if magnitude / step < 2 ** 24 else "<f8"
+
+def _write_compact(src: Path, dst: Path) -> None:
+    header = read_header(src)
+    vertices = read_vertices(src, header)
+    step, ptype = _grid(vertices)
+    has_color = colors(vertices[:0]) is not None
+    fields = [("x", ptype), ("y", ptype), ("z", ptype)]
+    if has_color:
+        fields += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    dtype = np.dtype(fields)
+    kind = "float" if ptype == "<f4" else "double"
+    lines = ["ply", "format binary_little_endian 1.0"]
+    lines += [f"comment {c}" for c in header.comments]
+    if step is not None:
+        lines.append(f"comment quantization step {step!r}")
+    lines += [f"element vertex {len(vertices)}"] + [f"property {kind} {a}" for a in "xyz"]
+    if has_color:
+        lines += [f"property uchar {c}" for c in ("red", "green", "blue")]
+    lines.append("end_header")
+
+    tmp = _tmp(dst)
+    try:
+        with open(tmp, "wb") as out:
+            out.write(("\n".join(lines) + "\n").encode("ascii"))
+            for start in range(0, len(vertices), _CHUNK):
+                block = vertices[start:start + _CHUNK]
+                rec = np.empty(len(block), dtype)
+                for axis in "xyz":
+                    v = np.asarray(block[axis], np.float64)
+                    rec[axis] = np.round(v / step) * step if step is not None else v
+                if has_color:
+                    rgb = colors(block)
+                    rec["red"], rec["green"], rec["blue"] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+                rec.tofile(out)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def _encoders():
+    # (Content-Encoding, suffix, factory of (feed, finish)); wbits=31 is the
+    # gzip container with a zero mtime, so reruns produce identical bytes
+    def gz():
+        z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return z.compress, z.flush
+    def br():
+        b = brotli.Compressor(quality=BROTLI_QUALITY)
+        return b.process, b.finish
+    return [("gzip", ".gz", gz)] + ([("br", ".br", br)] if brotli is not None else [])
+
+def _precompress(path: Path) -> dict:
+    """Write .gz/.br siblings of path; returns {encoding: bytes} for those kept."""
+    size = path.stat().st_size
+    written = {}
+    for encoding, suffix, make in _encoders():
+        dst = path.with_name(path.name + suffix)
+        if dst.exists():
+            written[encoding] = dst.stat().st_size
+            continue
+        tmp = _tmp(dst)
+        feed, finish = make()
+        try:
+            with open(path, "rb") as src, open(tmp, "wb") as out:
+                while chunk := src.read(_IO_CHUNK):
+                    out.write(feed(chunk))
+                out.write(finish())
+            compressed = tmp.stat().st_size
+            # not worth a Content-Encoding round trip unless it saves something
+            if compressed < size * 0.95:
+                os.replace(tmp, dst)
+                written[encoding] = compressed
+            else:
+                tmp.unlink()
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    return written
+
+def normalize(filename: str) -> dict:
+    """Write the compact copy and compressed siblings of a stored PLY. Blocking.
+
+    Returns the spatial-map fields describing them; `optimizedFilename` is
+    only set when the compact copy is actually smaller than the upload.
+    """
+    src = local_path(filename)
+    dst = src.with_name(optimized_name(filename))
+    if not dst.exists():
+        _write_compact(src, dst)
+    optimized = dst.stat().st_size
+    if optimized < src.stat().st_size:
+        served = dst
+    else:
+        dst.unlink()
+        served = src
+    compressed = _precompress(served)
+    # no-op for local storage; uploaded next to the original for S3
+    store = get_storage()
+    if served is dst:
+        store.publish(dst)
+    for encoding, suffix, _ in _encoders():
+        if encoding in compressed:
+            store.publish(served.with_name(served.name + suffix))
+    return {
+        "optimizedFilename": served.name if served is dst else None,
+        "optimizedBytes": optimized if served is dst else None,
+        "compressedBytes": compressed or None,
+    }
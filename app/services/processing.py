@@ -0,0 +1,153 @@
+# app/services/processing.py
+# Post-upload processing. Uploads are stored and answered with status
+# "pending"; the CPU-heavy work (metadata extraction, overview pyramid,
+# thumbnail, LOD octree) then runs in a process pool so it neither blocks the
+# event loop nor competes for the GIL, and the result is written back onto the
+# plot / spatial map document as `metadata` plus status "ready" or "failed".
+#
+# The job functions are module-level, take only a stored filename and return
+# the document fields to set, so they pickle cheaply and are safe to run
+# twice: every derived artifact is keyed by content hash and written with an
+# atomic rename.
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Optional
+import numpy as np
+import rasterio
+from rasterio.warp import transform_bounds
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.models.processing import PointCloudMetadata, RasterMetadata
+from app.services import events, lod, plant_stats, ply_normalize, tiles
+from app.services.storage import local_path
+from app.utils.ply import read_header, read_vertices
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1_000_000
+_executor: Optional[ProcessPoolExecutor] = None
+_detached: set = set()
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forked children would inherit the Motor client and loop threads
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.processing_workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def raster_metadata(filename: str) -> dict:
+    with rasterio.open(local_path(filename)) as src:
+        wgs84 = None
+        if src.crs is not None:
+            wgs84 = list(transform_bounds(src.crs, "EPSG:4326", *src.bounds))
+        return RasterMetadata(
+            crs=src.crs.to_string() if src.crs else None,
+            width=src.width, height=src.height, bands=src.count, dtype=src.dtypes[0],
+            resolution=list(src.res), bounds=list(src.bounds), boundsWgs84=wgs84,
+        ).model_dump()
+
+def point_cloud_metadata(filename: str) -> dict:
+    path = local_path(filename)
+    header = read_header(path)
+    vertices = read_vertices(path, header)
+    n = len(vertices)
+    names = vertices.dtype.names or ()
+    meta = PointCloudMetadata(
+        format=header.format, vertexCount=n,
+        hasColor=any(c in names for c in ("red", "r", "diffuse_red")),
+    )
+    if n:
+        lo = np.full(3, np.inf)
+        hi = np.full(3, -np.inf)
+        # chunked so a memory-mapped cloud is never copied whole
+        for start in range(0, n, _CHUNK):
+            block = vertices[start:start + _CHUNK]
+            xyz = np.column_stack([block["x"], block["y"], block["z"]])
+            lo = np.minimum(lo, xyz.min(axis=0))
+            hi = np.maximum(hi, xyz.max(axis=0))
+        meta.bboxMin, meta.bboxMax = lo.tolist(), hi.tolist()
+        area = float((hi[0] - lo[0]) * (hi[1] - lo[1]))
+        meta.density = n / area if area > 0 else None
+    return meta.model_dump()
+
+def plot_job(filename: str) -> dict:
+    """Runs in a pool process: metadata, then overview pyramid + thumbnail."""
+    metadata = raster_metadata(filename)
+    if metadata["crs"] is not None:
+        tiles.prepare_plot(filename)
+    return {"metadata": metadata}
+
+def map_job(filename: str) -> dict:
+    """Runs in a pool process: metadata, the LOD layout, then the compact transfer copy."""
+    fields = {"metadata": point_cloud_metadata(filename)}
+    lod.build_lod(filename)
+    if settings.ply_normalize:
+        fields.update(ply_normalize.normalize(filename))
+    return fields
+
+async def run_in_pool(fn: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(_pool(), fn, *args)
+
+async def _process(collection: str, doc_id: str, job: Callable[[str], dict], filename: str) -> bool:
+    global _executor
+    try:
+        fields = await run_in_pool(job, filename)
+        update = {"status": "ready", **fields, "error": None}
+    except BrokenProcessPool as e:
+        # a worker died (e.g. OOM-killed); start a fresh pool for later jobs
+        _executor = None
+        logger.error("Processing pool broke on %s %s (%s)", collection, doc_id, filename)
+        update = {"status": "failed", "error": str(e) or "worker process died"}
+    except Exception as e:
+        logger.exception("Processing %s %s (%s) failed", collection, doc_id, filename)
+        update = {"status": "failed", "error": str(e) or type(e).__name__}
+    update["processedAt"] = datetime.utcnow()
+    # a document deleted meanwhile simply matches nothing
+    doc = await get_db()[collection].find_one_and_update(
+        {"id": doc_id}, {"$set": update}, projection={"_id": 0, "id": 1, "plot_id": 1, "bed_id": 1}
+    )
+    if doc is not None and collection == "plots":
+        events.publish("plot.updated", doc_id, doc_id, update)
+    elif doc is not None:
+        events.publish("spatial_map.updated", doc["plot_id"], doc_id, update, bedId=doc["bed_id"])
+    return update["status"] == "ready"
+
+async def process_plot(plot_id: str, filename: str) -> None:
+    await _process("plots", plot_id, plot_job, filename)
+
+async def process_map(map_id: str, filename: str) -> None:
+    if await _process("spatial_maps", map_id, map_job, filename):
+        await plant_stats.refresh_map(map_id)
+
+def detach(job) -> None:
+    """Run a processing coroutine in the background, referenced until it is done."""
+    task = asyncio.create_task(job)
+    _detached.add(task)
+    task.add_done_callback(_detached.discard)
+
+async def resume_pending() -> None:
+    """Re-queue documents left pending by a process that stopped mid-job."""
+    db = get_db()
+    jobs = []
+    async for doc in db.plots.find({"status": "pending"}, {"_id": 0, "id": 1, "filename": 1}):
+        jobs.append(process_plot(doc["id"], doc["filename"]))
+    async for doc in db.spatial_maps.find({"status": "pending"}, {"_id": 0, "id": 1, "filename": 1}):
+        jobs.append(process_map(doc["id"], doc["filename"]))
+    for job in jobs:
+        detach(job)
+    if jobs:
+        logger.info("Resumed processing of %d pending uploads", len(jobs))
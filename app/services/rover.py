@@ -0,0 +1,271 @@
+# app/services/rover.py
+# Rover data collection jobs. Each request becomes a `rover_jobs` document and
+# a slot in a bounded in-process queue drained by a few asyncio workers.
+#
+# - one active job per bed: a unique partial index on (plot_id, bed_id) where
+#   `active` is set, so a repeated request returns the job already running
+# - backpressure: a full queue answers 429 instead of buffering without limit
+# - progress/heartbeat are written to the job document as the producer reports
+#   them; a finished scan is attached through add_spatial_map like an upload
+#   and processed in the background, outside the rover slot
+# - the queue lives in one process's memory, so every job records its `owner`
+#   process, which refreshes `ownerSeenAt` on all its active jobs every
+#   rover_owner_beat_s. A periodic reaper fails active jobs whose owner has
+#   stopped vouching for them (crash, restart, shutdown) and running jobs
+#   without progress for rover_job_stale_s, which frees their beds
+import asyncio
+import logging
+import math
+import os
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Protocol
+from uuid import uuid4
+import numpy as np
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, UploadFile
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.models.rover_job import RoverJobInDB
+from app.services import processing
+from app.services.bed_index import ring_bbox
+from app.services.spatial_maps import add_spatial_map
+from app.utils.geo import to_local
+
+logger = logging.getLogger(__name__)
+
+_PROJECTION = {"_id": 0, "active": 0, "heartbeatAt": 0, "owner": 0, "ownerSeenAt": 0}
+_OWNER = uuid4().hex  # this process
+_ABANDONED = "Abandoned (server restarted)"
+
+Progress = Callable[[float, Optional[str]], Awaitable[None]]
+
+class RoverProducer(Protocol):
+    async def collect(self, bed: dict, out_path: Path, progress: Progress) -> None:
+        """Scan `bed` (a beds document) and write the point cloud to out_path as PLY."""
+
+_VERTEX = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+
+class FakeRoverProducer:
+    """Offline stand-in for the rover: drives the bed in `passes` strips and
+    writes a synthetic canopy (binary PLY, metres from the bed's SW corner)."""
+
+    def __init__(self, points: Optional[int] = None, scan_s: Optional[float] = None, passes: int = 10):
+        self.points = settings.rover_fake_points if points is None else points
+        self.scan_s = settings.rover_fake_scan_s if scan_s is None else scan_s
+        self.passes = passes
+
+    def _strip(self, bed: dict, index: int, count: int) -> bytes:
+        min_lon, min_lat, max_lon, max_lat = bed.get("bbox") or ring_bbox(bed["coordinates"])
+        width, depth = (max(float(d), 1.0) for d in to_local(max_lon, max_lat, (min_lon, min_lat)))
+        rng = np.random.default_rng(zlib.crc32(f"{bed['id']}:{index}".encode()))
+        v = np.empty(count, _VERTEX)
+        v["x"] = rng.uniform(0, width, count)
+        v["y"] = rng.uniform(index * depth / self.passes, (index + 1) * depth / self.passes, count)
+        v["z"] = 0.3 + 0.15 * np.sin(v["x"] * 3) * np.cos(v["y"] * 3) + rng.normal(0, 0.02, count)
+        v["red"] = rng.integers(30, 90, count)
+        v["green"] = rng.integers(110, 200, count)
+        v["blue"] = rng.integers(20, 70, count)
+        return v.tobytes()
+
+    async def collect(self, bed: dict, out_path: Path, progress: Progress) -> None:
+        header = (
+            "ply\nformat binary_little_endian 1.0\ncomment synthetic rover scan\n"
+            f"element vertex {self.points}\n"
+            "property float x\nproperty float y\nproperty float z\n"
+            "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n"
+        ).encode()
+        per_pass = math.ceil(self.points / self.passes)
+        with open(out_path, "wb") as f:
+            await run_in_threadpool(f.write, header)
+            for i in range(self.passes):
+                count = min(per_pass, self.points - i * per_pass)
+                if count > 0:
+                    await run_in_threadpool(lambda: f.write(self._strip(bed, i, count)))
+                await asyncio.sleep(self.scan_s / self.passes)
+                await progress((i + 1) / self.passes, f"pass {i + 1}/{self.passes}")
+
+_producer: RoverProducer = FakeRoverProducer()
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+_reaper_task: Optional[asyncio.Task] = None
+
+def set_producer(producer: RoverProducer) -> None:
+    global _producer
+    _producer = producer
+
+async def _finish(job_id: str, status: str, **fields) -> None:
+    now = datetime.utcnow()
+    done = {"progress": 1.0} if status == "succeeded" else {}
+    await get_db().rover_jobs.update_one(
+        {"id": job_id, "active": True},
+        {"$set": {"status": status, "finishedAt": now, "heartbeatAt": now, **done, **fields}, "$unset": {"active": ""}},
+    )
+
+async def _fail_where(query: dict, error: str) -> int:
+    res = await get_db().rover_jobs.update_many(
+        {**query, "active": True},
+        {"$set": {"status": "failed", "error": error, "finishedAt": datetime.utcnow()}, "$unset": {"active": ""}},
+    )
+    return res.modified_count
+
+async def _reap() -> int:
+    """Vouch for this process's jobs, then fail abandoned and hung ones."""
+    db = get_db()
+    now = datetime.utcnow()
+    await db.rover_jobs.update_many({"owner": _OWNER, "active": True}, {"$set": {"ownerSeenAt": now}})
+    orphaned = now - timedelta(seconds=3 * settings.rover_owner_beat_s)
+    failed = await _fail_where(
+        # jobs from before owners were recorded go by their heartbeat alone
+        {"$or": [{"ownerSeenAt": {"$lt": orphaned}}, {"ownerSeenAt": {"$exists": False}, "heartbeatAt": {"$lt": orphaned}}]},
+        _ABANDONED,
+    )
+    hung = now - timedelta(seconds=settings.rover_job_stale_s)
+    failed += await _fail_where({"status": "running", "heartbeatAt": {"$lt": hung}}, "No progress from the rover")
+    return failed
+
+async def _reaper_loop() -> None:
+    while True:
+        try:
+            failed = await _reap()
+            if failed:
+                logger.warning("Marked %d abandoned rover jobs as failed", failed)
+        except Exception:
+            logger.exception("Rover job reaper failed")
+        await asyncio.sleep(settings.rover_owner_beat_s)
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=429, detail="Rover job queue is full, retry later",
+                         headers={"Retry-After": str(max(1, int(settings.rover_fake_scan_s)))})
+
+async def submit_job(plot_id: str, bed_id: str) -> tuple[dict, bool]:
+    """Queue a collection job; returns (job, created). An active job for the bed is returned as is."""
+    if _queue is None:
+        raise HTTPException(status_code=503, detail="Rover workers are not running")
+    db = get_db()
+    if not await db.beds.count_documents({"plot_id": plot_id, "id": bed_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Plot/bed not found")
+    if _queue.full():
+        raise _busy()
+
+    job = RoverJobInDB(id=uuid4().hex, plot_id=plot_id, bed_id=bed_id).model_dump()
+    try:
+        await db.rover_jobs.insert_one({**job, "active": True, "owner": _OWNER, "ownerSeenAt": job["heartbeatAt"]})
+    except DuplicateKeyError:
+        existing = await db.rover_jobs.find_one({"plot_id": plot_id, "bed_id": bed_id, "active": True}, _PROJECTION)
+        if existing is None:
+            raise HTTPException(status_code=409, detail="A job for this bed just finished, retry")
+        return existing, False
+    try:
+        _queue.put_nowait(job["id"])
+    except asyncio.QueueFull:
+        await db.rover_jobs.delete_one({"id": job["id"]})
+        raise _busy()
+    job.pop("heartbeatAt")
+    return job, True
+
+async def get_job(plot_id: str, bed_id: str, job_id: str) -> dict:
+    job = await get_db().rover_jobs.find_one({"id": job_id, "plot_id": plot_id, "bed_id": bed_id}, _PROJECTION)
+    if not job:
+        raise HTTPException(status_code=404, detail="Rover job not found")
+    return job
+
+async def _run(job_id: str) -> None:
+    db = get_db()
+    now = datetime.utcnow()
+    job = await db.rover_jobs.find_one_and_update(
+        {"id": job_id, "status": "queued", "active": True},
+        {"$set": {"status": "running", "startedAt": now, "heartbeatAt": now, "message": "starting"}},
+        projection=_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if job is None:  # failed as stale while it waited
+        return
+    bed = await db.beds.find_one({"plot_id": job["plot_id"], "id": job["bed_id"]}, {"_id": 0, "id": 1, "coordinates": 1, "bbox": 1})
+    if bed is None:
+        await _finish(job_id, "failed", error="Bed was deleted")
+        return
+
+    last_write = 0.0
+
+    async def progress(fraction: float, message: Optional[str] = None) -> None:
+        nonlocal last_write
+        # at most two writes a second; the last one always lands
+        if fraction < 1 and time.monotonic() - last_write < 0.5:
+            return
+        last_write = time.monotonic()
+        await db.rover_jobs.update_one({"id": job_id, "active": True}, {"$set": {
+            "progress": round(0.9 * fraction, 3), "message": message, "heartbeatAt": datetime.utcnow(),
+        }})
+
+    Path(settings.cache_dir).mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=settings.cache_dir, prefix=".rover-", suffix=".ply")
+    os.close(fd)
+    try:
+        await _producer.collect(bed, Path(tmp), progress)
+        await progress(1.0, "attaching")
+        upload = UploadFile(open(tmp, "rb"), filename=f"rover-{job_id}.ply",
+                            headers=Headers({"content-type": "application/octet-stream"}))
+        item = await add_spatial_map(job["plot_id"], job["bed_id"], upload, None)  # closes the upload
+        await _finish(job_id, "succeeded", spatialMapId=item["id"], message=None)
+        # CPU work for the pool; the rover slot is free for the next bed
+        processing.detach(processing.process_map(item["id"], item["filename"]))
+    except asyncio.CancelledError:
+        await _finish(job_id, "failed", error="Interrupted by server shutdown")
+        raise
+    except HTTPException as e:
+        await _finish(job_id, "failed", error=str(e.detail))
+    except Exception as e:
+        logger.exception("Rover job %s failed", job_id)
+        await _finish(job_id, "failed", error=str(e) or type(e).__name__)
+    finally:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Rover worker error on job %s", job_id)
+        finally:
+            _queue.task_done()
+
+async def start_workers() -> None:
+    global _queue, _reaper_task
+    _queue = asyncio.Queue(maxsize=settings.rover_queue_size)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(settings.rover_workers))
+    # the first pass fails what a previous run of this server left behind
+    _reaper_task = asyncio.create_task(_reaper_loop())
+
+async def stop_workers() -> None:
+    global _queue, _reaper_task
+    tasks = _workers + ([_reaper_task] if _reaper_task is not None else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _reaper_task = None
+    # whatever this process still owns (queued, or claimed by a cancelled
+    # worker) would otherwise block its bed until the reaper elsewhere sees it
+    await _fail_where({"owner": _OWNER}, "Interrupted by server shutdown")
+    _queue = None
+
+async def init_rover_indexes() -> None:
+    db = get_db()
+    await db.rover_jobs.create_index("id", unique=True)
+    await db.rover_jobs.create_index(
+        [("plot_id", 1), ("bed_id", 1)], unique=True, partialFilterExpression={"active": True}, name="one_active_job_per_bed"
+    )
+    # finished jobs are kept for a while for the status API, then expire
+    await db.rover_jobs.create_index("finishedAt", expireAfterSeconds=settings.rover_job_retention_days * 86400)
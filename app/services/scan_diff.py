@@ -0,0 +1,142 @@
+# app/services/scan_diff.py
+# Change detection between two spatial maps of the same bed.
+#
+# Both clouds are voxelised onto one dense boolean occupancy grid spanning
+# their joint bounding box (VOXEL_SIZE, coarsened until the grid fits in
+# MAX_VOXELS). Set algebra on the two grids gives the added/removed voxels;
+# the highest occupied voxel of every XY column gives a canopy-height change
+# heatmap. Both scans are assumed to share a coordinate frame, which holds
+# for repeated scans of a bed by the same rover.
+#
+# Results are memoised in an in-process LRU keyed by the two stored file
+# names. Those are content-addressed, so an entry can never describe other
+# bytes and needs no invalidation: a deleted map's entry is unreachable once
+# the map's document is gone and ages out. Every request checks that both
+# maps exist and belong to the plot and bed before it looks at the memo.
+import asyncio
+import base64
+import math
+import numpy as np
+from fastapi import HTTPException
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.services import processing
+from app.services.storage import local_path
+from app.utils.lru import LRUCache
+from app.utils.ply import PlyError, read_vertices
+
+VOXEL_SIZE = 0.05
+MAX_VOXELS = 32_000_000
+MAX_CHANGED_VOXELS = 20_000
+HEATMAP_MAX_SIDE = 256
+_CHUNK = 2_000_000
+
+_memo = LRUCache(settings.scan_diff_cache_entries)
+_pending: dict = {}
+
+def _bounds(vertices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for start in range(0, len(vertices), _CHUNK):
+        block = vertices[start:start + _CHUNK]
+        xyz = np.column_stack([block["x"], block["y"], block["z"]])
+        lo, hi = np.minimum(lo, xyz.min(axis=0)), np.maximum(hi, xyz.max(axis=0))
+    return lo, hi
+
+def _occupancy(vertices: np.ndarray, origin: np.ndarray, voxel: float, shape: tuple) -> np.ndarray:
+    grid = np.zeros(int(np.prod(shape)), bool)
+    dims = np.array(shape)
+    for start in range(0, len(vertices), _CHUNK):
+        block = vertices[start:start + _CHUNK]
+        xyz = np.column_stack([block["x"], block["y"], block["z"]]).astype(np.float64)
+        q = np.minimum(((xyz - origin) / voxel).astype(np.int64), dims - 1)
+        grid[(q[:, 0] * shape[1] + q[:, 1]) * shape[2] + q[:, 2]] = True
+    return grid.reshape(shape)
+
+def _centres(mask: np.ndarray, origin: np.ndarray, voxel: float) -> tuple[list, bool]:
+    idx = np.argwhere(mask)
+    truncated = len(idx) > MAX_CHANGED_VOXELS
+    if truncated:
+        idx = idx[np.linspace(0, len(idx) - 1, MAX_CHANGED_VOXELS).astype(np.int64)]
+    return np.round(origin + (idx + 0.5) * voxel, 4).tolist(), truncated
+
+def _column_heights(grid: np.ndarray, voxel: float) -> np.ndarray:
+    nz = grid.shape[2]
+    top = nz - 1 - np.argmax(grid[:, :, ::-1], axis=2)
+    return np.where(grid.any(axis=2), (top + 1) * voxel, 0.0)
+
+def _heatmap(delta: np.ndarray, origin: np.ndarray, voxel: float) -> dict:
+    # delta is (nx, ny); block-average down to HEATMAP_MAX_SIDE, store row-major by y
+    factor = max(1, math.ceil(max(delta.shape) / HEATMAP_MAX_SIDE))
+    nx, ny = math.ceil(delta.shape[0] / factor), math.ceil(delta.shape[1] / factor)
+    padded = np.zeros((nx * factor, ny * factor))
+    padded[:delta.shape[0], :delta.shape[1]] = delta
+    coarse = padded.reshape(nx, factor, ny, factor).mean(axis=(1, 3)).T
+    peak = float(np.abs(coarse).max())
+    scale = peak / 127 if peak else 1.0
+    data = np.round(coarse / scale).astype(np.int8)
+    return {
+        "width": nx, "height": ny, "cellSize": voxel * factor, "origin": origin[:2].tolist(),
+        "scale": scale, "data": base64.b64encode(data.tobytes()).decode(),
+    }
+
+def diff_files(base_file: str, other_file: str) -> dict:
+    """Voxel diff of two stored PLYs. Blocking; runs in the processing pool."""
+    a = read_vertices(local_path(base_file))
+    b = read_vertices(local_path(other_file))
+    if not len(a) or not len(b):
+        raise PlyError("Point cloud is empty")
+    (alo, ahi), (blo, bhi) = _bounds(a), _bounds(b)
+    origin, extent = np.minimum(alo, blo), np.maximum(ahi, bhi) - np.minimum(alo, blo)
+    voxel = VOXEL_SIZE
+    while np.prod(np.floor(extent / voxel) + 1) > MAX_VOXELS:
+        voxel *= 2
+    shape = tuple(int(v) for v in np.floor(extent / voxel) + 1)
+
+    grid_a = _occupancy(a, origin, voxel, shape)
+    grid_b = _occupancy(b, origin, voxel, shape)
+    added = grid_b & ~grid_a
+    removed = grid_a & ~grid_b
+    n_added, n_removed = int(added.sum()), int(removed.sum())
+    added_at, added_cut = _centres(added, origin, voxel)
+    removed_at, removed_cut = _centres(removed, origin, voxel)
+    cube = voxel ** 3
+    return {
+        "voxelSize": voxel,
+        "origin": origin.tolist(),
+        "shape": list(shape),
+        "baseVoxels": int(grid_a.sum()),
+        "otherVoxels": int(grid_b.sum()),
+        "added": n_added,
+        "removed": n_removed,
+        "unchanged": int((grid_a & grid_b).sum()),
+        "growthVolume": n_added * cube,
+        "lossVolume": n_removed * cube,
+        "netVolume": (n_added - n_removed) * cube,
+        "changed": {"added": added_at, "removed": removed_at, "truncated": added_cut or removed_cut},
+        "heatmap": _heatmap(_column_heights(grid_b, voxel) - _column_heights(grid_a, voxel), origin, voxel),
+    }
+
+async def diff_maps(plot_id: str, bed_id: str, map_id: str, other_id: str) -> dict:
+    if map_id == other_id:
+        raise HTTPException(status_code=422, detail="Cannot diff a spatial map with itself")
+    docs = await get_db().spatial_maps.find(
+        {"plot_id": plot_id, "bed_id": bed_id, "id": {"$in": [map_id, other_id]}}, {"_id": 0, "id": 1, "filename": 1}
+    ).to_list(2)
+    files = {d["id"]: d["filename"] for d in docs}
+    if len(files) < 2:
+        raise HTTPException(status_code=404, detail="Spatial map not found")
+
+    key = (files[map_id], files[other_id])
+    result = _memo.get(key)
+    if result is None:
+        future = _pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(processing.run_in_pool(diff_files, *key))
+            _pending[key] = future
+            future.add_done_callback(lambda _: _pending.pop(key, None))
+        try:
+            result = await asyncio.shield(future)
+        except (PlyError, OSError) as e:
+            raise HTTPException(status_code=422, detail=f"Cannot read point cloud: {e}")
+        _memo.put(key, result)
+    return {"baseId": map_id, "otherId": other_id, **result}
@@ -1,25 +1,22 @@
 # app/services/spatial_maps.py
 from uuid import uuid4
 from datetime import datetime
-from typing import List, Optional
+from typing import Optional
 from pathlib import Path
 from fastapi import HTTPException, UploadFile, status
 from app.db.mongo import get_db
 from app.core.config import settings
+from app.utils.files import StoredFile, UploadTooLarge
+from app.services import events, plant_stats, plot_summaries
+from app.services.blobs import store_upload, release
+from app.utils.metrics import UPLOAD_BYTES
+from app.utils.pagination import Order, Page, keyset, page_of
 
 _ALLOWED_PLY = {".ply"}
+_PROJECTION = {"_id": 0, "plot_id": 0, "bed_id": 0}
 
-async def _enforce_size(file: UploadFile, max_bytes: int) -> None:
-    # mirror plots._enforce_size behavior
-    pos = 0
-    chunk = await file.read(1024 * 1024)
-    while chunk:
-        pos += len(chunk)
-        if pos > max_bytes:
-            await file.close()
-            raise HTTPException(status_code=413, detail="File too large")
-        chunk = await file.read(1024 * 1024)
-    await file.seek(0)
+async def _bed_exists(plot_id: str, bed_id: str) -> bool:
+    return bool(await get_db().beds.count_documents({"plot_id": plot_id, "id": bed_id}, limit=1))
 
 def _ensure_ply(filename: str) -> str:
     ext = Path(filename).suffix.lower()
@@ -28,29 +25,26 @@ def _ensure_ply(filename: str) -> str:
     return ext
 
 async def add_spatial_map(plot_id: str, bed_id: str, file: UploadFile, date_iso: Optional[str]) -> dict:
-    db = get_db()
     # ensure plot/bed exist
-    found = await db.plots.find_one({"id": plot_id, "beds.id": bed_id}, {"_id": 0, "beds.$": 1})
-    if not found or not found.get("beds"):
+    if not await _bed_exists(plot_id, bed_id):
         raise HTTPException(status_code=404, detail="Plot/bed not found")
 
     _ensure_ply(file.filename or "file.ply")
 
     # enforce size like TIF uploads
     max_bytes = settings.max_upload_mb * 1024 * 1024
-    await _enforce_size(file, max_bytes)
-
+    try:
+        stored = await store_upload(file, ".ply", max_bytes)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    UPLOAD_BYTES.labels("spatial_map").inc(stored.bytes)
+    return await register_spatial_map(plot_id, bed_id, stored, file.filename, file.content_type, date_iso)
+
+async def register_spatial_map(plot_id: str, bed_id: str, stored: StoredFile, file_name: Optional[str],
+                               content_type: Optional[str], date_iso: Optional[str]) -> dict:
+    """Create the spatial map for an already stored PLY (holding one blob reference)."""
+    db = get_db()
     file_id = uuid4().hex
-    filename = f"{file_id}.ply"
-    dst = Path(settings.files_dir) / filename
-    dst.parent.mkdir(parents=True, exist_ok=True)
-
-    # write to disk
-    with dst.open("wb") as out:
-        # copyfileobj on underlying file is okay here
-        import shutil
-        shutil.copyfileobj(file.file, out)
-
     when: Optional[datetime] = None
     if date_iso:
         try:
@@ -62,56 +56,69 @@ async def add_spatial_map(plot_id: str, bed_id: str, file: UploadFile, date_iso:
 
     item = {
         "id": file_id,
-        "filename": filename,                 # stored name
-        "fileName": file.filename or filename, # original display name
-        "bytes": dst.stat().st_size,
-        "contentType": file.content_type or "application/octet-stream",
+        "filename": stored.filename,                 # stored name (content hash)
+        "fileName": file_name or stored.filename,    # original display name
+        "bytes": stored.bytes,
+        "sha256": stored.sha256,
+        "contentType": content_type or "application/octet-stream",
         "date": when,
         "createdAt": datetime.utcnow(),
+        "status": "pending",                          # until processing.process_map runs
     }
 
-    # push as newest first
-    res = await db.plots.update_one(
-        {"id": plot_id, "beds.id": bed_id},
-        {"$push": {"beds.$.spatialMaps": {"$each": [item], "$position": 0}}}
-    )
-    if res.matched_count == 0:
-        # Cleanup file if DB op failed weirdly
-        try:
-            dst.unlink(missing_ok=True)
-        except Exception:
-            pass
-        raise HTTPException(status_code=404, detail="Plot/bed not found")
-
+    try:
+        await db.spatial_maps.insert_one({**item, "plot_id": plot_id, "bed_id": bed_id})
+    except Exception:
+        # Drop the reference taken by the upload if DB op failed weirdly
+        await release(stored.filename)
+        raise
+    await plot_summaries.on_map_added(plot_id, item)
+    events.publish("spatial_map.created", plot_id, file_id, item, bedId=bed_id)
     return item
 
-async def list_spatial_maps(plot_id: str, bed_id: str) -> List[dict]:
+# `url` is derived from the stored filename
+MAP_FIELDS = ("id", "fileName", "url", "originalUrl", "bytes", "optimizedBytes", "compressedBytes", "contentType", "date",
+              "createdAt", "status", "metadata", "stats")
+
+async def list_spatial_maps(plot_id: str, bed_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                            fields: Optional[set] = None, order: Order = "desc") -> Page:
     db = get_db()
-    d = await db.plots.find_one({"id": plot_id, "beds.id": bed_id}, {"_id": 0, "beds.$": 1})
-    if not d or not d.get("beds"):
+    ks = keyset(("date", "id"), order, cursor)
+    if fields is None:
+        projection = _PROJECTION
+    else:
+        projection = {"_id": 0, "id": 1, "date": 1, **{f: 1 for f in fields - {"url", "originalUrl"}}}
+        if "url" in fields:
+            projection.update(filename=1, optimizedFilename=1)
+        if "originalUrl" in fields:
+            projection["filename"] = 1
+    # newest first, straight off the (bed_id, date, id) index
+    query = db.spatial_maps.find({"bed_id": bed_id, "plot_id": plot_id, **ks.filter()}, projection).sort(ks.sort())
+    if limit is not None:
+        query = query.limit(limit + 1)
+    maps = await query.to_list(None)
+    if not maps and not await _bed_exists(plot_id, bed_id):
         raise HTTPException(status_code=404, detail="Plot/bed not found")
-    maps = d["beds"][0].get("spatialMaps", [])
-    # Already stored newest first, but ensure:
-    maps.sort(key=lambda x: x.get("date") or x.get("createdAt"), reverse=True)
-    return maps
+    return page_of(maps, ks, limit)
 
-async def delete_spatial_map(plot_id: str, bed_id: str, map_id: str) -> None:
-    from app.utils.files import delete_file
+async def get_spatial_map(plot_id: str, bed_id: str, map_id: str) -> dict:
     db = get_db()
-    # find the filename first
-    d = await db.plots.find_one({"id": plot_id, "beds.id": bed_id}, {"_id": 0, "beds.$": 1})
-    if not d or not d.get("beds"):
-        raise HTTPException(status_code=404, detail="Plot/bed not found")
-    target = next((m for m in d["beds"][0].get("spatialMaps", []) if m.get("id") == map_id), None)
+    target = await db.spatial_maps.find_one({"plot_id": plot_id, "id": map_id, "bed_id": bed_id}, _PROJECTION)
     if not target:
         raise HTTPException(status_code=404, detail="Spatial map not found")
+    return target
 
-    res = await db.plots.update_one(
-        {"id": plot_id, "beds.id": bed_id},
-        {"$pull": {"beds.$.spatialMaps": {"id": map_id}}}
+async def delete_spatial_map(plot_id: str, bed_id: str, map_id: str) -> None:
+    db = get_db()
+    target = await db.spatial_maps.find_one_and_delete(
+        {"plot_id": plot_id, "id": map_id, "bed_id": bed_id}, {"_id": 0, "filename": 1, "bytes": 1, "date": 1}
     )
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Plot/bed not found")
+    if not target:
+        if not await _bed_exists(plot_id, bed_id):
+            raise HTTPException(status_code=404, detail="Plot/bed not found")
+        raise HTTPException(status_code=404, detail="Spatial map not found")
 
-    # best-effort file delete
-    delete_file(settings.files_dir, target["filename"])
+    await plot_summaries.on_maps_removed(plot_id, [target])
+    events.publish("spatial_map.deleted", plot_id, map_id, bedId=bed_id)
+    await plant_stats.forget_bed_stats(plot_id, bed_id, map_id)
+    await release(target["filename"])
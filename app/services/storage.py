@@ -0,0 +1,239 @@
+# app/services/storage.py
+# Where stored file bytes live, selected by STORAGE_BACKEND:
+#
+#   local  files_dir on this host (sharded, see app.utils.files); uploads and
+#          downloads stream through the API (/files)
+#   s3     an S3-compatible bucket (AWS, MinIO, moto server, ...); clients
+#          get presigned URLs and move bytes to and from the bucket directly,
+#          so the API only handles metadata
+#
+# Processing (metadata, pyramids, LOD, stats, diffs) always reads a local
+# file: with S3 an object is downloaded once into cache_dir/objects and read
+# from there. Files derived from an upload (compact PLY copies and their
+# .gz/.br variants) are written next to that local copy and published back.
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.files import copy_into, delete_file, move_into_shard, shard_dir, stored_path
+
+_ENCODINGS = {".gz": "gzip", ".br": "br"}
+
+class Storage:
+    direct = False  # clients can be handed presigned URLs
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def put_stream(self, src, name: str) -> None:
+        """Store a file object (read from its start) as `name`. Blocking."""
+        raise NotImplementedError
+
+    def put_file(self, path: Path, name: str) -> None:
+        """Store a local file as `name`, consuming it. Blocking."""
+        raise NotImplementedError
+
+    def local_path(self, name: str) -> Path:
+        """A local path holding the bytes of `name`, for reading. Blocking."""
+        raise NotImplementedError
+
+    def publish(self, path: Path) -> None:
+        """Store a file written next to local_path() under its own name. Blocking."""
+
+    def delete(self, name: str) -> int:
+        """Delete `name` and its siblings (<stem>.min.ply, <name>.gz, ...); returns
+        the bytes freed. Blocking."""
+        raise NotImplementedError
+
+    def listing(self) -> Iterator[Tuple[str, int, float]]:
+        """(key, bytes, mtime) of everything stored, siblings and leftovers included. Blocking."""
+        raise NotImplementedError
+
+    def remove(self, keys: Iterable[str]) -> None:
+        """Delete exactly these listing() keys. Blocking."""
+        raise NotImplementedError
+
+    def download_url(self, name: str) -> Optional[str]:
+        """A URL clients can fetch `name` from directly; None to go through /files."""
+        return None
+
+    def upload_target(self, name: str, sha256_b64: str, content_type: Optional[str]) -> dict:
+        """{"url", "headers"} for a client PUT of `name` straight to storage."""
+        raise NotImplementedError
+
+    def head(self, name: str) -> Optional[dict]:
+        """{"bytes", "sha256"} of a stored object (sha256 as base64, if known); None if missing."""
+        raise NotImplementedError
+
+class LocalStorage(Storage):
+    def exists(self, name: str) -> bool:
+        return stored_path(name).exists()
+
+    def put_stream(self, src, name: str) -> None:
+        copy_into(src, str(shard_dir(name)), name)
+
+    def put_file(self, path: Path, name: str) -> None:
+        move_into_shard(path, name)
+
+    def local_path(self, name: str) -> Path:
+        return stored_path(name)
+
+    def delete(self, name: str) -> int:
+        return delete_file(name)
+
+    def listing(self) -> Iterator[Tuple[str, int, float]]:
+        # keys are paths relative to files_dir: "<name>" (flat) or "ab/cd/<name>"
+        root = Path(settings.files_dir)
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != ".uploads":  # resumable uploads sweep their own
+                            stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat()
+                        yield Path(entry.path).relative_to(root).as_posix(), st.st_size, st.st_mtime
+
+    def remove(self, keys: Iterable[str]) -> None:
+        root = Path(settings.files_dir)
+        for key in keys:
+            (root / key).unlink(missing_ok=True)
+
+    def head(self, name: str) -> Optional[dict]:
+        try:
+            return {"bytes": stored_path(name).stat().st_size, "sha256": None}
+        except FileNotFoundError:
+            return None
+
+class S3Storage(Storage):
+    direct = True
+
+    def __init__(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install -r requirements-s3.txt)")
+        if not settings.s3_bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        # credentials come from the usual AWS_* variables / profiles
+        self.client = boto3.client(
+            "s3", endpoint_url=settings.s3_endpoint_url, region_name=settings.s3_region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": settings.s3_addressing_style}),
+        )
+        self.bucket = settings.s3_bucket
+        self.prefix = settings.s3_prefix
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def _cache_path(self, name: str) -> Path:
+        return Path(settings.cache_dir) / "objects" / name
+
+    def _missing(self, e) -> bool:
+        return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def head(self, name: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+        try:
+            res = self.client.head_object(Bucket=self.bucket, Key=self._key(name), ChecksumMode="ENABLED")
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return {"bytes": res["ContentLength"], "sha256": res.get("ChecksumSHA256")}
+
+    def exists(self, name: str) -> bool:
+        return self.head(name) is not None
+
+    def _extra_args(self, name: str) -> dict:
+        suffix = os.path.splitext(name)[1]
+        if suffix in _ENCODINGS:
+            # fetched as-is, the variant decodes to the original's bytes
+            return {"ContentEncoding": _ENCODINGS[suffix]}
+        return {}
+
+    def put_stream(self, src, name: str) -> None:
+        src.seek(0)
+        self.client.upload_fileobj(src, self.bucket, self._key(name), ExtraArgs=self._extra_args(name))
+
+    def put_file(self, path: Path, name: str) -> None:
+        try:
+            self.client.upload_file(str(path), self.bucket, self._key(name), ExtraArgs=self._extra_args(name))
+        finally:
+            Path(path).unlink(missing_ok=True)
+
+    def local_path(self, name: str) -> Path:
+        path = self._cache_path(name)
+        if path.exists():
+            return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # unique per process: pool workers and request threads may race
+        tmp = path.with_name(f".{name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            self.client.download_file(self.bucket, self._key(name), str(tmp))
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return path
+
+    def publish(self, path: Path) -> None:
+        self.client.upload_file(str(path), self.bucket, self._key(path.name), ExtraArgs=self._extra_args(path.name))
+
+    def _sibling_objects(self, name: str) -> List[dict]:
+        stem = Path(name).stem
+        objects = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self._key(f"{stem}.")):
+            objects += page.get("Contents", [])
+        return objects
+
+    def _delete_keys(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": k} for k in keys[start:start + 1000]], "Quiet": True},
+            )
+
+    def delete(self, name: str) -> int:
+        objects = self._sibling_objects(name)
+        self._delete_keys([o["Key"] for o in objects])
+        cache = self._cache_path(name)
+        if cache.parent.is_dir():
+            for sibling in cache.parent.glob(f"{Path(name).stem}.*"):
+                sibling.unlink(missing_ok=True)
+        return sum(o["Size"] for o in objects)
+
+    def listing(self) -> Iterator[Tuple[str, int, float]]:
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for o in page.get("Contents", []):
+                yield o["Key"][len(self.prefix):], o["Size"], o["LastModified"].timestamp()
+
+    def remove(self, keys: Iterable[str]) -> None:
+        self._delete_keys([self._key(k) for k in keys])
+
+    def download_url(self, name: str) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(name)}, ExpiresIn=settings.s3_url_ttl_s,
+        )
+
+    def upload_target(self, name: str, sha256_b64: str, content_type: Optional[str]) -> dict:
+        params = {"Bucket": self.bucket, "Key": self._key(name), "ChecksumSHA256": sha256_b64}
+        headers = {"x-amz-checksum-sha256": sha256_b64}
+        if content_type:
+            params["ContentType"] = headers["Content-Type"] = content_type
+        # the checksum header is signed: the bucket rejects bytes that do not match it
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=settings.s3_url_ttl_s)
+        return {"url": url, "headers": headers}
+
+_backend: Optional[Storage] = None
+
+def get_storage() -> Storage:
+    global _backend
+    if _backend is None:
+        _backend = S3Storage() if settings.storage_backend == "s3" else LocalStorage()
+    return _backend
+
+def local_path(name: str) -> Path:
+    return get_storage().local_path(name)
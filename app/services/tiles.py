@@ -0,0 +1,217 @@
+# app/services/tiles.py
+# XYZ map tiles and thumbnails rendered from plot orthomosaics.
+#
+# The source GeoTIFF is a content-addressed blob and is never modified. Next
+# to it (under cache_dir/tiles/<hash>/) we keep a pyramid: one copy of the
+# raster downsampled by PYRAMID_FACTOR with internal overviews, which serves
+# every zoom level coarser than the source can usefully provide. Tiles are
+# rendered from windowed reads, cached on disk in the same directory and kept
+# hot in an in-process LRU keyed by the stored file name, which never changes
+# meaning. Only the plot id -> file name lookup can go stale (a plot deleted
+# by another worker); it is re-read after plot_file_ttl_s.
+import io
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Literal, Optional
+import numpy as np
+import rasterio
+from PIL import Image
+from fastapi import HTTPException
+from rasterio.enums import Resampling
+from rasterio.transform import Affine, from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.services.storage import local_path
+from app.utils.files import derived_dir
+from app.utils.locks import KeyedLocks
+from app.utils.lru import LRUCache
+
+TileFormat = Literal["png", "webp"]
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+TILE_SIZE = 256
+THUMBNAIL_SIZE = 256
+PYRAMID_FACTOR = 4
+_WEB_MERCATOR = "EPSG:3857"
+_ORIGIN = 20037508.342789244
+_MAX_ZOOM = 24
+
+_tiles = LRUCache(settings.tile_cache_entries)
+_plot_files = LRUCache(4096)
+_build_locks = KeyedLocks()
+
+def _source_path(filename: str) -> Path:
+    return local_path(filename)
+
+def _pyramid_path(filename: str) -> Path:
+    return derived_dir("tiles", filename) / "pyramid.tif"
+
+def _to_uint8(data: np.ndarray) -> np.ndarray:
+    if data.dtype == np.uint8:
+        return data
+    if np.issubdtype(data.dtype, np.integer):
+        return (data.astype(np.float32) * (255.0 / np.iinfo(data.dtype).max)).astype(np.uint8)
+    return np.clip(np.nan_to_num(data), 0, 255).astype(np.uint8)
+
+def encode_rgba(data: np.ndarray, mask: np.ndarray, fmt: TileFormat) -> bytes:
+    bands = _to_uint8(data)
+    if bands.shape[0] < 3:
+        bands = np.repeat(bands[:1], 3, axis=0)
+    rgba = np.dstack([bands[0], bands[1], bands[2], mask.astype(np.uint8)])
+    buf = io.BytesIO()
+    if fmt == "webp":
+        Image.fromarray(rgba, "RGBA").save(buf, format="WEBP", quality=80, method=4)
+    else:
+        Image.fromarray(rgba, "RGBA").save(buf, format="PNG", compress_level=6)
+    return buf.getvalue()
+
+def band_indexes(ds) -> list[int]:
+    return [1, 2, 3] if ds.count >= 3 else [1]
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def build_pyramid(filename: str) -> Optional[Path]:
+    """Write the downsampled pyramid for a stored GeoTIFF; returns None if the
+    raster is already small enough to tile directly. Blocking."""
+    out = _pyramid_path(filename)
+    with _build_locks(filename):
+        if out.exists():
+            return out
+        with rasterio.open(_source_path(filename)) as src:
+            width = math.ceil(src.width / PYRAMID_FACTOR)
+            height = math.ceil(src.height / PYRAMID_FACTOR)
+            if max(width, height) < TILE_SIZE:
+                return None
+            profile = src.profile.copy()
+            profile.update(
+                driver="GTiff", width=width, height=height,
+                transform=src.transform * Affine.scale(src.width / width, src.height / height),
+                tiled=True, blockxsize=TILE_SIZE, blockysize=TILE_SIZE,
+                compress="deflate", BIGTIFF="IF_SAFER",
+            )
+            out.parent.mkdir(parents=True, exist_ok=True)
+            # unique per process: a pool worker and a lazy tile request may race
+            tmp = out.with_name(f".{out.name}.{os.getpid()}.{threading.get_ident()}.part")
+            # Strip by strip so memory stays bounded for very large sources.
+            with rasterio.open(tmp, "w", **profile) as dst:
+                for row in range(0, height, TILE_SIZE):
+                    rows = min(TILE_SIZE, height - row)
+                    window = Window(0, row * src.height / height, src.width, rows * src.height / height)
+                    data = src.read(window=window, out_shape=(src.count, rows, width), resampling=Resampling.average)
+                    dst.write(data, window=Window(0, row, width, rows))
+                factors = []
+                while max(width, height) // (2 ** (len(factors) + 1)) >= TILE_SIZE:
+                    factors.append(2 ** (len(factors) + 1))
+                if factors:
+                    dst.build_overviews(factors, Resampling.average)
+            os.replace(tmp, out)
+    return out
+
+def _tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    span = 2 * _ORIGIN / (1 << z)
+    left = -_ORIGIN + x * span
+    top = _ORIGIN - y * span
+    return left, top - span, left + span, top
+
+def _render_tile(filename: str, z: int, x: int, y: int, fmt: TileFormat) -> bytes:
+    left, bottom, right, top = _tile_bounds(z, x, y)
+    tile_res = (right - left) / TILE_SIZE
+    with rasterio.open(_source_path(filename)) as src:
+        if src.crs is None:
+            raise HTTPException(status_code=422, detail="Plot raster is not georeferenced")
+        sl, sb, sr, st = transform_bounds(src.crs, _WEB_MERCATOR, *src.bounds)
+        native_res = (sr - sl) / src.width
+    if sr <= left or sl >= right or st <= bottom or sb >= top:
+        return b""
+
+    # Coarse zooms come from the pyramid; only near-native zooms touch the source.
+    path = _source_path(filename)
+    if tile_res >= native_res * PYRAMID_FACTOR:
+        pyramid = build_pyramid(filename)
+        if pyramid is not None:
+            path = pyramid
+            native_res *= PYRAMID_FACTOR
+
+    # Warp onto a grid at roughly the dataset's own resolution and let the
+    # decimated read pick the matching overview level.
+    size = int(min(max(TILE_SIZE, round((right - left) / native_res)), TILE_SIZE * 16))
+    with rasterio.open(path) as ds, WarpedVRT(
+        ds, crs=_WEB_MERCATOR, transform=from_bounds(left, bottom, right, top, size, size),
+        width=size, height=size, resampling=Resampling.bilinear,
+    ) as vrt:
+        data = vrt.read(band_indexes(ds), out_shape=(len(band_indexes(ds)), TILE_SIZE, TILE_SIZE), resampling=Resampling.bilinear)
+        mask = vrt.dataset_mask(out_shape=(TILE_SIZE, TILE_SIZE))
+    if not mask.any():
+        return b""
+    return encode_rgba(data, mask, fmt)
+
+def _render_thumbnail(filename: str, fmt: TileFormat) -> bytes:
+    pyramid = build_pyramid(filename)
+    with rasterio.open(pyramid or _source_path(filename)) as ds:
+        scale = THUMBNAIL_SIZE / max(ds.width, ds.height)
+        shape = (max(1, round(ds.height * scale)), max(1, round(ds.width * scale)))
+        data = ds.read(band_indexes(ds), out_shape=(len(band_indexes(ds)), *shape), resampling=Resampling.average)
+        mask = ds.dataset_mask(out_shape=shape)
+    return encode_rgba(data, mask, fmt)
+
+def cached_file(path: Path, render) -> bytes:
+    if path.exists():
+        return path.read_bytes()
+    data = render()
+    _write_atomic(path, data)
+    return data
+
+def prepare_plot(filename: str) -> None:
+    """Build the pyramid and thumbnail ahead of the first request. Blocking."""
+    build_pyramid(filename)
+    cached_file(derived_dir("tiles", filename) / "thumbnail.png", lambda: _render_thumbnail(filename, "png"))
+
+async def _plot_filename(plot_id: str) -> str:
+    hit = _plot_files.get(plot_id)
+    if hit is not None and time.monotonic() - hit[1] < settings.plot_file_ttl_s:
+        return hit[0]
+    doc = await get_db().plots.find_one({"id": plot_id}, {"_id": 0, "filename": 1})
+    if not doc:
+        _plot_files.discard(plot_id)
+        raise HTTPException(status_code=404, detail="Plot not found")
+    _plot_files.put(plot_id, (doc["filename"], time.monotonic()))
+    return doc["filename"]
+
+async def get_tile(plot_id: str, z: int, x: int, y: int, fmt: TileFormat) -> Optional[bytes]:
+    """Encoded tile bytes, or None where the plot has no data."""
+    if not 0 <= z <= _MAX_ZOOM or not 0 <= x < (1 << z) or not 0 <= y < (1 << z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    filename = await _plot_filename(plot_id)
+    key = (filename, z, x, y, fmt)
+    data = _tiles.get(key)
+    if data is None:
+        path = derived_dir("tiles", filename) / str(z) / str(x) / f"{y}.{fmt}"
+        data = await run_in_threadpool(cached_file, path, lambda: _render_tile(filename, z, x, y, fmt))
+        _tiles.put(key, data)
+    return data or None
+
+async def get_thumbnail(plot_id: str, fmt: TileFormat) -> bytes:
+    filename = await _plot_filename(plot_id)
+    key = (filename, "thumbnail", fmt)
+    data = _tiles.get(key)
+    if data is None:
+        path = derived_dir("tiles", filename) / f"thumbnail.{fmt}"
+        data = await run_in_threadpool(cached_file, path, lambda: _render_thumbnail(filename, fmt))
+        _tiles.put(key, data)
+    return data
+
+def forget_plot(plot_id: str) -> None:
+    # Rendered tiles stay valid for any other plot sharing the blob; the disk
+    # cache goes away with the blob itself.
+    _plot_files.discard(plot_id)
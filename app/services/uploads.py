@@ -0,0 +1,358 @@
+# app/services/uploads.py
+# Resumable chunked uploads for plot rasters and spatial-map point clouds.
+#
+# 1. create: the target (a plot, or a bed's spatial map), file type and size
+#    are validated before any bytes move, and a sparse file of the final size
+#    is allocated under files_dir/.uploads (same filesystem as the blob store)
+# 2. chunks: chunk i lands at offset i * chunkSize via pwrite, so chunks may
+#    arrive in any order, in parallel and more than once; an
+#    `Upload-Checksum: sha256 <base64>` header is verified before writing
+# 3. finalize: once every chunk is in, the file is hashed and renamed into
+#    the blob store (no copy) and goes through the same creation path as a
+#    multipart upload. Each chunk write holds a lease in the session's
+#    `writers` (taken only while the session is open), and finalize waits for
+#    the leases to go after closing the session, so a retried chunk still in
+#    flight never writes while the file is hashed or once it is in the store
+#
+# With S3 storage and a `sha256` given up front, the session is direct
+# instead: the client PUTs the whole file to a presigned `uploadUrl` (the
+# bucket checks the signed checksum) and finalize only verifies the object,
+# so no bytes pass through the API. When the bytes are already stored there
+# is no `uploadUrl` and the client can finalize right away.
+#
+# Sessions are `upload_sessions` documents; every chunk pushes `expiresAt`
+# out by upload_session_ttl_s, and a periodic sweep deletes expired sessions
+# with their partial files (or unclaimed direct uploads).
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+from uuid import uuid4
+from fastapi import BackgroundTasks, HTTPException, status
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.mongo import get_db
+from app.models.upload import UploadCreate, UploadSessionInDB
+from app.services import plots
+from app.services.blobs import adopt_file, adopt_object, find_blob
+from app.services.spatial_maps import register_spatial_map
+from app.services.storage import get_storage
+from app.utils.files import ensure_ext
+from app.utils.metrics import UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 64 * 1024 * 1024
+WRITE_LEASE_S = 60.0  # one pwrite of a chunk that is already in memory
+_PROJECTION = {"_id": 0, "writers": 0}
+
+_gc_task: Optional[asyncio.Task] = None
+
+def _upload_dir() -> Path:
+    return Path(settings.files_dir) / ".uploads"
+
+def _part_path(upload_id: str) -> Path:
+    return _upload_dir() / f"{upload_id}.part"
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.upload_session_ttl_s)
+
+def _max_bytes() -> int:
+    return settings.max_upload_mb * 1024 * 1024
+
+def _ext(kind: str, file_name: str) -> str:
+    if kind == "plot":
+        try:
+            return ensure_ext(file_name)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Only .tif/.tiff allowed")
+    if Path(file_name).suffix.lower() != ".ply":
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Only .ply allowed")
+    return ".ply"
+
+def _b64(sha256_hex: str) -> str:
+    return base64.b64encode(bytes.fromhex(sha256_hex)).decode()
+
+def session_out(doc: dict) -> dict:
+    received = set(doc["received"])
+    contiguous = next((i for i in range(doc["chunks"]) if i not in received), doc["chunks"])
+    out = {**doc, "received": sorted(received), "offset": min(contiguous * doc["chunkSize"], doc["size"])}
+    if doc.get("direct") and not doc.get("stored") and doc["status"] == "open":
+        # presigned per response, so a resumed client always gets a live URL
+        target = get_storage().upload_target(doc["objectName"], _b64(doc["sha256"]), doc.get("contentType"))
+        out["uploadUrl"], out["uploadHeaders"] = target["url"], target["headers"]
+    return out
+
+async def _bed_exists(plot_id: Optional[str], bed_id: Optional[str]) -> bool:
+    return bool(await get_db().beds.count_documents({"plot_id": plot_id, "id": bed_id}, limit=1))
+
+def _allocate(path: Path, size: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)  # sparse; chunks fill it in place
+
+async def _create_direct(body: UploadCreate, ext: str) -> dict:
+    existing = await find_blob(body.sha256)
+    name = existing["filename"] if existing else f"{body.sha256}{ext}"
+    stored = existing is not None and await run_in_threadpool(get_storage().exists, name)
+    doc = UploadSessionInDB(
+        id=uuid4().hex, kind=body.kind, fileName=body.fileName, size=body.size, chunkSize=body.size, chunks=1,
+        plotId=body.plotId, bedId=body.bedId, date=body.date, contentType=body.contentType, expiresAt=_expiry(),
+        direct=True, sha256=body.sha256, objectName=name, stored=stored,
+    ).model_dump()
+    await get_db().upload_sessions.insert_one(doc)
+    doc.pop("_id", None)
+    return session_out(doc)
+
+async def create_session(body: UploadCreate) -> dict:
+    if body.size > _max_bytes():
+        raise HTTPException(status_code=413, detail="File too large")
+    ext = _ext(body.kind, body.fileName)
+    if body.kind == "spatial_map" and not await _bed_exists(body.plotId, body.bedId):
+        raise HTTPException(status_code=404, detail="Plot/bed not found")
+    if body.sha256 and get_storage().direct:
+        return await _create_direct(body, ext)
+    chunk = body.chunkSize or settings.upload_chunk_mb * 1024 * 1024
+    if not MIN_CHUNK <= chunk <= MAX_CHUNK:
+        raise HTTPException(status_code=422, detail=f"chunkSize must be between {MIN_CHUNK} and {MAX_CHUNK} bytes")
+
+    doc = UploadSessionInDB(
+        id=uuid4().hex, kind=body.kind, fileName=body.fileName, size=body.size, chunkSize=chunk,
+        chunks=math.ceil(body.size / chunk), plotId=body.plotId, bedId=body.bedId, date=body.date,
+        contentType=body.contentType, expiresAt=_expiry(),
+    ).model_dump()
+    await run_in_threadpool(_allocate, _part_path(doc["id"]), body.size)
+    try:
+        await get_db().upload_sessions.insert_one(doc)
+    except Exception:
+        _part_path(doc["id"]).unlink(missing_ok=True)
+        raise
+    doc.pop("_id", None)
+    return session_out(doc)
+
+async def get_session(upload_id: str) -> dict:
+    doc = await get_db().upload_sessions.find_one({"id": upload_id}, _PROJECTION)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session_out(doc)
+
+def _parse_checksum(header: Optional[str]) -> Optional[bytes]:
+    if header is None:
+        return None
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise HTTPException(status_code=400, detail="Upload-Checksum must be 'sha256 <base64 digest>'")
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Upload-Checksum digest is not valid base64")
+
+def _pwrite(path: Path, data: bytes, offset: int) -> None:
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view, offset = view[written:], offset + written
+    finally:
+        os.close(fd)
+
+async def write_chunk(upload_id: str, index: int, body: AsyncIterator[bytes], checksum: Optional[str]) -> dict:
+    """Store chunk `index` of an open session; the body must be exactly that chunk."""
+    db = get_db()
+    doc = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0, "status": 1, "size": 1, "chunkSize": 1, "chunks": 1, "direct": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if doc.get("direct"):
+        raise HTTPException(status_code=409, detail="Direct upload: PUT the file to uploadUrl instead")
+    if doc["status"] != "open":
+        raise HTTPException(status_code=409, detail="Upload is already finalized")
+    if not 0 <= index < doc["chunks"]:
+        raise HTTPException(status_code=422, detail=f"Chunk index must be below {doc['chunks']}")
+    expected = min(doc["chunkSize"], doc["size"] - index * doc["chunkSize"])
+    digest = _parse_checksum(checksum)
+
+    data = bytearray()
+    async for part in body:
+        data += part
+        if len(data) > expected:
+            raise HTTPException(status_code=413, detail=f"Chunk {index} must be {expected} bytes")
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes, got {len(data)}")
+    if digest is not None and hashlib.sha256(data).digest() != digest:
+        raise HTTPException(status_code=422, detail=f"Checksum mismatch on chunk {index}")
+
+    lease = {"id": uuid4().hex, "until": datetime.utcnow() + timedelta(seconds=WRITE_LEASE_S)}
+    res = await db.upload_sessions.update_one({"id": upload_id, "status": "open"}, {"$push": {"writers": lease}})
+    if not res.modified_count:
+        raise HTTPException(status_code=409, detail="Upload is already finalized")
+    try:
+        await run_in_threadpool(_pwrite, _part_path(upload_id), data, index * doc["chunkSize"])
+    except BaseException as e:
+        await db.upload_sessions.update_one({"id": upload_id}, {"$pull": {"writers": {"id": lease["id"]}}})
+        if isinstance(e, FileNotFoundError):  # swept or aborted meanwhile
+            raise HTTPException(status_code=404, detail="Upload not found")
+        raise
+    UPLOAD_BYTES.labels("chunk").inc(len(data))
+    # record the chunk only once its bytes are on disk; a finalize waiting on
+    # the lease sees it
+    doc = await db.upload_sessions.find_one_and_update(
+        {"id": upload_id},
+        {"$pull": {"writers": {"id": lease["id"]}}, "$addToSet": {"received": index}, "$set": {"expiresAt": _expiry()}},
+        projection=_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session_out(doc)
+
+async def _wait_for_writers(upload_id: str) -> Optional[dict]:
+    """The closed session once no chunk write holds a live lease on it."""
+    db = get_db()
+    while await db.upload_sessions.count_documents(
+        {"id": upload_id, "writers": {"$elemMatch": {"until": {"$gt": datetime.utcnow()}}}}, limit=1
+    ):
+        await asyncio.sleep(0.05)
+    return await db.upload_sessions.find_one({"id": upload_id}, _PROJECTION)
+
+async def finalize(upload_id: str, request, background_tasks: BackgroundTasks) -> tuple[str, dict]:
+    """Turn a complete session into its plot or spatial map; returns (kind, created document)."""
+    db = get_db()
+    doc = await db.upload_sessions.find_one_and_update(
+        {"id": upload_id, "status": "open"}, {"$set": {"status": "finalizing", "expiresAt": _expiry()}},
+        projection=_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        existing = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0, "status": 1, "resultId": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if existing["status"] == "completed":
+            raise HTTPException(status_code=409, detail=f"Upload already finalized as {existing['resultId']}")
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    if not doc.get("direct"):
+        # chunks written meanwhile count; the session stays closed to new ones
+        doc = await _wait_for_writers(upload_id)
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+    missing = [] if doc.get("direct") else sorted(set(range(doc["chunks"])) - set(doc["received"]))
+    if missing:
+        await db.upload_sessions.update_one({"id": upload_id}, {"$set": {"status": "open"}})
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing": missing})
+    if doc["kind"] == "spatial_map" and not await _bed_exists(doc["plotId"], doc["bedId"]):
+        await _drop(doc)
+        raise HTTPException(status_code=404, detail="Plot/bed not found")
+
+    if doc.get("direct"):
+        stored = await _adopt_direct(doc)
+    else:
+        try:
+            stored = await adopt_file(_part_path(upload_id), _ext(doc["kind"], doc["fileName"]), _max_bytes())
+        except BaseException:
+            # the partial file is consumed either way; the client has to start over
+            await db.upload_sessions.delete_one({"id": upload_id})
+            raise
+    if doc["kind"] == "plot":
+        created = await plots.register_plot(stored, doc["fileName"], request, background_tasks)
+    else:
+        created = await register_spatial_map(doc["plotId"], doc["bedId"], stored, doc["fileName"], doc["contentType"], doc["date"])
+    await db.upload_sessions.update_one({"id": upload_id}, {"$set": {"status": "completed", "resultId": created["id"]}})
+    return doc["kind"], created
+
+async def _adopt_direct(doc: dict):
+    async def reopen(code: int, detail: str):
+        # the client can PUT again (or fix the object) and retry
+        await get_db().upload_sessions.update_one({"id": doc["id"]}, {"$set": {"status": "open"}})
+        raise HTTPException(status_code=code, detail=detail)
+
+    if not doc["stored"]:
+        head = await run_in_threadpool(get_storage().head, doc["objectName"])
+        if head is None:
+            await reopen(409, "File has not been uploaded to uploadUrl yet")
+        if head["bytes"] != doc["size"]:
+            await reopen(422, f"Uploaded file is {head['bytes']} bytes, expected {doc['size']}")
+        if head["sha256"] is not None and head["sha256"] != _b64(doc["sha256"]):
+            await reopen(422, "Uploaded file does not match sha256")
+    try:
+        return await adopt_object(doc["objectName"], doc["sha256"], _ext(doc["kind"], doc["fileName"]), doc["size"])
+    except FileNotFoundError:
+        # already-stored bytes went away since the session was created
+        await get_db().upload_sessions.update_one({"id": doc["id"]}, {"$set": {"stored": False}})
+        await reopen(409, "File has not been uploaded to uploadUrl yet")
+
+async def _discard_bytes(doc: dict) -> None:
+    if not doc.get("direct"):
+        await run_in_threadpool(_part_path(doc["id"]).unlink, missing_ok=True)
+    elif not doc.get("stored") and doc.get("status") != "completed" and not await find_blob(doc["sha256"]):
+        # uploaded but never claimed by a finalize
+        await run_in_threadpool(get_storage().delete, doc["objectName"])
+
+async def _drop(doc: dict) -> bool:
+    res = await get_db().upload_sessions.delete_one({"id": doc["id"]})
+    await _discard_bytes(doc)
+    return bool(res.deleted_count)
+
+async def abort(upload_id: str) -> None:
+    doc = await get_db().upload_sessions.find_one_and_delete({"id": upload_id, "status": "open"}, _PROJECTION)
+    if doc is None:
+        if await get_db().upload_sessions.count_documents({"id": upload_id}, limit=1):
+            raise HTTPException(status_code=409, detail="Upload is already finalized")
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await _discard_bytes(doc)
+
+def _orphans(known: set, cutoff: float) -> List[Path]:
+    root = _upload_dir()
+    if not root.is_dir():
+        return []
+    return [p for p in root.glob("*.part") if p.stem not in known and p.stat().st_mtime < cutoff]
+
+async def sweep() -> int:
+    """Delete expired sessions and partial files no session owns; returns how many went."""
+    db = get_db()
+    expired = await db.upload_sessions.find(
+        {"expiresAt": {"$lt": datetime.utcnow()}}, {"_id": 0, "id": 1, "status": 1, "direct": 1, "stored": 1, "sha256": 1, "objectName": 1}
+    ).to_list(None)
+    removed = 0
+    for doc in expired:
+        removed += await _drop(doc)
+    # e.g. left behind by a process that died between allocating and inserting
+    known = {d["id"] async for d in db.upload_sessions.find({}, {"_id": 0, "id": 1})}
+    for path in await run_in_threadpool(_orphans, known, time.time() - settings.upload_session_ttl_s):
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+async def _gc_loop() -> None:
+    interval = min(600.0, settings.upload_session_ttl_s / 4)
+    while True:
+        try:
+            removed = await sweep()
+            if removed:
+                logger.info("Removed %d stale uploads", removed)
+        except Exception:
+            logger.exception("Upload sweep failed")
+        await asyncio.sleep(interval)
+
+def start_gc() -> None:
+    global _gc_task
+    _gc_task = asyncio.create_task(_gc_loop())
+
+async def stop_gc() -> None:
+    global _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        await asyncio.gather(_gc_task, return_exceptions=True)
+        _gc_task = None
+
+async def init_upload_indexes() -> None:
+    db = get_db()
+    await db.upload_sessions.create_index("id", unique=True)
+    await db.upload_sessions.create_index("expiresAt")
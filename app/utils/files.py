@@ -1,9 +1,23 @@
+import hashlib
 import os
 import shutil
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
-from uuid import uuid4
+from app.core.config import settings
 
 ALLOWED_EXT = {".tif", ".tiff"}
+CHUNK_SIZE = 1024 * 1024
+_HEX = set("0123456789abcdef")
+
+class UploadTooLarge(Exception):
+    pass
+
+@dataclass
+class StoredFile:
+    filename: str
+    bytes: int
+    sha256: str
 
 def ensure_ext(filename: str) -> str:
     ext = Path(filename).suffix.lower()
@@ -11,20 +25,97 @@ def ensure_ext(filename: str) -> str:
         raise ValueError("Unsupported file type")
     return ext
 
-def new_filename(original: str) -> tuple[str, str]:
-    ext = ensure_ext(original)
-    file_id = uuid4().hex
-    name = Path(original).stem
-    return file_id, f"{file_id}{ext}", name
-
-def save_upload(dst_dir: str, upload_file) -> tuple[str, str, str]:
-    file_id, filename, name = new_filename(upload_file.filename)
-    dst = Path(dst_dir) / filename
-    with dst.open("wb") as out:
-        shutil.copyfileobj(upload_file.file, out)
-    return file_id, filename, name
-
-def delete_file(dst_dir: str, filename: str) -> None:
-    p = Path(dst_dir) / filename
-    if p.exists():
-        p.unlink()
+def hash_stream(src, max_bytes: int) -> tuple[int, str]:
+    # Runs in a worker thread: size check and SHA-256 in one chunked read.
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge()
+        digest.update(chunk)
+    return size, digest.hexdigest()
+
+def shard_dir(filename: str) -> Path:
+    """files_dir/ab/cd/: the shard a stored name (and its siblings) lives in.
+
+    The key is the first four characters of the stem, which are hex for both
+    content hashes and UUIDs; any other name is sharded by the MD5 of its stem.
+    """
+    stem = filename.split(".", 1)[0].lower()
+    key = stem[:4] if len(stem) >= 4 and set(stem[:4]) <= _HEX else hashlib.md5(stem.encode()).hexdigest()
+    return Path(settings.files_dir) / key[:2] / key[2:4]
+
+def stored_path(filename: str) -> Path:
+    """Where a stored file is, in either layout.
+
+    New files are written into their shard; files from before sharding stay
+    at the top of files_dir until app.scripts.migrate_files moves them. The
+    shard path is also the answer for a file that exists in neither place,
+    which covers a migration moving it between the two checks.
+    """
+    sharded = shard_dir(filename) / filename
+    if sharded.exists():
+        return sharded
+    flat = Path(settings.files_dir) / filename
+    return flat if flat.exists() else sharded
+
+def copy_into(src, dst_dir: str, filename: str) -> None:
+    """Copy src (from its start) to dst_dir/filename via a temp file + atomic rename.
+
+    Readers never observe a partially written file. Blocking; call from a
+    worker thread.
+    """
+    Path(dst_dir).mkdir(parents=True, exist_ok=True)
+    src.seek(0)
+    fd, tmp = tempfile.mkstemp(dir=dst_dir, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+        os.replace(tmp, Path(dst_dir) / filename)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def move_into_shard(path: Path, filename: str) -> None:
+    """Rename a fully written file into its shard (same filesystem only)."""
+    dst = shard_dir(filename)
+    dst.mkdir(parents=True, exist_ok=True)
+    os.replace(path, dst / filename)
+
+def delete_file(filename: str) -> int:
+    """Delete a stored file and its siblings (<stem>.min.ply, <name>.gz, ...) in both
+    layouts; returns the bytes freed."""
+    stem = Path(filename).stem
+    freed = 0
+    for d in (shard_dir(filename), Path(settings.files_dir)):
+        for sibling in d.glob(f"{stem}.*"):
+            try:
+                freed += sibling.stat().st_size
+                sibling.unlink()
+            except FileNotFoundError:
+                pass
+    return freed
+
+def derived_dir(kind: str, filename: str) -> Path:
+    """Cache directory for artifacts derived from a stored file (tiles, ...).
+
+    Keyed by the stored name's stem, which is the content hash, so every
+    document sharing the blob shares the artifacts too.
+    """
+    return Path(settings.cache_dir) / kind / Path(filename).stem
+
+def delete_derived(filename: str) -> None:
+    root = Path(settings.cache_dir)
+    if not root.is_dir():
+        return
+    stem = Path(filename).stem
+    for kind in root.iterdir():
+        shutil.rmtree(kind / stem, ignore_errors=True)
@@ -0,0 +1,30 @@
+import math
+from typing import List, Sequence, Tuple
+import numpy as np
+
+# Equirectangular approximation; plenty for bed-sized extents.
+M_PER_DEG_LAT = 110_540.0
+M_PER_DEG_LON = 111_320.0  # at the equator, scaled by cos(latitude)
+
+def metres_per_degree(lat: float) -> Tuple[float, float]:
+    return M_PER_DEG_LON * math.cos(math.radians(lat)), M_PER_DEG_LAT
+
+def to_local(lon, lat, origin: Sequence[float]):
+    """Degrees -> metres east/north of origin=(lon, lat)."""
+    mx, my = metres_per_degree(origin[1])
+    return (np.asarray(lon) - origin[0]) * mx, (np.asarray(lat) - origin[1]) * my
+
+def points_in_polygon(xs: np.ndarray, ys: np.ndarray, rings: List[np.ndarray], chunk: int = 4096) -> np.ndarray:
+    """Even-odd rule over every ring (so holes are excluded), vectorised over points."""
+    inside = np.zeros(xs.shape, bool)
+    for start in range(0, xs.size, chunk):
+        px, py = xs[start:start + chunk, None], ys[start:start + chunk, None]
+        acc = inside[start:start + chunk]
+        for ring in rings:
+            x1, y1 = ring[:-1, 0], ring[:-1, 1]
+            x2, y2 = ring[1:, 0], ring[1:, 1]
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_at = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            acc ^= np.count_nonzero(crosses & (px < x_at), axis=1) % 2 == 1
+    return inside
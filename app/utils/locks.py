@@ -0,0 +1,12 @@
+import threading
+
+class KeyedLocks:
+    """One threading.Lock per key, e.g. to build a derived artifact only once."""
+
+    def __init__(self):
+        self._locks: dict = {}
+        self._guard = threading.Lock()
+
+    def __call__(self, key) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
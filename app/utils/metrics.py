@@ -0,0 +1,145 @@
+# app/utils/metrics.py
+# Prometheus metrics, exposed at /metrics.
+#
+# - HTTP: latency histogram, in-flight gauge and request/response body bytes
+#   per route template (so /files/{filename} is the file-serve volume, and
+#   sendfile responses are counted from their zerocopysend messages)
+# - uploads: bytes accepted per upload kind; rate() gives bytes/sec
+# - file GC: files and bytes reclaimed, by tombstone collection or orphan sweep
+# - Mongo: command latency per (collection, command) from a PyMongo
+#   CommandListener registered on the Motor client
+import threading
+import time
+from typing import Optional
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.utils import profiler
+
+_UNMATCHED = "<unmatched>"
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled", ["method", "route"])
+REQUEST_BYTES = Counter("http_request_bytes_total", "Request body bytes received", ["method", "route"])
+RESPONSE_BYTES = Counter("http_response_bytes_total", "Response body bytes sent", ["method", "route"])
+UPLOAD_BYTES = Counter("upload_bytes_total", "Upload bytes accepted into storage", ["kind"])
+GC_FILES = Counter("gc_reclaimed_files_total", "Stored files deleted by the file GC", ["source"])
+GC_BYTES = Counter("gc_reclaimed_bytes_total", "Stored bytes deleted by the file GC", ["source"])
+MONGO_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trip", ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5),
+)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "MongoDB commands that failed", ["collection", "command"])
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def _route_of(app, scope: Scope) -> str:
+    # route templates, not raw paths, keep the label set bounded
+    path = scope["path"]
+    for route in getattr(app, "routes", ()):
+        regex = getattr(route, "path_regex", None)
+        if regex is not None and regex.match(path):
+            return route.path
+    return _UNMATCHED
+
+class MetricsMiddleware:
+    """Pure ASGI so streamed and zero-copy bodies are measured as they go out."""
+
+    def __init__(self, app: ASGIApp, router=None):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = _route_of(self.router, scope)
+        received = sent = 0
+        status = 500
+        streaming = False
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal sent, status, streaming
+            kind = message["type"]
+            if kind == "http.response.start":
+                status = message["status"]
+                streaming = any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in message.get("headers", ()))
+            elif kind == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif kind == "http.response.zerocopysend":
+                sent += message["count"]
+            await send(message)
+
+        in_progress = IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            end = time.perf_counter()
+            in_progress.dec()
+            REQUEST_SECONDS.labels(method, route, str(status)).observe(end - start)
+            if received:
+                REQUEST_BYTES.labels(method, route).inc(received)
+            if sent:
+                RESPONSE_BYTES.labels(method, route).inc(sent)
+        # an event stream is long by design, not slow
+        if profiler.enabled() and not streaming:
+            await run_in_threadpool(profiler.dump_if_slow, method, route, start, end)
+
+# Commands whose first field is not a collection name.
+_NO_COLLECTION = {"ping", "hello", "ismaster", "isMaster", "buildInfo", "endSessions", "listCollections",
+                  "listDatabases", "saslStart", "saslContinue"}
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command by (collection, command).
+
+    Succeeded/failed events carry the duration but not the command body, so
+    the collection is remembered from the started event until then.
+    """
+
+    def __init__(self):
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return event.connection_id, event.request_id, event.operation_id
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        name = event.command_name
+        if name in _NO_COLLECTION:
+            collection = "-"
+        elif name == "getMore":
+            collection = str(event.command.get("collection", "-"))
+        else:
+            collection = event.command.get(name)
+            collection = collection if isinstance(collection, str) else "-"
+        with self._lock:
+            self._pending[self._key(event)] = collection
+
+    def _done(self, event) -> Optional[str]:
+        with self._lock:
+            return self._pending.pop(self._key(event), None)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._done(event) or "-"
+        MONGO_SECONDS.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._done(event) or "-"
+        MONGO_SECONDS.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
@@ -0,0 +1,81 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Literal, Optional, Sequence
+from fastapi import HTTPException
+
+Order = Literal["asc", "desc"]
+MAX_LIMIT = 1000
+
+@dataclass
+class Page:
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
+@dataclass
+class Keyset:
+    """Sort keys of a list endpoint, e.g. ("createdAt", "id"); the last one must be unique."""
+    fields: Sequence[str]
+    order: Order = "asc"
+    after: Optional[List[Any]] = field(default=None)
+
+    @property
+    def direction(self) -> int:
+        return 1 if self.order == "asc" else -1
+
+    def sort(self) -> list:
+        return [(f, self.direction) for f in self.fields]
+
+    def filter(self) -> dict:
+        """Match documents strictly after `after` in sort order."""
+        if self.after is None:
+            return {}
+        op = "$gt" if self.order == "asc" else "$lt"
+        clauses = []
+        for i, name in enumerate(self.fields):
+            clause = {f: v for f, v in zip(self.fields[:i], self.after[:i])}
+            clause[name] = {op: self.after[i]}
+            clauses.append(clause)
+        return {"$or": clauses}
+
+    def cursor_for(self, doc: dict) -> str:
+        values = [doc.get(f) for f in self.fields]
+        payload = {"o": self.order, "v": [{"$d": v.isoformat()} if isinstance(v, datetime) else v for v in values]}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def keyset(fields: Sequence[str], order: Order, cursor: Optional[str]) -> Keyset:
+    ks = Keyset(fields=fields, order=order)
+    if cursor:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            values = [datetime.fromisoformat(v["$d"]) if isinstance(v, dict) else v for v in payload["v"]]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if payload.get("o") != order or len(values) != len(fields):
+            raise HTTPException(status_code=400, detail="Cursor does not match this query")
+        ks.after = values
+    return ks
+
+def page_of(docs: List[dict], ks: Keyset, limit: Optional[int]) -> Page:
+    """Trim a `limit + 1` fetch to a page and compute its next cursor."""
+    if limit is None or len(docs) <= limit:
+        return Page(items=docs)
+    docs = docs[:limit]
+    return Page(items=docs, next_cursor=ks.cursor_for(docs[-1]))
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[set]:
+    """`fields=a,b` -> {"a", "b"}; None means every field."""
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return wanted
+
+def page_headers(request, page: Page) -> dict:
+    if not page.next_cursor:
+        return {}
+    next_url = request.url.include_query_params(cursor=page.next_cursor)
+    return {"X-Next-Cursor": page.next_cursor, "Link": f'<{next_url}>; rel="next"'}
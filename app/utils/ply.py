@@ -0,0 +1,114 @@
+"""Vectorized PLY reading.
+
+Binary vertex data is memory-mapped and viewed as a NumPy structured array,
+so nothing is decoded until a column is touched; ASCII bodies go through
+NumPy's C text parser. Only the vertex element is read.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+
+_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+_ENDIAN = {"binary_little_endian": "<", "binary_big_endian": ">", "ascii": "<"}
+
+class PlyError(ValueError):
+    pass
+
+@dataclass
+class PlyElement:
+    name: str
+    count: int
+    properties: List[Tuple[str, str]] = field(default_factory=list)  # (name, numpy type code)
+    has_list: bool = False
+
+@dataclass
+class PlyHeader:
+    format: str
+    elements: List[PlyElement]
+    data_offset: int
+    comments: List[str] = field(default_factory=list)
+
+    def element(self, name: str) -> Optional[PlyElement]:
+        return next((e for e in self.elements if e.name == name), None)
+
+def read_header(path) -> PlyHeader:
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise PlyError("Not a PLY file")
+        fmt, elements, comments = None, [], []
+        while True:
+            raw = f.readline()
+            if not raw:
+                raise PlyError("Unterminated PLY header")
+            parts = raw.decode("ascii", "replace").split()
+            if not parts:
+                continue
+            if parts[0] == "end_header":
+                break
+            if parts[0] == "format":
+                fmt = parts[1]
+            elif parts[0] == "comment":
+                comments.append(" ".join(parts[1:]))
+            elif parts[0] == "element":
+                elements.append(PlyElement(parts[1], int(parts[2])))
+            elif parts[0] == "property" and elements:
+                if parts[1] == "list":
+                    elements[-1].has_list = True
+                    elements[-1].properties.append((parts[4], "list"))
+                else:
+                    if parts[1] not in _TYPES:
+                        raise PlyError(f"Unknown PLY type {parts[1]!r}")
+                    elements[-1].properties.append((parts[2], _TYPES[parts[1]]))
+        if fmt not in _ENDIAN:
+            raise PlyError(f"Unsupported PLY format {fmt!r}")
+        return PlyHeader(format=fmt, elements=elements, data_offset=f.tell(), comments=comments)
+
+def vertex_dtype(header: PlyHeader) -> np.dtype:
+    vertex = header.element("vertex")
+    if vertex is None:
+        raise PlyError("PLY has no vertex element")
+    if vertex.has_list:
+        raise PlyError("List properties on vertices are not supported")
+    return np.dtype([(name, _ENDIAN[header.format] + code) for name, code in vertex.properties])
+
+def read_vertices(path, header: Optional[PlyHeader] = None) -> np.ndarray:
+    """Vertex records as a structured array (a read-only memmap for binary files)."""
+    header = header or read_header(path)
+    dtype = vertex_dtype(header)
+    count = header.element("vertex").count
+    # Vertex data must come first for the offset to be known without parsing.
+    if header.elements[0].name != "vertex":
+        raise PlyError("Vertex element must be the first element")
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    if header.format == "ascii":
+        with open(path, "rb") as f:
+            f.seek(header.data_offset)
+            cols = np.loadtxt(f, dtype=np.float64, max_rows=count, usecols=range(len(dtype.names)), ndmin=2)
+        out = np.empty(count, dtype=dtype)
+        for i, name in enumerate(dtype.names):
+            out[name] = cols[:, i]
+        return out
+    if Path(path).stat().st_size < header.data_offset + count * dtype.itemsize:
+        raise PlyError("Truncated PLY vertex data")
+    return np.memmap(path, dtype=dtype, mode="r", offset=header.data_offset, shape=(count,))
+
+def positions(vertices: np.ndarray) -> np.ndarray:
+    return np.column_stack([vertices["x"], vertices["y"], vertices["z"]]).astype(np.float64, copy=False)
+
+def colors(vertices: np.ndarray) -> Optional[np.ndarray]:
+    names = vertices.dtype.names
+    for r, g, b in (("red", "green", "blue"), ("r", "g", "b"), ("diffuse_red", "diffuse_green", "diffuse_blue")):
+        if r in names and g in names and b in names:
+            rgb = np.column_stack([vertices[r], vertices[g], vertices[b]])
+            if rgb.dtype != np.uint8:
+                top = 1.0 if np.issubdtype(rgb.dtype, np.floating) else float(np.iinfo(rgb.dtype).max)
+                rgb = np.clip(rgb.astype(np.float32) * (255.0 / top), 0, 255).astype(np.uint8)
+            return rgb
+    return None
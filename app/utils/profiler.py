@@ -0,0 +1,101 @@
+# app/utils/profiler.py
+# Opt-in sampling profiler for slow requests (PROFILE_SLOW_MS > 0).
+#
+# A daemon thread snapshots every thread's Python stack (sys._current_frames)
+# every PROFILE_INTERVAL_MS into a ring buffer covering the last WINDOW_S
+# seconds. When a request takes longer than the threshold, the samples taken
+# while it ran are written to cache_dir/profiles/ as collapsed stacks, one
+# "thread;outer;...;inner count" line per distinct stack: the input format of
+# flamegraph.pl, speedscope and inferno. Async handlers share the loop thread,
+# so a dump also shows whatever else was in flight at the time; threadpool
+# work (file IO, numpy) appears under its worker thread.
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from app.core.config import settings
+
+WINDOW_S = 120.0
+MAX_DUMPS = 200  # oldest profiles are pruned past this
+
+class SamplingProfiler:
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._samples: deque = deque(maxlen=int(WINDOW_S / interval_s) * 8)
+        self._labels: dict = {}  # code object -> "func (file:line)"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                # idle pool workers park in threading.Condition.wait
+                if ident == me or frame.f_code.co_filename == threading.__file__:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples.append((now, ";".join(reversed(stack))))
+
+    def collapsed(self, start: float, end: float) -> Counter:
+        return Counter(stack for t, stack in list(self._samples) if start <= t <= end)
+
+_profiler: Optional[SamplingProfiler] = None
+
+def enabled() -> bool:
+    return _profiler is not None
+
+def start() -> None:
+    global _profiler
+    if settings.profile_slow_ms > 0 and _profiler is None:
+        _profiler = SamplingProfiler(settings.profile_interval_ms / 1000)
+        _profiler.start()
+
+def stop() -> None:
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+def dump_if_slow(method: str, route: str, start: float, end: float) -> Optional[Path]:
+    """Write the request's samples if it crossed the threshold. Blocking."""
+    if _profiler is None or (end - start) * 1000 < settings.profile_slow_ms:
+        return None
+    stacks = _profiler.collapsed(start, end)
+    if not stacks:
+        return None
+    out_dir = Path(settings.cache_dir) / "profiles"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    slug = "".join(c if c.isalnum() else "_" for c in route).strip("_") or "root"
+    path = out_dir / f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{method}-{slug}-{int((end - start) * 1000)}ms.folded"
+    path.write_text("".join(f"{stack} {n}\n" for stack, n in stacks.most_common()))
+    dumps = sorted(out_dir.glob("*.folded"))
+    for old in dumps[:-MAX_DUMPS]:
+        old.unlink(missing_ok=True)
+    return path
@@ -0,0 +1,161 @@
+import os
+import types
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple, Type, Union, get_args, get_origin
+import anyio
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+class FileRegionResponse(Response):
+    """Send one or more byte regions of a file.
+
+    With a single region the body is the raw bytes; with several it is a
+    multipart/byteranges body, each part introduced by its own headers. When
+    the server offers the ASGI `http.response.zerocopysend` extension the
+    regions go out through sendfile; otherwise they are read in a worker
+    thread with pread, CHUNK_SIZE at a time, without touching the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        regions: List[Tuple[int, int]],          # (offset, length)
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None,
+        part_headers: Optional[List[bytes]] = None,
+        closing: bytes = b"",
+        send_body: bool = True,
+        background: Optional[BackgroundTask] = None,
+    ):
+        self.path = path
+        self.regions = regions
+        self.part_headers = part_headers or [b""] * len(regions)
+        self.closing = closing
+        self.send_body = send_body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = background
+        self.init_headers(headers)
+        length = sum(n for _, n in regions) + sum(len(h) for h in self.part_headers) + len(closing)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+            try:
+                for (offset, length), head in zip(self.regions, self.part_headers):
+                    if head:
+                        await send({"type": "http.response.body", "body": head, "more_body": True})
+                    if zerocopy:
+                        await send({"type": "http.response.zerocopysend", "file": fd, "offset": offset, "count": length, "more_body": True})
+                        continue
+                    end = offset + length
+                    while offset < end:
+                        chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, end - offset), offset)
+                        if not chunk:
+                            break
+                        offset += len(chunk)
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": self.closing, "more_body": False})
+            finally:
+                os.close(fd)
+        if self.background is not None:
+            await self.background()
+
+# List endpoints return documents that were validated by their model when
+# they were written. Re-validating every item against response_model on the
+# way out (then serializing it, then json.dumps-ing the result) dominates
+# the CPU of large lists, so they return a JSONArrayResponse instead: the
+# route keeps response_model for the OpenAPI schema, and each item is only
+# trimmed to the model's fields by shaper() and encoded with orjson.
+
+BATCH_ITEMS = 500   # items per body chunk; one body with Content-Length up to this
+
+def _converter(annotation) -> Optional[Callable]:
+    """Function applying nested model shapers to a value of this type, or None if none apply."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        shape = shaper(annotation)
+        return lambda v: shape(v) if isinstance(v, dict) else v
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is list and args:
+        inner = _converter(args[0])
+        return inner and (lambda v: [inner(x) for x in v] if isinstance(v, list) else v)
+    if origin is dict and len(args) == 2:
+        inner = _converter(args[1])
+        return inner and (lambda v: {k: inner(x) for k, x in v.items()} if isinstance(v, dict) else v)
+    if origin in (Union, types.UnionType):
+        # Optional[Model] and the like; None and other members pass through
+        found = [c for c in map(_converter, args) if c is not None]
+        return found[0] if found else None
+    return None
+
+@lru_cache(maxsize=None)
+def shaper(model: Type[BaseModel]) -> Callable[[dict], dict]:
+    """dict -> dict with exactly `model`'s fields, in order: extra keys are
+    dropped and missing ones get the field default, down through nested
+    models. Nothing is validated; use it on documents that were."""
+    fields = [(name, info, _converter(info.annotation)) for name, info in model.model_fields.items()]
+
+    def shape(doc: dict) -> dict:
+        out = {}
+        for name, info, convert in fields:
+            if name in doc:
+                value = doc[name]
+                out[name] = convert(value) if convert is not None and value is not None else value
+            else:
+                out[name] = info.get_default(call_default_factory=True)
+        return out
+    return shape
+
+def _dumps(items: list) -> bytes:
+    return orjson.dumps(items, default=jsonable_encoder)
+
+class JSONArrayResponse(Response):
+    """A list of dicts as a JSON array, encoded with orjson.
+
+    Up to BATCH_ITEMS items go out as one body with a Content-Length; longer
+    lists are streamed a batch at a time, so the first bytes leave before
+    the last item is encoded.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        items: list,
+        shape: Optional[Callable[[dict], dict]] = None,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+    ):
+        self.items = items
+        self.shape = shape
+        self.status_code = status_code
+        self.background = None
+        if len(items) <= BATCH_ITEMS:
+            self.body = self._encode(items)
+        self.init_headers(headers)
+
+    def _encode(self, items: list) -> bytes:
+        return _dumps([self.shape(x) for x in items] if self.shape else items)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if hasattr(self, "body"):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        for start in range(0, len(self.items), BATCH_ITEMS):
+            chunk = self._encode(self.items[start:start + BATCH_ITEMS])
+            # "[a,b]" -> "[a,b" then ",c,d" ... and a closing "]"
+            await send({"type": "http.response.body", "body": (b"," if start else b"[") + chunk[1:-1], "more_body": True})
+        await send({"type": "http.response.body", "body": b"]", "more_body": False})
@@ -0,0 +1,69 @@
+# benchmarks/_server.py
+"""Run app.main:app under uvicorn for the benchmark suite.
+
+    python -m benchmarks._server --port 8765 [--mongo mongomock]
+
+With --mongo mongomock the app talks to an in-process mongomock-motor
+database instead of a server. mongomock is close enough for the API paths
+the suite drives, with two gaps patched below: $lookup with both
+localField/foreignField and a sub-pipeline (used to join beds to their
+spatial maps), and find_one_and_update returning None when the projection
+only excludes _id. Without --mongo mongomock, MONGODB_URI is used as is
+(e.g. a throwaway mongod started by the suite).
+"""
+import argparse
+
+import uvicorn
+
+
+def _patch_mongomock() -> None:
+    import mongomock.aggregate as aggregate
+    import mongomock.collection as collection
+
+    plain_lookup = aggregate._PIPELINE_HANDLERS["$lookup"]
+
+    def lookup(in_collection, database, options):
+        if "pipeline" not in options or "let" in options:
+            return plain_lookup(in_collection, database, options)
+        joined = plain_lookup(in_collection, database, {k: v for k, v in options.items() if k != "pipeline"})
+        for doc in joined:
+            doc[options["as"]] = list(aggregate.process_pipeline(doc[options["as"]], database, options["pipeline"], None))
+        return joined
+
+    aggregate._PIPELINE_HANDLERS["$lookup"] = lookup
+
+    find_and_modify = collection.Collection._find_and_modify
+
+    def find_and_modify_excluding_id(self, query, projection=None, *args, **kwargs):
+        if isinstance(projection, dict) and projection.get("_id") == 0 and all(v == 0 for v in projection.values()):
+            doc = find_and_modify(self, query, {k: v for k, v in projection.items() if k != "_id"} or None, *args, **kwargs)
+            if doc:
+                doc.pop("_id", None)
+            return doc
+        return find_and_modify(self, query, projection, *args, **kwargs)
+
+    collection.Collection._find_and_modify = find_and_modify_excluding_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mongo", choices=["uri", "mongomock"], default="uri")
+    args = parser.parse_args()
+
+    if args.mongo == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        import app.db.mongo as mongo
+
+        _patch_mongomock()
+        mongo._client = AsyncMongoMockClient()
+
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/events_fanout.py
+"""SSE fan-out: delivery latency and completeness of /events against a live server.
+
+    uvicorn app.main:app
+    python -m benchmarks.events_fanout --base-url http://127.0.0.1:8000 --subscribers 500 --events 200
+
+Opens --subscribers streams on /events?plot=<scratch plot>, then creates,
+renames and deletes beds on that plot until --events writes were made. Each
+subscriber timestamps the frames it receives; latency is measured from just
+before the write request was sent, so it includes the write itself. The
+report lists delivered vs expected events and any dropped (reset) streams.
+The plot is deleted afterwards.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks._common import Timer, print_table, summarize
+
+
+async def _subscribe(client: httpx.AsyncClient, plot_id: str, ready: asyncio.Event, received: list, stats: dict) -> None:
+    async with client.stream("GET", "/events", params={"plot": plot_id}) as r:
+        r.raise_for_status()
+        ready.set()
+        event = None
+        async for line in r.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event:
+                if event == "reset":
+                    stats["resets"] += 1
+                    return
+                received.append((event, json.loads(line[6:])["id"], time.perf_counter()))
+                event = None
+
+
+async def _write(client: httpx.AsyncClient, plot_id: str, i: int, sent: dict) -> str:
+    lon = i * 2e-5
+    ring = [[lon, 0.0], [lon + 1e-5, 0.0], [lon + 1e-5, 1e-4], [lon, 1e-4]]
+    # ids are assigned by the server, so creates are keyed once the answer is in
+    # (the event may well arrive first; latencies are matched up afterwards)
+    start = time.perf_counter()
+    bed = (await client.post(f"/plots/{plot_id}/beds", json={"name": f"fanout-{i}", "coordinates": [ring]})).raise_for_status().json()
+    sent[("bed.created", bed["id"])] = start
+    sent[("bed.updated", bed["id"])] = time.perf_counter()
+    (await client.patch(f"/plots/{plot_id}/beds/{bed['id']}", json={"name": f"fanout-{i}-renamed"})).raise_for_status()
+    sent[("bed.deleted", bed["id"])] = time.perf_counter()
+    (await client.delete(f"/plots/{plot_id}/beds/{bed['id']}")).raise_for_status()
+    return bed["id"]
+
+
+async def main(args) -> None:
+    kinds = ("bed.created", "bed.updated", "bed.deleted")
+    stats = {"resets": 0}
+    sent: dict = {}
+    received: list = []
+    limits = httpx.Limits(max_connections=args.subscribers + 16)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=httpx.Timeout(60, read=None), limits=limits) as client:
+        plot = (await client.post("/plots", files={"file": ("fanout-bench.tif", b"bench", "image/tiff")})).raise_for_status().json()
+        readies = [asyncio.Event() for _ in range(args.subscribers)]
+        subs = [asyncio.create_task(_subscribe(client, plot["id"], e, received, stats)) for e in readies]
+        try:
+            await asyncio.wait_for(asyncio.gather(*[e.wait() for e in readies]), 60)
+            with Timer() as t:
+                rounds = max(1, args.events // len(kinds))
+                for start in range(0, rounds, args.concurrency):
+                    batch = range(start, min(rounds, start + args.concurrency))
+                    await asyncio.gather(*[_write(client, plot["id"], i, sent) for i in batch])
+                # let the last frames arrive
+                await asyncio.sleep(args.settle)
+        finally:
+            for task in subs:
+                task.cancel()
+            await asyncio.gather(*subs, return_exceptions=True)
+            await client.delete(f"/plots/{plot['id']}")
+
+    latencies = {k: [] for k in kinds}
+    for event, doc_id, at in received:
+        start = sent.get((event, doc_id))
+        if start is not None:
+            latencies[event].append(at - start)
+    delivered = sum(len(v) for v in latencies.values())
+    print_table({k: summarize(latencies[k], t.elapsed) for k in kinds})
+    expected = rounds * len(kinds) * args.subscribers
+    print(f"\n{rounds * len(kinds)} events x {args.subscribers} subscribers: "
+          f"{delivered}/{expected} delivered ({delivered / expected:.1%}), "
+          f"{stats['resets']} streams reset")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--events", type=int, default=300, help="writes in total (create/rename/delete)")
+    parser.add_argument("--concurrency", type=int, default=4, help="beds written at once")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait for stragglers")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+# benchmarks/file_serving.py
+"""Throughput of the /files route versus a bare StaticFiles mount.
+
+    python -m benchmarks.file_serving --size-mb 64 --concurrency 16 --seconds 10
+
+Starts two uvicorn servers on the same synthetic file: the old StaticFiles
+mount and app.routers.files. It measures full GETs, 1 MiB range GETs and
+conditional revalidations. StaticFiles (Starlette 0.37) ignores Range, so
+its range row is a full download every time.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+
+from benchmarks._common import print_table, summarize
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int) -> None:
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+async def _drive(base: str, path: str, headers: dict, concurrency: int, seconds: float):
+    latencies, transferred = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal transferred
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            async with client.stream("GET", path, headers=headers) as r:
+                async for chunk in r.aiter_raw():
+                    transferred += len(chunk)
+            latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    row = summarize(latencies, elapsed)
+    row["MB/s"] = transferred / elapsed / 2**20
+    return row
+
+
+async def main(args) -> None:
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["FILES_DIR"] = root
+        os.environ["CACHE_DIR"] = os.path.join(root, ".cache")
+        from fastapi import FastAPI
+        from starlette.staticfiles import StaticFiles
+        from app.routers.files import router
+
+        name = "0" * 64 + ".tif"
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(os.urandom(args.size_mb * 2**20))
+
+        static_app = FastAPI()
+        static_app.mount("/files", StaticFiles(directory=root), name="files")
+        route_app = FastAPI()
+        route_app.include_router(router)
+
+        rows = {}
+        for label, app in (("StaticFiles", static_app), ("files route", route_app)):
+            port = _free_port()
+            _serve(app, port)
+            base = f"http://127.0.0.1:{port}"
+            async with httpx.AsyncClient(base_url=base) as client:
+                etag = (await client.head(f"/files/{name}")).headers.get("etag", '"none"')
+            scenarios = {
+                "full": {},
+                "range 1MiB": {"Range": "bytes=1048576-2097151"},
+                "revalidate": {"If-None-Match": etag},
+            }
+            for scenario, headers in scenarios.items():
+                rows[f"{label}: {scenario}"] = await _drive(base, f"/files/{name}", headers, args.concurrency, args.seconds)
+
+    print_table(rows)
+    print()
+    for name, r in rows.items():
+        print(f"{name:<28}{r['MB/s']:>10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+# benchmarks/list_serialization.py
+"""List endpoint serialization: response_model validation vs JSONArrayResponse.
+
+    python -m benchmarks.list_serialization --beds 5000 --maps 2
+
+Builds --beds synthetic bed documents, each with --maps spatial maps, as the
+beds aggregation returns them. Two in-process routes serve that list, both
+declaring response_model=List[BedOut]. "before" returns the documents and
+lets FastAPI validate and serialize them. "after" returns them through
+JSONArrayResponse, as GET /plots/{id}/beds now does. The same comparison runs
+for a spatial-map list of hand-built SpatialMapOut objects. Requests go
+through httpx's ASGI transport, one at a time, so the CPU time per request is
+the server's work (plus the client's, identical on both sides). Both bodies
+are checked to decode to the same JSON first.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+
+from app.models.bed import BedOut
+from app.models.spatial_map import SpatialMapOut
+from app.utils.responses import JSONArrayResponse, shaper
+from benchmarks._common import print_table, summarize
+
+
+def _map(i: int, j: int, t0: datetime) -> dict:
+    name = f"{i:06x}{j:02x}" * 4
+    return {
+        "id": f"m{i}-{j}", "filename": f"{name}.ply", "fileName": f"scan-{j}.ply", "bytes": 48_000_000,
+        "sha256": name, "optimizedFilename": f"{name}.min.ply", "optimizedBytes": 9_500_000,
+        "compressedBytes": {"gzip": 8_100_000, "br": 7_400_000}, "contentType": "application/octet-stream",
+        "date": t0 + timedelta(days=j), "createdAt": t0 + timedelta(days=j, milliseconds=i),
+        "status": "ready", "error": None,
+        "metadata": {"format": "binary_little_endian", "vertexCount": 1_500_000, "bboxMin": [0.0, 0.0, 0.0],
+                     "bboxMax": [30.0, 1.2, 0.6], "density": 41666.7, "hasColor": True},
+        "stats": {"count": 48, "totalVolume": 1.92, "averageVolume": 0.04},
+    }
+
+
+def _bed(i: int, maps: int, t0: datetime) -> dict:
+    lon, lat = 5.0 + i * 2e-5, 52.0
+    ring = [[lon, lat], [lon + 1e-5, lat], [lon + 1e-5, lat + 1e-4], [lon, lat + 1e-4], [lon, lat]]
+    return {
+        "id": f"{i:032x}", "name": f"bed {i}", "coordinates": [ring], "bbox": [lon, lat, lon + 1e-5, lat + 1e-4],
+        "createdAt": t0 + timedelta(milliseconds=i), "updatedAt": t0 + timedelta(milliseconds=i),
+        "count": 48, "averageVolume": 0.04, "statsMapId": f"m{i}-0", "statsDate": t0,
+        "spatialMaps": [_map(i, j, t0) for j in range(maps)],
+    }
+
+
+def _app(beds: List[dict], maps: List[dict]) -> FastAPI:
+    app = FastAPI()
+    map_out = [{**m, "url": f"http://api/files/{m['optimizedFilename']}", "originalUrl": f"http://api/files/{m['filename']}"}
+               for m in maps]
+
+    @app.get("/beds/before", response_model=List[BedOut])
+    async def beds_before():
+        return beds
+
+    @app.get("/beds/after", response_model=List[BedOut])
+    async def beds_after():
+        return JSONArrayResponse(beds, shaper(BedOut))
+
+    @app.get("/maps/before", response_model=List[SpatialMapOut])
+    async def maps_before():
+        return [SpatialMapOut(**m) for m in map_out]
+
+    @app.get("/maps/after", response_model=List[SpatialMapOut])
+    async def maps_after():
+        return JSONArrayResponse(map_out, shaper(SpatialMapOut))
+
+    return app
+
+
+async def _measure(client: httpx.AsyncClient, path: str, requests: int) -> dict:
+    latencies = []
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        (await client.get(path)).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    return {**summarize(latencies, wall), "cpu_ms": cpu / requests * 1000}
+
+
+async def main(args) -> None:
+    t0 = datetime(2025, 5, 1, 8, 30, 0, 123000)
+    beds = [_bed(i, args.maps, t0) for i in range(args.beds)]
+    maps = [m for b in beds[: args.beds // 4 or 1] for m in b["spatialMaps"]] or [_map(0, 0, t0)]
+    transport = httpx.ASGITransport(app=_app(beds, maps))
+    rows = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for kind in ("beds", "maps"):
+            before, after = await client.get(f"/{kind}/before"), await client.get(f"/{kind}/after")
+            if json.loads(before.content) != json.loads(after.content):
+                raise SystemExit(f"{kind}: the two paths disagree")
+            print(f"{kind}: identical JSON, {len(before.content) / 1e6:.1f} MB before / {len(after.content) / 1e6:.1f} MB after")
+            for side in ("before", "after"):
+                rows[f"{kind} {side}"] = await _measure(client, f"/{kind}/{side}", args.requests)
+
+    print(f"\n{args.beds} beds x {args.maps} maps; {len(maps)} spatial maps")
+    print_table(rows)
+    print()
+    for name, r in rows.items():
+        print(f"{name:<28}{r['cpu_ms']:>10.1f} ms CPU/request")
+    for kind in ("beds", "maps"):
+        b, a = rows[f"{kind} before"], rows[f"{kind} after"]
+        print(f"{kind}: {a['rps'] / b['rps']:.1f}x requests/s, {b['cpu_ms'] / a['cpu_ms']:.1f}x less CPU per request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--beds", type=int, default=5000)
+    parser.add_argument("--maps", type=int, default=2, help="spatial maps per bed")
+    parser.add_argument("--requests", type=int, default=20, help="per scenario")
+    asyncio.run(main(parser.parse_args()))
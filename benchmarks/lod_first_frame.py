@@ -0,0 +1,98 @@
+# benchmarks/lod_first_frame.py
+"""LOD build time and time-to-first-frame for a synthetic binary PLY.
+
+    python -m benchmarks.lod_first_frame --points 25000000   # ~500 MB PLY
+
+Measures the offline build (what runs after upload) and what a viewer waits
+for before its first frame: reading meta.json plus the level-0 frame, versus
+reading the whole PLY. The build's peak anonymous memory (RssAnon, sampled;
+the memory-mapped PLY's page cache is not counted) shows that it stays
+bounded by the partition size rather than growing with the scan.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def _write_ply(path: str, n: int) -> None:
+    dtype = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4"),
+                      ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+    header = ("ply\nformat binary_little_endian 1.0\nelement vertex %d\n" % n
+              + "".join(f"property {'float' if t.kind == 'f' else 'uchar'} {name}\n" for name, (t, _) in dtype.fields.items())
+              + "end_header\n")
+    rng = np.random.default_rng(0)
+    with open(path, "wb") as f:
+        f.write(header.encode())
+        for start in range(0, n, 1_000_000):
+            block = np.zeros(min(1_000_000, n - start), dtype)
+            for axis, extent in zip("xyz", (30.0, 1.2, 0.6)):
+                block[axis] = rng.random(len(block)) * extent
+            block["red"] = rng.integers(0, 255, len(block))
+            block.tofile(f)
+
+
+def _rss_anon_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+class _PeakMemory(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = self.start_mb = _rss_anon_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.05):
+            self.peak = max(self.peak, _rss_anon_mb())
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["FILES_DIR"] = os.path.join(root, "files")
+        os.environ["CACHE_DIR"] = os.path.join(root, "cache")
+        from app.core.config import settings
+        from app.services import lod
+
+        filename = "bench.ply"
+        path = os.path.join(settings.files_dir, filename)
+        _write_ply(path, args.points)
+        size_mb = os.path.getsize(path) / 2**20
+
+        sampler = _PeakMemory()
+        sampler.start()
+        t0 = time.perf_counter()
+        lod.build_lod(filename)
+        build = time.perf_counter() - t0
+        sampler.done.set()
+        sampler.join()
+
+        t0 = time.perf_counter()
+        meta = lod.load_meta(filename)
+        first = next(lod.iter_frames(filename, meta, max_level=0))
+        first_frame = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with open(path, "rb") as f:
+            while f.read(8 << 20):
+                pass
+        full_read = time.perf_counter() - t0
+
+    print(f"PLY: {args.points:,} points, {size_mb:.0f} MB")
+    print(f"LOD build:           {build:8.2f} s ({len(meta['nodes'])} nodes, {meta['levels']} levels)")
+    print(f"build peak memory:   {sampler.peak - sampler.start_mb:8.0f} MB above baseline (RssAnon)")
+    print(f"meta + level-0 frame:{first_frame * 1000:8.1f} ms ({len(first) / 2**10:.0f} KiB)")
+    print(f"whole PLY read:      {full_read * 1000:8.1f} ms (before any client-side parsing)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=5_000_000)
+    main(parser.parse_args())
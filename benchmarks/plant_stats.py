@@ -0,0 +1,92 @@
+# benchmarks/plant_stats.py
+"""Plant statistics on a synthetic bed scan.
+
+    python -m benchmarks.plant_stats --points 10000000
+
+Writes a binary PLY of a 30 m x 1.2 m bed: a gently sloping, noisy ground
+plane plus --plants dome-shaped plants in two rows, in the rover's frame
+(metres from the bed's SW corner). Times the cold computation and the cached
+lookup, and checks the detected plant count against the known count.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+_WIDTH, _DEPTH = 30.0, 1.2
+
+
+def _write_ply(path: str, n: int, plants: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    per_row = plants // 2
+    cx = np.tile((np.arange(per_row) + 0.5) * _WIDTH / per_row, 2)
+    cy = np.repeat([_DEPTH * 0.3, _DEPTH * 0.7], per_row)
+    radius = rng.uniform(0.12, 0.2, cx.size)
+    height = rng.uniform(0.2, 0.45, cx.size)
+    header = (f"ply\nformat binary_little_endian 1.0\nelement vertex {n}\n"
+              "property float x\nproperty float y\nproperty float z\n"
+              "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n")
+    with open(path, "wb") as f:
+        f.write(header.encode())
+        for start in range(0, n, 1_000_000):
+            m = min(1_000_000, n - start)
+            v = np.zeros(m, _DTYPE)
+            # 40% of the points on plants, the rest on bare ground
+            on_plant = rng.random(m) < 0.4
+            which = rng.integers(0, cx.size, m)
+            r = radius[which] * np.sqrt(rng.random(m))
+            a = rng.random(m) * 2 * np.pi
+            x = np.where(on_plant, cx[which] + r * np.cos(a), rng.random(m) * _WIDTH)
+            y = np.where(on_plant, cy[which] + r * np.sin(a), rng.random(m) * _DEPTH)
+            ground = 0.02 * x + 0.05 * y + rng.normal(0, 0.005, m)
+            dome = height[which] * np.sqrt(np.clip(1 - (r / radius[which]) ** 2, 0, 1))
+            v["x"], v["y"] = x, y
+            v["z"] = ground + np.where(on_plant, dome, 0)
+            v["green"] = np.where(on_plant, 180, 90)
+            v.tofile(f)
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["FILES_DIR"] = os.path.join(root, "files")
+        os.environ["CACHE_DIR"] = os.path.join(root, "cache")
+        os.makedirs(os.environ["FILES_DIR"])
+        from app.core.config import settings
+        from app.services import plant_stats
+        from app.utils.geo import metres_per_degree
+
+        filename = "bench.ply"
+        path = os.path.join(settings.files_dir, filename)
+        t0 = time.perf_counter()
+        _write_ply(path, args.points, args.plants)
+        write = time.perf_counter() - t0
+
+        lon0, lat0 = -87.753, 30.642
+        mx, my = metres_per_degree(lat0)
+        ring = [[lon0, lat0], [lon0 + _WIDTH / mx, lat0], [lon0 + _WIDTH / mx, lat0 + _DEPTH / my],
+                [lon0, lat0 + _DEPTH / my], [lon0, lat0]]
+
+        t0 = time.perf_counter()
+        stats = plant_stats.compute_stats(filename, [ring])
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        plant_stats.compute_stats(filename, [ring])
+        warm = time.perf_counter() - t0
+
+    print(f"PLY: {args.points:,} points written in {write:.1f} s")
+    print(f"cold:   {cold:8.2f} s ({args.points / cold / 1e6:.1f} M points/s, cell {stats['cellSize'] * 100:.1f} cm)")
+    print(f"cached: {warm * 1000:8.2f} ms")
+    print(f"plants: {stats['count']} detected / {args.plants // 2 * 2} generated, "
+          f"{stats['bedPoints']:,} points inside the bed")
+    if stats["count"]:
+        print(f"height median {stats['height']['median']:.3f} m, volume median {stats['volume']['median'] * 1000:.2f} L")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--plants", type=int, default=120)
+    main(parser.parse_args())
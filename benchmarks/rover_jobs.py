@@ -0,0 +1,83 @@
+# benchmarks/rover_jobs.py
+"""Rover job throughput, queueing delay and backpressure against a live server.
+
+    ROVER_FAKE_POINTS=500000 ROVER_FAKE_SCAN_S=1 uvicorn app.main:app
+    python -m benchmarks.rover_jobs --base-url http://127.0.0.1:8000 --beds 40
+
+Creates a scratch plot with --beds beds and requests a collection for every
+bed at once (the server's FakeRoverProducer does the scanning). 429 answers
+are retried after Retry-After and counted. Each job is then polled until it
+finishes. The report covers submit latency, time spent queued and the
+end-to-end time until the spatial map is attached. The plot is deleted
+afterwards.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks._common import Timer, print_table, summarize
+
+
+def _ts(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+async def _run_job(client: httpx.AsyncClient, plot_id: str, bed_id: str, poll: float, stats: dict) -> dict:
+    start = time.perf_counter()
+    while True:
+        r = await client.post(f"/plots/{plot_id}/beds/{bed_id}/collect-rover-data")
+        if r.status_code != 429:
+            break
+        stats["rejected"] += 1
+        await asyncio.sleep(float(r.headers.get("retry-after", 1)))
+    r.raise_for_status()
+    stats["submit"].append(time.perf_counter() - start)
+    url = r.headers["location"]
+    while True:
+        job = (await client.get(url)).raise_for_status().json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        await asyncio.sleep(poll)
+    stats["end_to_end"].append(time.perf_counter() - start)
+    if job["startedAt"]:
+        stats["queued"].append(_ts(job["startedAt"]) - _ts(job["createdAt"]))
+    return job
+
+
+async def main(args) -> None:
+    stats = {"submit": [], "queued": [], "end_to_end": [], "rejected": 0}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+        plot = (await client.post("/plots", files={"file": ("rover-bench.tif", b"bench", "image/tiff")})).raise_for_status().json()
+        try:
+            beds = []
+            for i in range(args.beds):
+                lon = i * 2e-5
+                ring = [[lon, 0.0], [lon + 1e-5, 0.0], [lon + 1e-5, 1e-4], [lon, 1e-4]]
+                r = await client.post(f"/plots/{plot['id']}/beds", json={"name": f"bench-{i}", "coordinates": [ring]})
+                beds.append(r.raise_for_status().json()["id"])
+            with Timer() as t:
+                jobs = await asyncio.gather(*[_run_job(client, plot["id"], b, args.poll, stats) for b in beds])
+        finally:
+            await client.delete(f"/plots/{plot['id']}")
+
+    print_table({
+        "submit (incl. 429 retries)": summarize(stats["submit"], t.elapsed),
+        "queued": summarize(stats["queued"], t.elapsed),
+        "end to end": summarize(stats["end_to_end"], t.elapsed),
+    })
+    failed = [j for j in jobs if j["status"] == "failed"]
+    print(f"\n{len(jobs)} jobs in {t.elapsed:.2f}s -> {len(jobs) / t.elapsed:.2f} jobs/s, "
+          f"{stats['rejected']} x 429, {len(failed)} failed")
+    for j in failed[:5]:
+        print(f"  {j['id']}: {j['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--beds", type=int, default=40)
+    parser.add_argument("--poll", type=float, default=0.25)
+    asyncio.run(main(parser.parse_args()))
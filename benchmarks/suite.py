@@ -0,0 +1,285 @@
+# benchmarks/suite.py
+"""API load suite with seeded data, latency percentiles and a regression gate.
+
+    python -m benchmarks.suite --save-baseline bench-baseline.json
+    python -m benchmarks.suite --baseline bench-baseline.json    # exit 1 on regression
+
+Starts app.main:app in a uvicorn subprocess (benchmarks._server) on scratch
+FILES_DIR/CACHE_DIR with a Mongo stand-in:
+
+  --mongo mongomock   in-process mongomock-motor (default; no server needed,
+                      but Mongo work then runs in the app's Python process)
+  --mongo inmemory    a throwaway mongod from pymongo_inmemory (downloads the
+                      binary on first use)
+  --mongo uri         an existing server at --mongo-uri; use a scratch database
+
+Seeds --plots plots with --beds beds x --maps spatial maps each through the
+API, then runs every scenario for --duration seconds with --concurrency
+clients: plot list, bed list, bed create/patch/get/delete, spatial-map list,
+and TIF / PLY uploads (small synthetic files, distinct bytes per request so
+deduplication does not short-circuit them). Request order is drawn from
+--seed, so two runs issue the same traffic.
+
+A scenario regresses when its throughput drops, or its p95 rises, by more
+than --tolerance (fraction) against the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+from benchmarks._common import print_table, summarize
+
+_VERTEX = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+
+
+def _ply(points: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    v = np.zeros(points, _VERTEX)
+    v["x"], v["y"] = rng.uniform(0, 10, points), rng.uniform(0, 1.2, points)
+    v["z"] = rng.uniform(0, 0.5, points)
+    v["green"] = rng.integers(90, 200, points)
+    header = (f"ply\nformat binary_little_endian 1.0\nelement vertex {points}\n"
+              "property float x\nproperty float y\nproperty float z\n"
+              "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n")
+    return header.encode() + v.tobytes()
+
+
+def _tif(size: int, seed: int) -> bytes:
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    data = np.random.default_rng(seed).integers(0, 255, (3, size, size), dtype=np.uint8)
+    profile = dict(driver="GTiff", width=size, height=size, count=3, dtype="uint8", crs="EPSG:4326",
+                   transform=from_origin(-87.75, 30.65, 1e-6, 1e-6))
+    with MemoryFile() as mem:
+        with mem.open(**profile) as dst:
+            dst.write(data)
+        return mem.read()
+
+
+def _ring(i: int) -> list:
+    lon, lat = -87.75 + (i % 50) * 2e-5, 30.64 + (i // 50) * 2e-5
+    return [[lon, lat], [lon + 1e-5, lat], [lon + 1e-5, lat + 1e-5], [lon, lat + 1e-5], [lon, lat]]
+
+
+@contextmanager
+def _server(args):
+    root = tempfile.mkdtemp(prefix="florisys-bench-")
+    env = {**os.environ, "FILES_DIR": os.path.join(root, "files"), "CACHE_DIR": os.path.join(root, "cache"),
+           "PROCESSING_WORKERS": str(args.processing_workers)}
+    with ExitStack() as stack:
+        mongo = "mongomock"
+        if args.mongo == "inmemory":
+            from pymongo_inmemory import Mongod
+
+            env["MONGODB_URI"] = stack.enter_context(Mongod()).connection_string
+            mongo = "uri"
+        elif args.mongo == "uri":
+            env["MONGODB_URI"], mongo = args.mongo_uri, "uri"
+        env["MONGO_DB"] = f"florisys_bench_{os.getpid()}"
+        log = stack.enter_context(open(os.path.join(root, "server.log"), "wb"))
+        proc = subprocess.Popen([sys.executable, "-m", "benchmarks._server", "--port", str(args.port), "--mongo", mongo],
+                                env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base = f"http://127.0.0.1:{args.port}"
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"server did not start, see {log.name}")
+                time.sleep(0.2)
+            yield base
+        finally:
+            proc.terminate()
+            proc.wait(30)
+    # kept (with server.log) if the server never came up
+    shutil.rmtree(root, ignore_errors=True)
+
+
+async def _seed(client: httpx.AsyncClient, args) -> List[dict]:
+    plots = []
+    tif = _tif(64, 0)
+    ply = _ply(args.points, 0)
+    for p in range(args.plots):
+        plot = (await client.post("/plots", files={"file": (f"seed-{p}.tif", tif, "image/tiff")})).raise_for_status().json()
+        beds = []
+        for b in range(args.beds):
+            r = await client.post(f"/plots/{plot['id']}/beds", json={"name": f"bed-{b}", "coordinates": [_ring(b)]})
+            bed_id = r.raise_for_status().json()["id"]
+            for m in range(args.maps):
+                r = await client.post(f"/plots/{plot['id']}/beds/{bed_id}/spatial-maps",
+                                      files={"file": (f"scan-{m}.ply", ply, "application/octet-stream")},
+                                      data={"date": f"2025-0{1 + m % 9}-01"})
+                r.raise_for_status()
+            beds.append(bed_id)
+        plots.append({"id": plot["id"], "beds": beds})
+    return plots
+
+
+async def _settle(client: httpx.AsyncClient, plots: List[dict], timeout: float = 300) -> None:
+    # seeded uploads are processed in the background; measure after that
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        statuses = [p["status"] for p in (await client.get("/plots", params={"fields": "status"})).json()]
+        for plot in plots:
+            for bed_id in plot["beds"]:
+                r = await client.get(f"/plots/{plot['id']}/beds/{bed_id}/spatial-maps", params={"fields": "status"})
+                statuses += [m["status"] for m in r.json()]
+        if "pending" not in statuses:
+            return
+        await asyncio.sleep(0.5)
+    raise RuntimeError("seeded uploads are still pending")
+
+
+Op = Callable[[httpx.AsyncClient, random.Random, int], Awaitable[None]]
+
+
+def _scenarios(plots: List[dict], args) -> Dict[str, Op]:
+    def some_bed(rng: random.Random) -> tuple:
+        plot = rng.choice(plots)
+        return plot["id"], rng.choice(plot["beds"])
+
+    async def list_plots(client, rng, n):
+        (await client.get("/plots", params={"limit": 50})).raise_for_status()
+
+    async def list_beds(client, rng, n):
+        (await client.get(f"/plots/{rng.choice(plots)['id']}/beds")).raise_for_status()
+
+    async def bed_crud(client, rng, n):
+        plot_id = rng.choice(plots)["id"]
+        r = (await client.post(f"/plots/{plot_id}/beds", json={"name": f"crud-{n}", "coordinates": [_ring(n)]})).raise_for_status()
+        url = f"/plots/{plot_id}/beds/{r.json()['id']}"
+        (await client.patch(url, json={"name": f"crud-{n}-renamed"})).raise_for_status()
+        (await client.get(url)).raise_for_status()
+        (await client.delete(url)).raise_for_status()
+
+    async def list_maps(client, rng, n):
+        plot_id, bed_id = some_bed(rng)
+        (await client.get(f"/plots/{plot_id}/beds/{bed_id}/spatial-maps")).raise_for_status()
+
+    async def upload_tif(client, rng, n):
+        body = _tif(args.tif_size, 1_000_000 + n)
+        r = (await client.post("/plots", files={"file": (f"bench-{n}.tif", body, "image/tiff")})).raise_for_status()
+        (await client.delete(f"/plots/{r.json()['id']}")).raise_for_status()
+
+    async def upload_ply(client, rng, n):
+        plot_id, bed_id = some_bed(rng)
+        body = _ply(args.points, 1_000_000 + n)
+        url = f"/plots/{plot_id}/beds/{bed_id}/spatial-maps"
+        r = (await client.post(url, files={"file": (f"bench-{n}.ply", body, "application/octet-stream")})).raise_for_status()
+        (await client.delete(f"{url}/{r.json()['id']}")).raise_for_status()
+
+    return {"list plots": list_plots, "list beds": list_beds, "bed crud (4 requests)": bed_crud,
+            "list spatial maps": list_maps, "upload tif (+delete)": upload_tif, "upload ply (+delete)": upload_ply}
+
+
+async def _drive(client: httpx.AsyncClient, op: Op, args) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(10 ** 9))
+    stop_at = time.perf_counter() + args.duration
+
+    async def worker(i: int) -> None:
+        nonlocal errors
+        rng = random.Random(args.seed * 1000 + i)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                await op(client, rng, next(counter))
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(args.concurrency)])
+    return {**summarize(latencies, time.perf_counter() - start), "errors": errors}
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    problems = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if r["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{name}: {r['rps']:.1f} req/s vs {base['rps']:.1f} baseline")
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {r['p95_ms']:.1f} ms vs {base['p95_ms']:.1f} ms baseline")
+    return problems
+
+
+async def _run(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        t0 = time.perf_counter()
+        plots = await _seed(client, args)
+        await _settle(client, plots)
+        print(f"seeded {args.plots} plots x {args.beds} beds x {args.maps} maps in {time.perf_counter() - t0:.1f}s")
+        results = {}
+        for name, op in _scenarios(plots, args).items():
+            if args.only and not any(s in name for s in args.only):
+                continue
+            results[name] = await _drive(client, op, args)
+        return results
+
+
+def main(args) -> int:
+    with _server(args) as base_url:
+        results = asyncio.run(_run(base_url, args))
+    print_table(results)
+    errors = {name: r["errors"] for name, r in results.items() if r["errors"]}
+    if errors:
+        print(f"\nrequest errors: {errors}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")},
+                       "results": results}, f, indent=2)
+        print(f"\nbaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = _compare(results, json.load(f)["results"], args.tolerance)
+        if problems:
+            print(f"\nREGRESSION (tolerance {args.tolerance:.0%}):")
+            for p in problems:
+                print(f"  {p}")
+            return 1
+        print(f"\nno regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", choices=["mongomock", "inmemory", "uri"], default="mongomock")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--plots", type=int, default=3)
+    parser.add_argument("--beds", type=int, default=20)
+    parser.add_argument("--maps", type=int, default=3)
+    parser.add_argument("--points", type=int, default=20_000, help="points per synthetic PLY")
+    parser.add_argument("--tif-size", type=int, default=256, help="synthetic TIF width/height in pixels")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--processing-workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="run scenarios whose name contains any of these")
+    parser.add_argument("--baseline", help="compare against this baseline and exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write this run's results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    sys.exit(main(parser.parse_args()))
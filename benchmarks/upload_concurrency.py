@@ -0,0 +1,96 @@
+# benchmarks/upload_concurrency.py
+"""Upload throughput and GET tail latency while large uploads are in flight.
+
+Run against a live server (``uvicorn app.main:app``):
+
+    python -m benchmarks.upload_concurrency --base-url http://127.0.0.1:8000 \
+        --uploads 4 --size-mb 256
+
+Each upload POSTs a synthetic ``.tif`` to ``/plots``; meanwhile a pool of
+readers hammers ``GET /health`` and ``GET /plots``. A blocking upload path
+shows up as a p99 spike on the readers. Created plots are deleted afterwards.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks._common import Timer, print_table, summarize
+
+
+class _RandomBody:
+    # Sync file-like so httpx streams the multipart body instead of buffering it.
+    def __init__(self, size: int):
+        self.remaining = size
+        self.block = os.urandom(1024 * 1024)
+
+    def read(self, n: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        n = len(self.block) if n < 0 else min(n, len(self.block))
+        n = min(n, self.remaining)
+        self.remaining -= n
+        return self.block[:n]
+
+
+async def _upload(client: httpx.AsyncClient, size: int, created: list) -> float:
+    start = time.perf_counter()
+    r = await client.post("/plots", files={"file": ("bench.tif", _RandomBody(size), "image/tiff")})
+    r.raise_for_status()
+    created.append(r.json()["id"])
+    return time.perf_counter() - start
+
+
+async def _reader(client: httpx.AsyncClient, path: str, stop: asyncio.Event, out: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await client.get(path)
+        r.raise_for_status()
+        out.append(time.perf_counter() - start)
+
+
+async def main(args) -> None:
+    size = args.size_mb * 1024 * 1024
+    limits = httpx.Limits(max_connections=args.uploads + args.readers + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600, limits=limits) as client:
+        idle: list = []
+        stop = asyncio.Event()
+        readers = [asyncio.create_task(_reader(client, "/health", stop, idle)) for _ in range(args.readers)]
+        await asyncio.sleep(args.warmup)
+        stop.set()
+        await asyncio.gather(*readers)
+
+        busy_health: list = []
+        busy_plots: list = []
+        created: list = []
+        stop = asyncio.Event()
+        readers = [asyncio.create_task(_reader(client, "/health", stop, busy_health)) for _ in range(args.readers)]
+        readers += [asyncio.create_task(_reader(client, "/plots", stop, busy_plots)) for _ in range(args.readers)]
+        with Timer() as t:
+            durations = await asyncio.gather(*[_upload(client, size, created) for _ in range(args.uploads)])
+        stop.set()
+        await asyncio.gather(*readers)
+
+        for plot_id in created:
+            await client.delete(f"/plots/{plot_id}")
+
+    print_table({
+        "GET /health (idle)": summarize(idle, args.warmup),
+        "GET /health (uploading)": summarize(busy_health, t.elapsed),
+        "GET /plots (uploading)": summarize(busy_plots, t.elapsed),
+    })
+    total_mb = args.uploads * args.size_mb
+    print(f"\nuploads: {args.uploads} x {args.size_mb} MB in {t.elapsed:.2f}s "
+          f"-> {total_mb / t.elapsed:.1f} MB/s aggregate, slowest {max(durations):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+# tests/conftest.py
+# The app runs against an in-process mongomock-motor database and throwaway
+# files/cache directories, so the suite needs neither mongod nor a data dir.
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("FILES_DIR", tempfile.mkdtemp(prefix="florisys-files-"))
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="florisys-cache-"))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db.mongo as mongo
+from benchmarks._server import _patch_mongomock
+
+_patch_mongomock()
+
+
+@pytest.fixture
+def db():
+    """A fresh, empty database per test."""
+    mongo._client = AsyncMongoMockClient()
+    yield mongo.get_db()
+    mongo._client = None
+
+
+@pytest.fixture
+def run(db):
+    """Run a coroutine against the test database from synchronous test code."""
+    return lambda coro: asyncio.run(coro)
+
+
+@pytest.fixture
+def client(db):
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
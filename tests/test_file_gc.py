@@ -0,0 +1,113 @@
+# tests/test_file_gc.py
+import asyncio
+import hashlib
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.services import blobs, file_gc
+from app.services.storage import get_storage
+
+DATA = b"point cloud bytes"
+
+
+class _Upload:
+    def __init__(self, data: bytes):
+        self.file = io.BytesIO(data)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_grace(monkeypatch):
+    monkeypatch.setattr(settings, "gc_grace_s", 0)
+
+
+def _exists(name):
+    return get_storage().exists(name)
+
+
+def test_released_blob_is_collected(run, db):
+    async def scenario():
+        stored = await blobs.store_upload(_Upload(DATA), ".ply", 1 << 20)
+        await blobs.release(stored.filename)
+        return stored, await file_gc.collect()
+    stored, (tombstones, files, freed) = run(scenario())
+    assert (tombstones, files, freed) == (1, 1, len(DATA))
+    assert not _exists(stored.filename)
+    assert run(db.blobs.count_documents({})) == 0
+
+
+def test_upload_racing_the_collector_keeps_its_file(run, db, monkeypatch):
+    # the collector deletes slowly; an identical upload arrives meanwhile
+    delete = file_gc._delete_files
+
+    def slow_delete(names):
+        time.sleep(0.3)
+        return delete(names)
+    monkeypatch.setattr(file_gc, "_delete_files", slow_delete)
+
+    async def scenario():
+        stored = await blobs.store_upload(_Upload(DATA), ".ply", 1 << 20)
+        await blobs.release(stored.filename)
+        collecting = asyncio.create_task(file_gc.collect())
+        await asyncio.sleep(0.1)
+        assert await blobs.find_blob(stored.sha256) is None  # claimed, not offered for reuse
+        again = await blobs.store_upload(_Upload(DATA), ".ply", 1 << 20)
+        assert collecting.done()  # the upload waited for the collector
+        return again, await collecting
+
+    again, (_, files, _) = run(scenario())
+    assert files == 1
+    assert _exists(again.filename)
+    blob = run(db.blobs.find_one({"_id": again.sha256}))
+    assert blob["refs"] == 1 and "collecting" not in blob
+
+
+def test_stale_claim_is_taken_over(run, db):
+    async def scenario():
+        stored = await blobs.store_upload(_Upload(DATA), ".ply", 1 << 20)
+        await blobs.release(stored.filename)
+        # a collector claimed the record and died before deleting anything
+        long_ago = datetime.utcnow() - timedelta(seconds=file_gc.CLAIM_STALE_S + 1)
+        await db.blobs.update_one({"_id": stored.sha256}, {"$set": {"collecting": long_ago}})
+        return await asyncio.wait_for(blobs.store_upload(_Upload(DATA), ".ply", 1 << 20), 2)
+
+    again = run(scenario())
+    assert _exists(again.filename)
+    blob = run(db.blobs.find_one({"_id": again.sha256}))
+    assert blob["refs"] == 1 and "collecting" not in blob
+    # the old tombstone no longer matches a refs-0 record: nothing is deleted
+    assert run(file_gc.collect())[1] == 0
+    assert _exists(again.filename)
+
+
+
+def test_acquire_retries_when_the_racing_record_is_collected(run, db, monkeypatch):
+    sha256 = hashlib.sha256(DATA).hexdigest()
+    take_ref = blobs._take_ref
+    calls = []
+
+    async def racing_take_ref(sha):
+        calls.append(sha)
+        doc = await take_ref(sha)
+        if len(calls) == 1:
+            # an identical upload registers while ours is being written...
+            await db.blobs.insert_one({"_id": sha, "filename": f"{sha}.ply", "bytes": len(DATA), "refs": 1})
+        elif len(calls) == 2:
+            # ...and is released and collected, file and all, before we join it
+            await db.blobs.delete_one({"_id": sha})
+            get_storage().delete(f"{sha}.ply")
+            doc = await take_ref(sha)
+        return doc
+    monkeypatch.setattr(blobs, "_take_ref", racing_take_ref)
+
+    stored = run(blobs.store_upload(_Upload(DATA), ".ply", 1 << 20))
+    assert len(calls) == 3
+    assert _exists(stored.filename)
+    blob = run(db.blobs.find_one({"_id": sha256}))
+    assert blob["refs"] == 1 and blob["filename"] == stored.filename
@@ -0,0 +1,61 @@
+# tests/test_files.py
+import asyncio
+import io
+import os
+
+import pytest
+
+from app.services.storage import get_storage
+
+NAME = "a" * 64 + ".ply"
+DATA = os.urandom(5000)
+
+
+@pytest.fixture
+def stored(db):
+    get_storage().put_stream(io.BytesIO(DATA), NAME)
+    return NAME
+
+
+def _call(app, path: str, extensions: dict, headers=()) -> list:
+    """Drive the ASGI app by hand, so the scope can advertise server extensions."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(k.encode(), v.encode()) for k, v in headers], "client": ("127.0.0.1", 1), "server": ("test", 80),
+        "extensions": extensions,
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = {**message, "data": os.pread(message["file"], message["count"], message["offset"])}
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+def test_zerocopy_send_passes_through_the_middleware_stack(stored):
+    from app.main import app
+
+    messages = _call(app, f"/files/{stored}", {"http.response.zerocopysend": {}},
+                     headers=[("origin", "http://viewer.example"), ("range", "bytes=100-199")])
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    assert start["status"] == 206
+    assert headers["access-control-allow-origin"] == "http://viewer.example"
+    assert headers["cross-origin-resource-policy"] == "cross-origin"
+    sent = [m for m in messages if m["type"] == "http.response.zerocopysend"]
+    assert [m["data"] for m in sent] == [DATA[100:200]]
+
+
+def test_file_headers_without_zerocopy(client, stored):
+    r = client.get(f"/files/{stored}")
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert r.headers["cross-origin-resource-policy"] == "cross-origin"
+    assert r.headers["access-control-allow-origin"]
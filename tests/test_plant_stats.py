@@ -0,0 +1,25 @@
+# tests/test_plant_stats.py
+import logging
+
+from app.services import plant_stats
+
+
+def test_refresh_map_logs_unexpected_errors(run, db, monkeypatch, caplog):
+    run(db.spatial_maps.insert_one({"id": "m1", "plot_id": "p1", "bed_id": "b1", "filename": "m1.ply", "date": "2025-05-01"}))
+    run(db.beds.insert_one({"id": "b1", "plot_id": "p1", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}))
+
+    async def broken(*args):
+        raise MemoryError("pool ran out")
+    monkeypatch.setattr(plant_stats, "_compute", broken)
+
+    with caplog.at_level(logging.ERROR, logger=plant_stats.__name__):
+        run(plant_stats.refresh_map("m1"))  # does not raise
+    assert "Plant stats for spatial map m1 failed" in caplog.text
+
+
+def test_refresh_map_ignores_unreadable_maps(run, db, caplog):
+    run(plant_stats.refresh_map("missing"))
+    run(db.spatial_maps.insert_one({"id": "m2", "plot_id": "p1", "bed_id": "gone", "filename": "m2.ply", "date": "2025-05-01"}))
+    with caplog.at_level(logging.ERROR, logger=plant_stats.__name__):
+        run(plant_stats.refresh_map("m2"))  # 404 from map_stats
+    assert not caplog.records
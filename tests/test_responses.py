@@ -0,0 +1,37 @@
+# tests/test_responses.py
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePosixPath
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from app.utils.responses import BATCH_ITEMS, _dumps
+from benchmarks.list_serialization import _app, _bed
+
+
+class Color(Enum):
+    RED = "red"
+
+
+@pytest.mark.parametrize("kind", ["beds", "maps"])
+@pytest.mark.parametrize("count", [3, BATCH_ITEMS + 7])  # one body, then streamed batches
+def test_array_response_matches_response_model(kind, count):
+    t0 = datetime(2025, 5, 1, 8, 30, 0, 123000)
+    beds = [_bed(i, 2, t0) for i in range(count)]
+    maps = [m for b in beds for m in b["spatialMaps"]][:count]
+    with TestClient(_app(beds, maps)) as client:
+        before, after = client.get(f"/{kind}/before"), client.get(f"/{kind}/after")
+    assert after.headers["content-type"] == "application/json"
+    assert json.loads(after.content) == json.loads(before.content)
+
+
+def test_values_orjson_cannot_encode_go_through_jsonable_encoder():
+    items = [{
+        "price": Decimal("1.5"), "path": PurePosixPath("a/b"), "color": Color.RED,
+        "at": datetime(2025, 5, 1, 8, 30, tzinfo=timezone.utc), "tags": {"x"},
+    }]
+    assert json.loads(_dumps(items)) == jsonable_encoder(items)
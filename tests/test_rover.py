@@ -0,0 +1,143 @@
+# tests/test_rover.py
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.core.config import settings
+from app.services import rover
+
+SQUARE = [[[0, 0], [5e-5, 0], [5e-5, 2e-5], [0, 2e-5], [0, 0]]]
+
+
+@pytest.fixture
+def producer(monkeypatch):
+    fake = rover.FakeRoverProducer(points=2000, scan_s=0.2, passes=2)
+    monkeypatch.setattr(rover, "_producer", fake)
+    return fake
+
+
+@pytest.fixture
+def plot(run, db):
+    plot_id = uuid4().hex
+    run(db.plots.insert_one({"id": plot_id, "name": "p", "filename": f"{plot_id}.tif", "status": "ready"}))
+    return plot_id
+
+
+def _bed(client, plot_id, i=0):
+    coords = [[[x + i * 1e-4, y] for x, y in ring] for ring in SQUARE]
+    r = client.post(f"/plots/{plot_id}/beds", json={"name": f"b{i}", "coordinates": coords})
+    assert r.status_code in (200, 201), r.text
+    return r.json()["id"]
+
+
+def _collect(client, plot_id, bed_id):
+    return client.post(f"/plots/{plot_id}/beds/{bed_id}/collect-rover-data")
+
+
+def _wait(client, plot_id, bed_id, job_id, statuses=("succeeded", "failed"), timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/plots/{plot_id}/beds/{bed_id}/rover-jobs/{job_id}").json()
+        if job["status"] in statuses or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_submit_runs_job_and_attaches_scan(client, plot, producer):
+    bed = _bed(client, plot)
+    r = _collect(client, plot, bed)
+    assert r.status_code == 202
+    job = r.json()
+    assert job["status"] == "queued"
+    assert r.headers["location"] == f"/plots/{plot}/beds/{bed}/rover-jobs/{job['id']}"
+    assert not {"active", "owner", "ownerSeenAt", "heartbeatAt"} & job.keys()
+
+    done = _wait(client, plot, bed, job["id"])
+    assert done["status"] == "succeeded", done
+    assert done["progress"] == 1.0
+    maps = client.get(f"/plots/{plot}/beds/{bed}/spatial-maps").json()
+    assert [m["id"] for m in maps] == [done["spatialMapId"]]
+
+    # the bed is free again once its job finished
+    again = _collect(client, plot, bed)
+    assert again.status_code == 202
+    assert again.json()["id"] != job["id"]
+
+
+def test_repeated_request_returns_active_job(client, plot, producer):
+    bed = _bed(client, plot)
+    first = _collect(client, plot, bed)
+    second = _collect(client, plot, bed)
+    assert second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.headers["location"] == first.headers["location"]
+    assert not {"active", "owner", "ownerSeenAt", "heartbeatAt"} & second.json().keys()
+
+
+def test_unknown_bed_is_404(client, plot, producer):
+    assert _collect(client, plot, "nope").status_code == 404
+
+
+def test_full_queue_is_429(client, plot, producer, monkeypatch, run, db):
+    producer.scan_s = 5.0
+    monkeypatch.setattr(settings, "rover_workers", 1)
+    monkeypatch.setattr(settings, "rover_queue_size", 1)
+    beds = [_bed(client, plot, i) for i in range(3)]
+    # restart the workers with the settings above
+    client.portal.call(rover.stop_workers)
+    client.portal.call(rover.start_workers)
+
+    running = _collect(client, plot, beds[0]).json()
+    assert _wait(client, plot, beds[0], running["id"], ("running",))["status"] == "running"
+    queued = _collect(client, plot, beds[1])
+    assert queued.status_code == 202
+    busy = _collect(client, plot, beds[2])
+    assert busy.status_code == 429
+    assert int(busy.headers["retry-after"]) >= 1
+    assert run(db.rover_jobs.count_documents({"bed_id": beds[2]})) == 0
+
+    # shutdown fails both the running and the queued job, which frees their beds
+    client.portal.call(rover.stop_workers)
+    for bed, job in ((beds[0], running), (beds[1], queued.json())):
+        doc = run(db.rover_jobs.find_one({"id": job["id"]}))
+        assert doc["status"] == "failed"
+        assert "active" not in doc
+    client.portal.call(rover.start_workers)
+    assert _collect(client, plot, beds[1]).status_code == 202
+
+
+def test_startup_fails_jobs_left_by_a_dead_process(db, run, plot, producer):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    run(db.beds.insert_one({"id": "b0", "plot_id": plot, "name": "b0", "coordinates": SQUARE}))
+    run(db.rover_jobs.insert_one({
+        "id": "stale", "plot_id": plot, "bed_id": "b0", "status": "queued", "progress": 0.0,
+        "createdAt": long_ago, "heartbeatAt": long_ago, "active": True,
+        "owner": "gone", "ownerSeenAt": long_ago,
+    }))
+    with TestClient(app) as client:
+        job = _wait(client, plot, "b0", "stale", ("failed",), timeout=2.0)
+        assert job["status"] == "failed"
+        r = _collect(client, plot, "b0")
+        assert r.status_code == 202
+        assert r.json()["id"] != "stale"
+
+
+def test_reaper_fails_hung_jobs_and_keeps_live_ones(db, run, plot, monkeypatch):
+    monkeypatch.setattr(settings, "rover_job_stale_s", 60)
+    now = datetime.utcnow()
+    hour_ago = now - timedelta(hours=1)
+    base = {"plot_id": plot, "progress": 0.0, "createdAt": hour_ago, "active": True, "owner": rover._OWNER}
+    run(db.rover_jobs.insert_many([
+        {**base, "id": "hung", "bed_id": "b0", "status": "running", "heartbeatAt": hour_ago, "ownerSeenAt": now},
+        {**base, "id": "live", "bed_id": "b1", "status": "running", "heartbeatAt": now, "ownerSeenAt": hour_ago},
+        {**base, "id": "waiting", "bed_id": "b2", "status": "queued", "heartbeatAt": hour_ago, "ownerSeenAt": hour_ago},
+    ]))
+    # this process vouches for its own jobs, so only the one without progress fails
+    assert run(rover._reap()) == 1
+    status = {d["id"]: (d["status"], d.get("active")) for d in run(db.rover_jobs.find().to_list(None))}
+    assert status == {"hung": ("failed", None), "live": ("running", True), "waiting": ("queued", True)}
@@ -0,0 +1,54 @@
+# tests/test_scan_diff.py
+import numpy as np
+import pytest
+
+SQUARE = [[[0, 0], [5e-5, 0], [5e-5, 2e-5], [0, 2e-5], [0, 0]]]
+
+
+def _ply(seed: int, n: int = 2000) -> bytes:
+    v = np.zeros(n, [("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+    xyz = np.random.default_rng(seed).random((n, 3)) * [2, 1, 0.5]
+    v["x"], v["y"], v["z"] = xyz.T
+    header = f"ply\nformat binary_little_endian 1.0\nelement vertex {n}\n" \
+             "property float x\nproperty float y\nproperty float z\nend_header\n"
+    return header.encode() + v.tobytes()
+
+
+@pytest.fixture
+def bed(client, run, db):
+    run(db.plots.insert_one({"id": "p1", "name": "p", "filename": "p1.tif", "status": "ready"}))
+    beds = []
+    for name in ("a", "b"):
+        r = client.post("/plots/p1/beds", json={"name": name, "coordinates": SQUARE})
+        assert r.status_code in (200, 201), r.text
+        beds.append(r.json()["id"])
+    maps = []
+    for seed in (1, 2):
+        r = client.post(f"/plots/p1/beds/{beds[0]}/spatial-maps", files={"file": (f"s{seed}.ply", _ply(seed))})
+        assert r.status_code == 200, r.text
+        maps.append(r.json()["id"])
+    return beds, maps
+
+
+def test_cached_diff_still_checks_the_path(client, bed):
+    (own, other_bed), (base, other) = bed
+    r = client.get(f"/plots/p1/beds/{own}/spatial-maps/{base}/diff/{other}")
+    assert r.status_code == 200, r.text
+    assert (r.json()["baseId"], r.json()["otherId"]) == (base, other)
+    again = client.get(f"/plots/p1/beds/{own}/spatial-maps/{base}/diff/{other}")
+    assert again.json() == r.json()
+
+    # the memo holds the pair now, but a wrong bed or plot must not reach it
+    assert client.get(f"/plots/p1/beds/{other_bed}/spatial-maps/{base}/diff/{other}").status_code == 404
+    assert client.get(f"/plots/p2/beds/{own}/spatial-maps/{base}/diff/{other}").status_code == 404
+
+    reverse = client.get(f"/plots/p1/beds/{own}/spatial-maps/{other}/diff/{base}").json()
+    assert (reverse["baseId"], reverse["otherId"]) == (other, base)
+    assert reverse["added"] == r.json()["removed"]
+
+
+def test_deleted_map_is_not_served_from_the_memo(client, bed):
+    (own, _), (base, other) = bed
+    assert client.get(f"/plots/p1/beds/{own}/spatial-maps/{base}/diff/{other}").status_code == 200
+    assert client.delete(f"/plots/p1/beds/{own}/spatial-maps/{other}").status_code == 204
+    assert client.get(f"/plots/p1/beds/{own}/spatial-maps/{base}/diff/{other}").status_code == 404
@@ -0,0 +1,104 @@
+# tests/test_storage_s3.py
+import base64
+import hashlib
+import io
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from app.core.config import settings
+from app.services.storage import S3Storage
+
+BUCKET = "florisys-test"
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    for var, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                       ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(var, value)
+    monkeypatch.setattr(settings, "s3_bucket", BUCKET)
+    monkeypatch.setattr(settings, "s3_prefix", "files/")
+    monkeypatch.setattr(settings, "s3_endpoint_url", None)
+    monkeypatch.setattr(settings, "s3_region", "us-east-1")
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+    with moto.mock_aws():
+        storage = S3Storage()
+        storage.client.create_bucket(Bucket=BUCKET)
+        yield storage
+
+
+def _keys(storage):
+    return sorted(o["Key"] for o in storage.client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+def test_put_stream_and_exists(s3):
+    assert not s3.exists("abc.tif")
+    assert s3.head("abc.tif") is None
+    s3.put_stream(io.BytesIO(b"tiff bytes"), "abc.tif")
+    assert s3.exists("abc.tif")
+    assert s3.head("abc.tif")["bytes"] == 10
+    assert _keys(s3) == ["files/abc.tif"]
+
+
+def test_put_file_uploads_and_removes_the_source(s3, tmp_path):
+    src = tmp_path / "upload.part"
+    src.write_bytes(b"x" * 100)
+    s3.put_file(src, "def.ply")
+    assert not src.exists()
+    assert s3.head("def.ply")["bytes"] == 100
+
+
+def test_encoded_variant_keeps_its_content_encoding(s3):
+    s3.put_stream(io.BytesIO(b"compressed"), "abc.ply.br")
+    head = s3.client.head_object(Bucket=BUCKET, Key="files/abc.ply.br")
+    assert head["ContentEncoding"] == "br"
+
+
+def test_local_path_downloads_once_into_the_cache(s3):
+    s3.put_stream(io.BytesIO(b"point cloud"), "abc.ply")
+    path = s3.local_path("abc.ply")
+    assert path.read_bytes() == b"point cloud"
+    s3.client.delete_object(Bucket=BUCKET, Key="files/abc.ply")
+    assert s3.local_path("abc.ply") == path  # served from the cache
+
+
+def test_presigned_download_url(s3):
+    s3.put_stream(io.BytesIO(b"data"), "abc.tif")
+    url = urlsplit(s3.download_url("abc.tif"))
+    assert url.path.endswith(f"/{BUCKET}/files/abc.tif") or url.netloc.startswith(BUCKET)
+    query = parse_qs(url.query)
+    assert query["X-Amz-Expires"] == [str(settings.s3_url_ttl_s)]
+    assert "X-Amz-Signature" in query
+
+
+def test_presigned_upload_signs_the_checksum(s3):
+    digest = base64.b64encode(hashlib.sha256(b"data").digest()).decode()
+    target = s3.upload_target("abc.tif", digest, "image/tiff")
+    assert target["headers"] == {"x-amz-checksum-sha256": digest, "Content-Type": "image/tiff"}
+    query = parse_qs(urlsplit(target["url"]).query)
+    assert "x-amz-checksum-sha256" in query["X-Amz-SignedHeaders"][0].split(";")
+
+
+def test_delete_removes_siblings_and_reports_bytes(s3):
+    s3.put_stream(io.BytesIO(b"a" * 10), "abc.ply")
+    s3.put_stream(io.BytesIO(b"b" * 4), "abc.ply.br")
+    s3.put_stream(io.BytesIO(b"c" * 7), "abcd.ply")
+    s3.local_path("abc.ply")
+    assert s3.delete("abc.ply") == 14
+    assert _keys(s3) == ["files/abcd.ply"]
+    assert not s3._cache_path("abc.ply").exists()
+    assert s3.delete("abc.ply") == 0
+
+
+def test_listing_and_remove(s3):
+    s3.put_stream(io.BytesIO(b"a" * 3), "one.tif")
+    s3.put_stream(io.BytesIO(b"b" * 5), "two.ply")
+    s3.client.put_object(Bucket=BUCKET, Key="elsewhere/three.tif", Body=b"c")
+    assert sorted((key, size) for key, size, _ in s3.listing()) == [("one.tif", 3), ("two.ply", 5)]
+    s3.remove(["one.tif"])
+    assert [key for key, _, _ in s3.listing()] == ["two.ply"]
+    assert "elsewhere/three.tif" in _keys(s3)
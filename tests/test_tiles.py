@@ -0,0 +1,68 @@
+# tests/test_tiles.py
+import io
+import math
+import shutil
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_bounds
+
+from app.services import tiles
+from app.utils.files import derived_dir
+from app.utils.lru import LRUCache
+
+WEST, SOUTH, EAST, NORTH = 5.0, 52.0, 5.002, 52.002
+
+
+def _geotiff() -> bytes:
+    buf = io.BytesIO()
+    data = np.random.default_rng(0).integers(0, 255, (3, 64, 64), dtype=np.uint8)
+    with rasterio.open(buf, "w", driver="GTiff", width=64, height=64, count=3, dtype="uint8",
+                       crs="EPSG:4326", transform=from_bounds(WEST, SOUTH, EAST, NORTH, 64, 64)) as ds:
+        ds.write(data)
+    return buf.getvalue()
+
+
+def _tile_at(lon: float, lat: float, z: int) -> tuple[int, int]:
+    n = 1 << z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+@pytest.fixture
+def plot(client, run, db, monkeypatch):
+    r = client.post("/plots", files={"file": ("field.tif", _geotiff(), "image/tiff")})
+    assert r.status_code in (200, 201), r.text
+    plot_id = r.json()["id"]
+    # nothing rendered yet: neither in memory nor on disk
+    filename = run(db.plots.find_one({"id": plot_id}))["filename"]
+    shutil.rmtree(derived_dir("tiles", filename), ignore_errors=True)
+    monkeypatch.setattr(tiles, "_tiles", LRUCache(16))
+    return plot_id, filename
+
+
+def test_uncached_tile_is_rendered_and_stored(client, plot):
+    plot_id, filename = plot
+    z = 16
+    x, y = _tile_at((WEST + EAST) / 2, (SOUTH + NORTH) / 2, z)
+    r = client.get(f"/plots/{plot_id}/tiles/{z}/{x}/{y}.png")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.content.startswith(b"\x89PNG")
+    assert (derived_dir("tiles", filename) / str(z) / str(x) / f"{y}.png").read_bytes() == r.content
+
+
+def test_tile_outside_the_plot_is_empty(client, plot):
+    plot_id, _ = plot
+    assert client.get(f"/plots/{plot_id}/tiles/1/0/0.png").status_code == 204
+
+
+@pytest.mark.parametrize("fmt, magic", [("png", b"\x89PNG"), ("webp", b"RIFF")])
+def test_uncached_thumbnail_is_rendered_and_stored(client, plot, fmt, magic):
+    plot_id, filename = plot
+    r = client.get(f"/plots/{plot_id}/thumbnail.{fmt}")
+    assert r.status_code == 200
+    assert r.content.startswith(magic)
+    assert (derived_dir("tiles", filename) / f"thumbnail.{fmt}").read_bytes() == r.content
@@ -0,0 +1,73 @@
+# tests/test_uploads.py
+import os
+import threading
+import time
+
+from app.services import uploads
+from app.services.storage import local_path
+
+CHUNK = uploads.MIN_CHUNK
+DATA = os.urandom(2 * CHUNK)
+
+
+def _session(client):
+    r = client.post("/uploads", json={"kind": "plot", "fileName": "field.tif", "size": len(DATA), "chunkSize": CHUNK})
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _chunk(client, upload_id, index):
+    return client.patch(f"/uploads/{upload_id}/chunks/{index}", content=DATA[index * CHUNK:(index + 1) * CHUNK])
+
+
+def test_finalize_waits_for_chunk_writes_in_flight(client, monkeypatch, run, db):
+    upload_id = _session(client)
+    for i in range(2):
+        assert _chunk(client, upload_id, i).status_code == 200
+
+    events = []
+    pwrite, adopt_file = uploads._pwrite, uploads.adopt_file
+
+    def slow_pwrite(*args):
+        time.sleep(0.4)
+        pwrite(*args)
+        events.append("chunk written")
+
+    async def recording_adopt_file(*args):
+        events.append("finalize hashing")
+        return await adopt_file(*args)
+
+    monkeypatch.setattr(uploads, "_pwrite", slow_pwrite)
+    monkeypatch.setattr(uploads, "adopt_file", recording_adopt_file)
+
+    # a client retries chunk 0 (e.g. after a timeout) and finalizes meanwhile
+    retried = {}
+    retry = threading.Thread(target=lambda: retried.setdefault("r", _chunk(client, upload_id, 0)))
+    retry.start()
+    time.sleep(0.15)
+    done = client.post(f"/uploads/{upload_id}/finalize")
+    retry.join()
+
+    assert retried["r"].status_code == 200
+    assert done.status_code == 201, done.text
+    assert events == ["chunk written", "finalize hashing"]
+    plot = run(db.plots.find_one({"id": done.json()["plot"]["id"]}))
+    assert local_path(plot["filename"]).read_bytes() == DATA
+
+
+def test_chunks_after_finalize_started_are_refused(client, run, db):
+    upload_id = _session(client)
+    assert _chunk(client, upload_id, 0).status_code == 200
+    run(db.upload_sessions.update_one({"id": upload_id}, {"$set": {"status": "finalizing"}}))
+    assert _chunk(client, upload_id, 1).status_code == 409
+    assert run(db.upload_sessions.find_one({"id": upload_id}))["writers"] == []
+
+
+def test_incomplete_upload_is_reopened(client):
+    upload_id = _session(client)
+    assert _chunk(client, upload_id, 1).status_code == 200
+    r = client.post(f"/uploads/{upload_id}/finalize")
+    assert r.status_code == 409
+    assert r.json()["detail"]["missing"] == [0]
+    assert _chunk(client, upload_id, 0).status_code == 200
+    assert client.post(f"/uploads/{upload_id}/finalize").status_code == 201